@@ -83,3 +83,63 @@ create table usos_agente_ia(
     created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
     INDEX idx_usos_agente_user_created_at (id_user, created_at)
 );
+
+-- Cache persistente de análisis de imágenes de referencia
+CREATE TABLE cache_analisis_imagenes (
+    clave CHAR(64) PRIMARY KEY,
+    image_url TEXT NULL,
+    analisis TEXT NOT NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    expira_en DATETIME NOT NULL,
+    INDEX idx_cache_analisis_expira_en (expira_en)
+);
+
+-- Resumen incremental del diseño por sesión (reemplaza al historial completo en el prompt)
+ALTER TABLE sesiones_ia
+  ADD COLUMN resumen_diseno JSON NULL,
+  ADD COLUMN resumen_actualizado_en DATETIME NULL;
+
+-- Trabajos de generación asíncronos (202 Accepted + GET /jobs/{id} o SSE)
+CREATE TABLE trabajos_generacion (
+    id CHAR(36) PRIMARY KEY,
+    tipo ENUM("diseno", "chat", "tryon") NOT NULL,
+    estado ENUM("pendiente", "en_proceso", "completado", "fallido") NOT NULL DEFAULT "pendiente",
+    id_user INT NULL,
+    parametros JSON NOT NULL,
+    resultado JSON NULL,
+    error TEXT NULL,
+    codigo_error INT NULL,
+    intentos INT NOT NULL DEFAULT 0,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    started_at DATETIME NULL,
+    finished_at DATETIME NULL,
+    INDEX idx_trabajos_estado (estado),
+    INDEX idx_trabajos_user (id_user)
+);
+
+-- Cache de generaciones de diseño: entradas idénticas reutilizan la imagen ya estabilizada
+CREATE TABLE cache_generaciones_diseno (
+    clave CHAR(64) PRIMARY KEY,
+    image_url TEXT NOT NULL,
+    modelo VARCHAR(100) NOT NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    expira_en DATETIME NOT NULL,
+    INDEX idx_cache_generaciones_expira_en (expira_en)
+);
+
+-- Derivadas WebP (miniatura y tamaño medio) junto a la imagen original
+ALTER TABLE imagenes_ia
+  ADD COLUMN thumbnail_url VARCHAR(512) NULL,
+  ADD COLUMN medium_url VARCHAR(512) NULL;
+
+-- Subidas de fotos y referencias por hash de contenido: la misma imagen no se vuelve a subir
+CREATE TABLE subidas_usuario (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    id_user INT NOT NULL,
+    content_hash CHAR(64) NOT NULL,
+    image_url VARCHAR(512) NOT NULL,
+    public_id VARCHAR(255) NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_subidas_usuario_hash (id_user, content_hash),
+    INDEX idx_subidas_usuario_url (image_url)
+);
@@ -4,6 +4,9 @@ from .fashion_agent import fashion_agent, generate_design_prompt, analyze_user_i
 # Importar el orquestador de Mirascope 2.2.2
 from .orchestrator import orchestrator, FashionOrchestrator, AgentResponse
 
+# Proveedores de LLM del orquestador
+from .providers import LLMProvider, LLMResult, LocalProvider, MirascopeProvider, build_provider
+
 # Importar prompts (mantenidos para referencia)
 from .prompts import (
     FASHION_AGENT_SYSTEM_PROMPT,
@@ -21,6 +24,12 @@ __all__ = [
     "orchestrator",
     "FashionOrchestrator",
     "AgentResponse",
+    # Proveedores de LLM
+    "LLMProvider",
+    "LLMResult",
+    "LocalProvider",
+    "MirascopeProvider",
+    "build_provider",
     # Prompts
     "FASHION_AGENT_SYSTEM_PROMPT",
     "DESIGN_GENERATION_PROMPT",
@@ -0,0 +1,129 @@
+"""
+Cache de análisis de imágenes de referencia
+
+Los usuarios suelen mantener las mismas referencias adjuntas durante toda la sesión.
+Este cache evita repetir la llamada a Gemini para una imagen ya analizada:
+
+1. Tier en memoria (LRU con TTL) dentro del proceso
+2. Tier persistente opcional en MySQL (tabla cache_analisis_imagenes)
+"""
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from app.config.database import SessionLocal
+from app.config.settings import settings
+from app.models import AnalisisImagenCache
+from app.utils.cache import TTLCache
+from app.utils.content_hashes import resolve_content_hash
+from app.utils.urls import normalize_image_url
+
+logger = logging.getLogger(__name__)
+
+
+class ImageAnalysisCache:
+    """Cache de dos niveles para el texto de análisis de imágenes."""
+
+    def __init__(
+        self,
+        max_entries: int = settings.IMAGE_ANALYSIS_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = settings.IMAGE_ANALYSIS_CACHE_TTL_SECONDS,
+        persistent: bool = settings.IMAGE_ANALYSIS_CACHE_PERSISTENT,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.persistent = persistent
+        self._memory: TTLCache[str, str] = TTLCache(max_entries, ttl_seconds)
+        self.persistent_hits = 0
+        self.persistent_misses = 0
+
+    @staticmethod
+    def key_for(image_url: str, content_hash: Optional[str] = None) -> str:
+        """
+        Clave del cache: el hash de contenido si se conoce, si no el SHA-256 de la URL normalizada.
+        """
+        if content_hash:
+            return content_hash.strip().lower()
+        return hashlib.sha256(normalize_image_url(image_url).encode("utf-8")).hexdigest()
+
+    def _load_persistent(self, key: str) -> Optional[str]:
+        db = SessionLocal()
+        try:
+            row = (
+                db.query(AnalisisImagenCache)
+                .filter(
+                    AnalisisImagenCache.clave == key,
+                    AnalisisImagenCache.expira_en > datetime.utcnow(),
+                )
+                .first()
+            )
+            return row.analisis if row else None
+        finally:
+            db.close()
+
+    def _store_persistent(self, key: str, image_url: str, analysis: str) -> None:
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            db.merge(
+                AnalisisImagenCache(
+                    clave=key,
+                    image_url=image_url,
+                    analisis=analysis,
+                    created_at=now,
+                    expira_en=now + timedelta(seconds=self.ttl_seconds),
+                )
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    async def get(self, image_url: str, content_hash: Optional[str] = None) -> Optional[str]:
+        """Busca un análisis en memoria y, si está habilitado, en MySQL."""
+        key = self.key_for(image_url, content_hash or await resolve_content_hash(image_url))
+        analysis = self._memory.get(key)
+        if analysis is not None or not self.persistent:
+            return analysis
+
+        try:
+            analysis = await asyncio.to_thread(self._load_persistent, key)
+        except Exception as exc:
+            logger.warning("No se pudo leer el cache persistente de analisis: %s", exc)
+            return None
+
+        if analysis is None:
+            self.persistent_misses += 1
+            return None
+
+        self.persistent_hits += 1
+        self._memory.set(key, analysis)
+        return analysis
+
+    async def set(self, image_url: str, analysis: str, content_hash: Optional[str] = None) -> None:
+        """Guarda un análisis en memoria y, si está habilitado, en MySQL."""
+        key = self.key_for(image_url, content_hash or await resolve_content_hash(image_url))
+        self._memory.set(key, analysis)
+        if not self.persistent:
+            return
+
+        try:
+            await asyncio.to_thread(self._store_persistent, key, image_url, analysis)
+        except Exception as exc:
+            logger.warning("No se pudo escribir el cache persistente de analisis: %s", exc)
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores de aciertos y fallos de ambos niveles."""
+        memory_stats = self._memory.stats()
+        return {
+            "memory_hits": memory_stats["hits"],
+            "memory_misses": memory_stats["misses"],
+            "memory_evictions": memory_stats["evictions"],
+            "memory_size": memory_stats["size"],
+            "persistent_hits": self.persistent_hits,
+            "persistent_misses": self.persistent_misses,
+        }
+
+
+# Instancia global del cache de análisis
+image_analysis_cache = ImageAnalysisCache()
@@ -0,0 +1,102 @@
+"""
+Llamadas con cobertura (hedging) para los modelos de lenguaje
+
+Si la llamada principal tarda más que el percentil configurado de su latencia
+histórica, se lanza la misma petición contra un modelo de respaldo y gana la
+primera respuesta exitosa. Ambas llamadas comparten el mismo plazo total.
+"""
+import asyncio
+import math
+import threading
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """Ventana móvil de latencias observadas por tipo de llamada."""
+
+    def __init__(self, window_size: int = 200):
+        self.window_size = window_size
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, call_type: str, seconds: float) -> None:
+        with self._lock:
+            samples = self._samples.setdefault(call_type, deque(maxlen=self.window_size))
+            samples.append(seconds)
+
+    def percentile(self, call_type: str, quantile: float, min_samples: int = 1) -> Optional[float]:
+        """Percentil (0-1) de la ventana, o None si aún no hay suficientes muestras."""
+        with self._lock:
+            samples = sorted(self._samples.get(call_type, ()))
+        if len(samples) < max(1, min_samples):
+            return None
+        index = min(len(samples) - 1, max(0, math.ceil(quantile * len(samples)) - 1))
+        return samples[index]
+
+
+async def _cancel_all(tasks) -> None:
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def run_hedged(
+    primary: Callable[[], Awaitable[T]],
+    fallback: Optional[Callable[[], Awaitable[T]]],
+    hedge_delay: Optional[float],
+    timeout: float,
+) -> T:
+    """
+    Ejecuta `primary` y, si tarda más que `hedge_delay` o falla, también `fallback`
+
+    Args:
+        primary: Fábrica de la llamada principal
+        fallback: Fábrica de la llamada de respaldo (None desactiva el hedging)
+        hedge_delay: Segundos a esperar antes de lanzar el respaldo
+        timeout: Plazo total para obtener una respuesta
+
+    Returns:
+        La primera respuesta exitosa
+
+    Raises:
+        TimeoutError: Si ninguna llamada respondió dentro del plazo
+        Exception: El último error si todas las llamadas fallaron
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    pending = {asyncio.ensure_future(primary())}
+    fallback_started = fallback is None
+    last_error: Optional[BaseException] = None
+
+    try:
+        while pending:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+
+            wait_for = remaining
+            if not fallback_started and hedge_delay is not None:
+                wait_for = min(remaining, max(0.0, hedge_delay))
+
+            done, pending = await asyncio.wait(
+                pending, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED
+            )
+
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                last_error = task.exception()
+
+            # Lanzar el respaldo si la principal falló o superó el umbral de hedging
+            if not fallback_started and (done or hedge_delay is not None):
+                pending.add(asyncio.ensure_future(fallback()))
+                fallback_started = True
+    finally:
+        await _cancel_all(pending)
+
+    if last_error is not None and not pending:
+        raise last_error
+    raise TimeoutError(f"La llamada al modelo supero el plazo de {timeout:.1f}s")
@@ -0,0 +1,116 @@
+"""
+Instrumentación de las llamadas al LLM
+
+Cada llamada del orquestador deja un LLMCallRecord que:
+
+1. Alimenta los contadores e histogramas expuestos en GET /metrics
+2. Se acumula en el turno actual (si hay un collect_llm_calls activo) para
+   adjuntarse a AgentResponse.metadata
+"""
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.utils.metrics import metrics
+
+LLM_CALLS = metrics.counter(
+    "agent_llm_calls_total",
+    "Llamadas al LLM por tipo, modelo y resultado",
+    ("call_type", "model", "outcome"),
+)
+LLM_CALL_DURATION = metrics.histogram(
+    "agent_llm_call_duration_seconds",
+    "Tiempo total de cada llamada al LLM (incluye hedging)",
+    ("call_type", "model", "outcome"),
+)
+LLM_TIME_TO_FIRST_TOKEN = metrics.histogram(
+    "agent_llm_time_to_first_token_seconds",
+    "Tiempo hasta el primer texto recibido del LLM (solo llamadas con streaming)",
+    ("call_type", "model"),
+)
+LLM_TOKENS = metrics.counter(
+    "agent_llm_tokens_total",
+    "Tokens consumidos por tipo de llamada, modelo y dirección (input/output/cached_input)",
+    ("call_type", "model", "direction"),
+)
+
+_turn_calls: ContextVar[Optional[List["LLMCallRecord"]]] = ContextVar("llm_turn_calls", default=None)
+
+
+@dataclass
+class LLMCallRecord:
+    """Medición de una llamada al LLM"""
+    call_type: str
+    model: str
+    outcome: str  # ok | timeout | error | cancelled
+    wall_seconds: float
+    # Solo en llamadas con streaming: sin streaming no hay un primer token medible
+    ttft_seconds: Optional[float] = None
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    # Parte de input_tokens servida desde un prefijo cacheado en el proveedor
+    cached_input_tokens: Optional[int] = None
+    streamed: bool = False
+
+
+def outcome_for(exc: BaseException) -> str:
+    """Clasifica la excepción de una llamada fallida."""
+    if isinstance(exc, asyncio.CancelledError):
+        return "cancelled"
+    if isinstance(exc, (TimeoutError, asyncio.TimeoutError)):
+        return "timeout"
+    return "error"
+
+
+def record_llm_call(record: LLMCallRecord) -> None:
+    """Registra la llamada en las métricas del proceso y en el turno actual."""
+    LLM_CALLS.inc(call_type=record.call_type, model=record.model, outcome=record.outcome)
+    LLM_CALL_DURATION.observe(
+        record.wall_seconds, call_type=record.call_type, model=record.model, outcome=record.outcome
+    )
+    if record.ttft_seconds is not None:
+        LLM_TIME_TO_FIRST_TOKEN.observe(record.ttft_seconds, call_type=record.call_type, model=record.model)
+    if record.input_tokens:
+        LLM_TOKENS.inc(record.input_tokens, call_type=record.call_type, model=record.model, direction="input")
+    if record.output_tokens:
+        LLM_TOKENS.inc(record.output_tokens, call_type=record.call_type, model=record.model, direction="output")
+    if record.cached_input_tokens:
+        LLM_TOKENS.inc(
+            record.cached_input_tokens, call_type=record.call_type, model=record.model, direction="cached_input"
+        )
+
+    turn_calls = _turn_calls.get()
+    if turn_calls is not None:
+        turn_calls.append(record)
+
+
+@contextmanager
+def collect_llm_calls() -> Iterator[List[LLMCallRecord]]:
+    """
+    Acumula las llamadas al LLM hechas dentro del bloque
+
+    Las tareas creadas dentro del bloque (p. ej. análisis de imágenes en paralelo)
+    comparten la misma lista.
+    """
+    calls: List[LLMCallRecord] = []
+    token = _turn_calls.set(calls)
+    try:
+        yield calls
+    finally:
+        _turn_calls.reset(token)
+
+
+def summarize_llm_calls(calls: List[LLMCallRecord]) -> Dict[str, Any]:
+    """Resumen de las llamadas de un turno para AgentResponse.metadata."""
+    return {
+        "calls": [
+            {key: (round(value, 4) if isinstance(value, float) else value) for key, value in asdict(call).items()}
+            for call in calls
+        ],
+        "total_call_seconds": round(sum(call.wall_seconds for call in calls), 4),
+        "input_tokens": sum(call.input_tokens or 0 for call in calls),
+        "output_tokens": sum(call.output_tokens or 0 for call in calls),
+        "cached_input_tokens": sum(call.cached_input_tokens or 0 for call in calls),
+    }
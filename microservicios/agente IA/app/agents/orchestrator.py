@@ -1,113 +1,206 @@
 """
 Orquestador principal del agente de IA usando Mirascope 2.2.2
 """
-import os
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import time
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
 from mirascope import llm
 
+from app.agents.analysis_cache import image_analysis_cache
+from app.agents.hedging import LatencyTracker, run_hedged
+from app.agents.instrumentation import (
+    LLMCallRecord,
+    collect_llm_calls,
+    outcome_for,
+    record_llm_call,
+    summarize_llm_calls,
+)
+from app.agents.prompt_cache import StaticPrefix
+from app.agents.providers import LLMProvider, LLMResult, build_provider
 from app.config.settings import settings
+from app.utils.cache import TTLCache
+from app.utils.deadline import call_timeout
 
 # Mirascope 2.2.2 usa IDs de modelo con proveedor: "google/<modelo>"
-MODEL = "google/gemini-2.5-flash"
-os.environ.setdefault("GOOGLE_API_KEY", settings.GEMINI_API_KEY)
+# Es solo el modelo por defecto de los prompts; quien ejecuta la llamada es el proveedor
+MODEL = settings.LLM_MODEL
+EMPTY_RESPONSE_TEXT = "No se pudo generar una respuesta en este momento."
+DESIGN_SUMMARY_KEYS = ("color", "logo", "ubicacion", "patron", "notas")
+NUMBERED_LINE_PATTERN = re.compile(r"^\s*(?:\d+\s*[.):-]|[-*])\s*")
+
+logger = logging.getLogger(__name__)
+
+
+# Prompts de sistema estáticos: idénticos en cada turno, se registran en el cache de prefijos
+FASHION_AGENT_SYSTEM = """
+Eres un asistente de IA experto en personalizacion guiada de prendas para CraftYourStyle.
+
+Tu alcance esta estrictamente limitado a una prenda del catalogo ya seleccionada.
+
+Solo puedes:
+1. Ayudar a cambiar el color base de la prenda actual
+2. Ayudar a definir un logo o escudo
+3. Sugerir donde ubicar el logo en la prenda actual
+4. Proponer patrones simples sobre la misma prenda como lineas, rayas, circulos, cuadrados, bloques, franjas o patrones florales sencillos como rosas y hojas
+5. Pedir aclaraciones breves sobre color, tamano, patron o posicion
+
+No puedes:
+1. Generar prendas nuevas
+2. Inventar otra prenda distinta
+3. Crear outfits completos
+4. Guiar try-on en este flujo
+5. Salirte de la prenda seleccionada
+
+Si el usuario pide algo fuera de ese alcance, responde con una negativa amable y redirige la conversacion
+a cambios sobre la prenda actual.
+Si ya hay suficientes detalles y el usuario pide generar o visualizar el resultado, responde con una
+confirmacion breve centrada en la personalizacion final.
+No afirmes que la imagen ya fue aplicada o generada a menos que el sistema haya ejecutado realmente esa accion.
+Si aun falta generar, limita tu respuesta a resumir el diseno o pedir confirmacion.
+Responde en espanol, con mensajes cortos, claros y enfocados en ejecutar sobre la prenda actual.
+El mensaje del usuario incluye primero su contexto (historial, producto, imagenes) y luego lo que pide.
+""".strip()
+
+DESIGN_PROMPT_SYSTEM = """
+Eres un experto en escribir prompts en ingles para editar fotografias de productos de moda usando una imagen base.
+Respeta estrictamente lo pedido por el usuario y NO inventes elementos.
+Debes conservar la misma prenda base, la misma silueta, el mismo tipo de foto catalogo y el mismo encuadre.
+Solo puedes modificar la superficie de la prenda con cambios como color, logos, escudos, texto corto y
+patrones geometricos o florales simples como stripes, lines, circles, squares, blocks, bands, roses, flowers or leaves.
+Si el usuario pide "liso" o "sin estampado", incluye explicitamente "solid color, no pattern, no stripes, no print".
+Si falta un detalle, no lo inventes; usa descripciones neutrales.
+Devuelve solo el prompt final en ingles, sin explicaciones ni texto extra.
+""".strip()
+
+
+DESIGN_VARIANTS_SYSTEM = DESIGN_PROMPT_SYSTEM.replace(
+    "Devuelve solo el prompt final en ingles, sin explicaciones ni texto extra.",
+    "Escribe la cantidad de prompts pedida: variantes distintas de la misma personalizacion "
+    "(por ejemplo otro tono del color pedido, otra escala o posicion del logo, otra densidad del patron), "
+    "todas fieles a lo que pidio el usuario.\n"
+    "Devuelve solo los prompts finales en ingles, uno por linea y numerados (\"1. ...\"), "
+    "sin explicaciones ni texto extra.",
+)
+
+
+ANALYZE_IMAGE_SYSTEM = """
+Analiza la siguiente imagen y describe que ves.
+Enfocate en elementos para personalizar prendas:
+- Logos
+- Patrones
+- Colores dominantes
+- Estilo visual
+- Elementos principales
+- Sugerencias de uso en una prenda
+""".strip()
+
+TRYON_GUIDANCE_SYSTEM = """
+Eres un experto en virtual try-on (probarse ropa virtualmente).
+
+Guia al usuario para:
+1. Subir una foto clara
+2. Confirmar prenda u outfit
+3. Explicar que se generara una visualizacion realista
+""".strip()
+
+SESSION_SUMMARY_SYSTEM = """
+Mantienes el estado de un diseno de prenda que se personaliza por chat.
+Recibes el estado anterior en JSON y el ultimo intercambio entre usuario y asistente.
+Devuelve el estado actualizado como un unico objeto JSON con exactamente estas claves:
+"color" (color base de la prenda), "logo" (logo, escudo o texto),
+"ubicacion" (donde va el logo), "patron" (patron o estampado), "notas" (otras decisiones breves).
+Conserva los valores anteriores que el usuario no cambio. Usa null si algo no se ha definido.
+No inventes decisiones que el usuario no haya tomado. Responde solo con el JSON.
+""".strip()
+
+
+def _fashion_agent_user(user_message: str, context: str = "No hay contexto previo") -> str:
+    return f"Contexto del usuario:\n{context}\n\nMensaje del usuario:\n{user_message}"
+
+
+def _design_prompt_user(user_request: str, garment_type: str = "camiseta") -> str:
+    return f"El usuario quiere: {user_request}\nTipo de prenda: {garment_type}"
+
+
+def _design_variants_user(user_request: str, garment_type: str = "camiseta", variants: int = 2) -> str:
+    return f"{_design_prompt_user(user_request, garment_type)}\nCantidad de prompts: {variants}"
+
+
+def _analyze_image_user(image_url: str) -> str:
+    return f"URL de la imagen: {image_url}"
+
+
+def _tryon_guidance_user(user_message: str, context: str = "Primera consulta de try-on") -> str:
+    return f"{user_message}\n\nContexto:\n{context}"
+
+
+def _session_summary_user(previous_summary: str, user_message: str, assistant_message: str) -> str:
+    return f"Estado anterior: {previous_summary}\nUsuario: {user_message}\nAsistente: {assistant_message}"
+
+
+STATIC_PREFIXES = {
+    "fashion_agent": StaticPrefix("fashion_agent", FASHION_AGENT_SYSTEM, _fashion_agent_user),
+    "design_prompt": StaticPrefix("design_prompt", DESIGN_PROMPT_SYSTEM, _design_prompt_user),
+    "design_prompt_variants": StaticPrefix(
+        "design_prompt_variants", DESIGN_VARIANTS_SYSTEM, _design_variants_user
+    ),
+}
 
 
 @llm.call(MODEL, temperature=0.7)
 async def _fashion_agent_call(user_message: str, context: str = "No hay contexto previo"):
-    return f"""
-    SYSTEM:
-    Eres un asistente de IA experto en personalizacion guiada de prendas para CraftYourStyle.
-
-    Tu alcance esta estrictamente limitado a una prenda del catalogo ya seleccionada.
-
-    Solo puedes:
-    1. Ayudar a cambiar el color base de la prenda actual
-    2. Ayudar a definir un logo o escudo
-    3. Sugerir donde ubicar el logo en la prenda actual
-    4. Proponer patrones simples sobre la misma prenda como lineas, rayas, circulos, cuadrados, bloques, franjas o patrones florales sencillos como rosas y hojas
-    5. Pedir aclaraciones breves sobre color, tamano, patron o posicion
-
-    No puedes:
-    1. Generar prendas nuevas
-    2. Inventar otra prenda distinta
-    3. Crear outfits completos
-    4. Guiar try-on en este flujo
-    5. Salirte de la prenda seleccionada
-
-    Si el usuario pide algo fuera de ese alcance, responde con una negativa amable y redirige la conversacion
-    a cambios sobre la prenda actual.
-    Si ya hay suficientes detalles y el usuario pide generar o visualizar el resultado, responde con una
-    confirmacion breve centrada en la personalizacion final.
-    No afirmes que la imagen ya fue aplicada o generada a menos que el sistema haya ejecutado realmente esa accion.
-    Si aun falta generar, limita tu respuesta a resumir el diseno o pedir confirmacion.
-    Responde en espanol, con mensajes cortos, claros y enfocados en ejecutar sobre la prenda actual.
-
-    Contexto del usuario:
-    {context}
-
-    USER:
-    {user_message}
-    """
+    return [
+        llm.messages.system(FASHION_AGENT_SYSTEM),
+        llm.messages.user(_fashion_agent_user(user_message, context)),
+    ]
 
 
 @llm.call(MODEL, temperature=0.5)
 async def _design_prompt_call(user_request: str, garment_type: str = "camiseta"):
-    return f"""
-    SYSTEM:
-    Eres un experto en escribir prompts en ingles para editar fotografias de productos de moda usando una imagen base.
-    Respeta estrictamente lo pedido por el usuario y NO inventes elementos.
-    Debes conservar la misma prenda base, la misma silueta, el mismo tipo de foto catalogo y el mismo encuadre.
-    Solo puedes modificar la superficie de la prenda con cambios como color, logos, escudos, texto corto y
-    patrones geometricos o florales simples como stripes, lines, circles, squares, blocks, bands, roses, flowers or leaves.
-    Si el usuario pide "liso" o "sin estampado", incluye explicitamente "solid color, no pattern, no stripes, no print".
-    Si falta un detalle, no lo inventes; usa descripciones neutrales.
-    Devuelve solo el prompt final en ingles, sin explicaciones ni texto extra.
-
-    USER:
-    El usuario quiere: {user_request}
-    Tipo de prenda: {garment_type}
-    """
+    return [
+        llm.messages.system(DESIGN_PROMPT_SYSTEM),
+        llm.messages.user(_design_prompt_user(user_request, garment_type)),
+    ]
+
+
+@llm.call(MODEL, temperature=0.8)
+async def _design_variants_call(user_request: str, garment_type: str = "camiseta", variants: int = 2):
+    return [
+        llm.messages.system(DESIGN_VARIANTS_SYSTEM),
+        llm.messages.user(_design_variants_user(user_request, garment_type, variants)),
+    ]
 
 
 @llm.call(MODEL, temperature=0.3)
 async def _analyze_image_call(image_url: str):
-    return f"""
-    SYSTEM:
-    Analiza la siguiente imagen y describe que ves.
-    Enfocate en elementos para personalizar prendas:
-    - Logos
-    - Patrones
-    - Colores dominantes
-    - Estilo visual
-    - Elementos principales
-    - Sugerencias de uso en una prenda
-
-    USER:
-    URL de la imagen: {image_url}
-    """
+    return [
+        llm.messages.system(ANALYZE_IMAGE_SYSTEM),
+        llm.messages.user(_analyze_image_user(image_url)),
+    ]
 
 
 @llm.call(MODEL, temperature=0.6)
 async def _tryon_guidance_call(
     user_message: str, context: str = "Primera consulta de try-on"
 ):
-    return f"""
-    SYSTEM:
-    Eres un experto en virtual try-on (probarse ropa virtualmente).
+    return [
+        llm.messages.system(TRYON_GUIDANCE_SYSTEM),
+        llm.messages.user(_tryon_guidance_user(user_message, context)),
+    ]
 
-    Guia al usuario para:
-    1. Subir una foto clara
-    2. Confirmar prenda u outfit
-    3. Explicar que se generara una visualizacion realista
 
-    USER:
-    {user_message}
-
-    Contexto:
-    {context}
-    """
+@llm.call(MODEL, temperature=0.2)
+async def _session_summary_call(previous_summary: str, user_message: str, assistant_message: str):
+    return [
+        llm.messages.system(SESSION_SUMMARY_SYSTEM),
+        llm.messages.user(_session_summary_user(previous_summary, user_message, assistant_message)),
+    ]
 
 
 @dataclass
@@ -123,14 +216,25 @@ class FashionOrchestrator:
     usando Mirascope 2.2.2
     """
     
-    def __init__(self, api_key: str = settings.GEMINI_API_KEY):
+    def __init__(
+        self,
+        api_key: Optional[str] = settings.GEMINI_API_KEY,
+        provider: Optional[LLMProvider] = None,
+    ):
         """
         Inicializa el orquestador
         
         Args:
             api_key: API key de Google Gemini
+            provider: Proveedor de LLM (por defecto el configurado en LLM_PROVIDER)
         """
         self.api_key = api_key
+        self.provider = provider or build_provider()
+        self._design_prompt_cache: TTLCache[str, str] = TTLCache(
+            settings.DESIGN_PROMPT_CACHE_MAX_ENTRIES,
+            settings.DESIGN_PROMPT_CACHE_TTL_SECONDS,
+        )
+        self.latencies = LatencyTracker()
         self._setup_agents()
     
     def _setup_agents(self):
@@ -140,27 +244,85 @@ class FashionOrchestrator:
         pass
     
     @staticmethod
-    def _extract_text(response) -> str:
-        """Normaliza AsyncResponse/Response de Mirascope a texto plano."""
-        texts = [getattr(part, "text", "").strip() for part in getattr(response, "texts", [])]
-        texts = [t for t in texts if t]
-        if texts:
-            return "\n".join(texts)
-
-        content = getattr(response, "content", None)
-        if isinstance(content, str) and content.strip():
-            return content.strip()
-
-        if isinstance(content, list):
-            fallback = []
-            for part in content:
-                text = getattr(part, "text", None)
-                if isinstance(text, str) and text.strip():
-                    fallback.append(text.strip())
-            if fallback:
-                return "\n".join(fallback)
-
-        return "No se pudo generar una respuesta en este momento."
+    def _extract_text(response: LLMResult) -> str:
+        """Texto de la respuesta del proveedor, o un mensaje por defecto si llegó vacía."""
+        return (response.content or "").strip() or EMPTY_RESPONSE_TEXT
+
+    def _hedge_delay(self, call_type: str) -> Optional[float]:
+        """Umbral tras el que se lanza la llamada de respaldo, o None si no hay hedging."""
+        quantile = settings.llm_hedge_percentile(call_type)
+        if not settings.LLM_FALLBACK_MODEL or quantile <= 0:
+            return None
+        observed = self.latencies.percentile(
+            call_type, quantile, min_samples=settings.LLM_HEDGE_MIN_SAMPLES
+        )
+        return observed if observed is not None else settings.LLM_HEDGE_DEFAULT_DELAY_SECONDS
+
+    async def _run_call(self, call_type: str, call, **kwargs) -> LLMResult:
+        """
+        Ejecuta una llamada en el proveedor con plazo, hedging e instrumentación
+
+        El plazo es el timeout del tipo de llamada acotado por el presupuesto de la
+        petición. Si la llamada supera el percentil configurado de su latencia (o
+        falla), se lanza la misma llamada contra LLM_FALLBACK_MODEL y gana la primera.
+        Cada llamada queda registrada con record_llm_call (tiempo, tokens, modelo, resultado).
+
+        Args:
+            call_type: fashion_agent | design_prompt | analyze_image | tryon_guidance
+            call: Función decorada con @llm.call
+            **kwargs: Argumentos de la llamada
+
+        Returns:
+            Respuesta del modelo que respondió primero
+        """
+        async def primary():
+            started = time.monotonic()
+            try:
+                response = await self.provider.complete(
+                    call_type, call, kwargs, prefix=STATIC_PREFIXES.get(call_type)
+                )
+            except asyncio.CancelledError:
+                # Si ganó el respaldo, la llamada principal tardó al menos este tiempo
+                self.latencies.observe(call_type, time.monotonic() - started)
+                raise
+            self.latencies.observe(call_type, time.monotonic() - started)
+            return response
+
+        async def fallback():
+            return await self.provider.complete(
+                call_type, call, kwargs,
+                model=settings.LLM_FALLBACK_MODEL,
+                prefix=STATIC_PREFIXES.get(call_type),
+            )
+
+        started = time.monotonic()
+        try:
+            result = await run_hedged(
+                primary,
+                fallback if settings.LLM_FALLBACK_MODEL else None,
+                self._hedge_delay(call_type),
+                call_timeout(settings.llm_call_timeout(call_type)),
+            )
+        except BaseException as exc:
+            record_llm_call(LLMCallRecord(
+                call_type=call_type,
+                model=self.provider.model,
+                outcome=outcome_for(exc),
+                wall_seconds=time.monotonic() - started,
+            ))
+            raise
+
+        elapsed = time.monotonic() - started
+        record_llm_call(LLMCallRecord(
+            call_type=call_type,
+            model=result.model,
+            outcome="ok",
+            wall_seconds=elapsed,
+            input_tokens=result.input_tokens,
+            output_tokens=result.output_tokens,
+            cached_input_tokens=result.cached_input_tokens,
+        ))
+        return result
 
     async def fashion_agent(
         self, 
@@ -175,9 +337,11 @@ class FashionOrchestrator:
             context: Contexto adicional (historial, datos del usuario, etc.)
             
         Returns:
-            Configuración dinámica de Gemini
+            Respuesta del proveedor de LLM
         """
-        return await _fashion_agent_call(user_message=user_message, context=context)
+        return await self._run_call(
+            "fashion_agent", _fashion_agent_call, user_message=user_message, context=context
+        )
 
     async def generate_design_prompt(
         self,
@@ -192,12 +356,105 @@ class FashionOrchestrator:
             garment_type: Tipo de prenda
             
         Returns:
-            Configuración dinámica de Gemini
+            Respuesta del proveedor de LLM
         """
-        return await _design_prompt_call(
+        return await self._run_call(
+            "design_prompt", _design_prompt_call,
             user_request=user_request, garment_type=garment_type
         )
 
+    def _design_prompt_cache_key(self, user_request: str, garment_type: str) -> str:
+        raw_key = json.dumps([user_request, garment_type, self.provider.model], ensure_ascii=False)
+        return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+    async def design_prompt_text(
+        self,
+        user_request: str,
+        garment_type: str = "camiseta",
+        bypass_cache: bool = False,
+    ) -> str:
+        """
+        Devuelve el texto del prompt de diseño, reutilizando uno reciente si el
+        brief, la prenda y el modelo son idénticos
+
+        Args:
+            user_request: Brief completo de la personalización
+            garment_type: Tipo de prenda
+            bypass_cache: Si es True, siempre pide un prompt nuevo al modelo
+
+        Returns:
+            Prompt final en inglés
+        """
+        use_cache = settings.DESIGN_PROMPT_CACHE_ENABLED and not bypass_cache
+        cache_key = self._design_prompt_cache_key(user_request, garment_type)
+        if use_cache:
+            cached_prompt = self._design_prompt_cache.get(cache_key)
+            if cached_prompt is not None:
+                return cached_prompt
+
+        response = await self.generate_design_prompt(
+            user_request=user_request, garment_type=garment_type
+        )
+        design_prompt = self._extract_text(response)
+        if settings.DESIGN_PROMPT_CACHE_ENABLED and design_prompt != EMPTY_RESPONSE_TEXT:
+            self._design_prompt_cache.set(cache_key, design_prompt)
+        return design_prompt
+
+    @staticmethod
+    def _parse_prompt_variants(text: str, variants: int) -> List[str]:
+        """Prompts de una respuesta numerada ("1. ...", "2. ..."), sin repetidos."""
+        prompts: List[str] = []
+        for line in text.splitlines():
+            prompt = NUMBERED_LINE_PATTERN.sub("", line).strip().strip('"')
+            if prompt and prompt not in prompts:
+                prompts.append(prompt)
+        return prompts[:variants]
+
+    async def design_prompt_variants(
+        self,
+        user_request: str,
+        garment_type: str = "camiseta",
+        variants: int = 2,
+        bypass_cache: bool = False,
+    ) -> List[str]:
+        """
+        Escribe `variants` prompts de diseño distintos en una sola llamada
+
+        Si el modelo devuelve menos variantes de las pedidas se usan las que haya;
+        si no devuelve ninguna utilizable, se cae al prompt único de design_prompt_text.
+
+        Args:
+            user_request: Brief completo de la personalización
+            garment_type: Tipo de prenda
+            variants: Cantidad de prompts
+            bypass_cache: Si es True, siempre pide prompts nuevos al modelo
+
+        Returns:
+            Lista de prompts finales en inglés (al menos uno)
+        """
+        if variants <= 1:
+            return [await self.design_prompt_text(user_request, garment_type, bypass_cache)]
+
+        use_cache = settings.DESIGN_PROMPT_CACHE_ENABLED and not bypass_cache
+        cache_key = self._design_prompt_cache_key(f"{user_request}\n#variants={variants}", garment_type)
+        if use_cache:
+            cached_prompts = self._design_prompt_cache.get(cache_key)
+            if cached_prompts is not None:
+                return json.loads(cached_prompts)
+
+        response = await self._run_call(
+            "design_prompt_variants", _design_variants_call,
+            user_request=user_request, garment_type=garment_type, variants=variants,
+        )
+        prompts = self._parse_prompt_variants(response.content or "", variants)
+        if not prompts:
+            logger.warning("El modelo no devolvio variantes utilizables; se usa un solo prompt")
+            return [await self.design_prompt_text(user_request, garment_type, bypass_cache)]
+
+        if settings.DESIGN_PROMPT_CACHE_ENABLED:
+            self._design_prompt_cache.set(cache_key, json.dumps(prompts, ensure_ascii=False))
+        return prompts
+
     async def analyze_image(
         self,
         image_url: str
@@ -209,9 +466,109 @@ class FashionOrchestrator:
             image_url: URL de la imagen a analizar
             
         Returns:
-            Configuración dinámica de Gemini
+            Respuesta del proveedor de LLM
+        """
+        return await self._run_call("analyze_image", _analyze_image_call, image_url=image_url)
+
+    async def _analyze_image_with_deadline(
+        self,
+        image_url: str,
+        semaphore: asyncio.Semaphore,
+    ) -> Optional[str]:
+        """
+        Analiza una imagen respetando el límite de concurrencia y el plazo por imagen.
+
+        Returns:
+            Texto del análisis, o None si la imagen falló o superó el plazo
+        """
+        if settings.IMAGE_ANALYSIS_CACHE_ENABLED:
+            cached_analysis = await image_analysis_cache.get(image_url)
+            if cached_analysis is not None:
+                return cached_analysis
+
+        async with semaphore:
+            try:
+                response = await asyncio.wait_for(
+                    self.analyze_image(image_url=image_url),
+                    timeout=settings.IMAGE_ANALYSIS_TIMEOUT_SECONDS,
+                )
+            except asyncio.TimeoutError:
+                logger.warning("Analisis de imagen omitido por timeout: %s", image_url)
+                return None
+            except Exception as exc:
+                logger.warning("Analisis de imagen omitido por error (%s): %s", exc, image_url)
+                return None
+
+        analysis = self._extract_text(response)
+        # Una respuesta vacía no se cachea: dejaría la imagen sin análisis durante todo el TTL
+        if settings.IMAGE_ANALYSIS_CACHE_ENABLED and analysis != EMPTY_RESPONSE_TEXT:
+            await image_analysis_cache.set(image_url, analysis)
+        return analysis
+
+    async def analyze_images(self, image_urls: List[str]) -> List[str]:
+        """
+        Analiza varias imágenes de forma concurrente
+
+        Las imágenes lentas o fallidas se omiten sin interrumpir el turno.
+        El resultado conserva el orden original de las imágenes.
+
+        Args:
+            image_urls: Lista de URLs de imágenes
+
+        Returns:
+            Análisis de las imágenes que se pudieron procesar, en orden
         """
-        return await _analyze_image_call(image_url=image_url)
+        semaphore = asyncio.Semaphore(max(1, settings.IMAGE_ANALYSIS_MAX_CONCURRENCY))
+        results = await asyncio.gather(
+            *(self._analyze_image_with_deadline(url, semaphore) for url in image_urls)
+        )
+        # EMPTY_RESPONSE_TEXT es el texto de relleno de una llamada sin respuesta, no un análisis
+        return [analysis for analysis in results if analysis and analysis != EMPTY_RESPONSE_TEXT]
+
+    @staticmethod
+    def _parse_design_summary(text: str, previous_summary: Dict[str, Optional[str]]) -> Dict[str, Optional[str]]:
+        """Interpreta el JSON devuelto por el modelo; si no es válido conserva el estado anterior."""
+        # El modelo a veces envuelve el JSON en bloques ```json; se toma del primer "{" al último "}"
+        start, end = text.find("{"), text.rfind("}")
+        try:
+            parsed = json.loads(text[start:end + 1]) if start != -1 and end > start else None
+        except ValueError:
+            parsed = None
+        if not isinstance(parsed, dict):
+            return dict(previous_summary)
+
+        summary: Dict[str, Optional[str]] = {}
+        for key in DESIGN_SUMMARY_KEYS:
+            value = parsed.get(key, previous_summary.get(key))
+            summary[key] = str(value).strip() if value not in (None, "") else None
+        return summary
+
+    async def update_design_summary(
+        self,
+        previous_summary: Optional[Dict[str, Optional[str]]],
+        user_message: str,
+        assistant_message: str,
+    ) -> Dict[str, Optional[str]]:
+        """
+        Actualiza incrementalmente el resumen del diseño de una sesión
+
+        Args:
+            previous_summary: Estado anterior (color, logo, ubicacion, patron, notas)
+            user_message: Último mensaje del usuario
+            assistant_message: Última respuesta del asistente
+
+        Returns:
+            Estado del diseño actualizado
+        """
+        previous_summary = previous_summary or {}
+        response = await self._run_call(
+            "session_summary",
+            _session_summary_call,
+            previous_summary=json.dumps(previous_summary, ensure_ascii=False),
+            user_message=user_message,
+            assistant_message=assistant_message,
+        )
+        return self._parse_design_summary(self._extract_text(response), previous_summary)
 
     async def tryon_guidance(
         self,
@@ -226,10 +583,90 @@ class FashionOrchestrator:
             context: Contexto de la conversación
             
         Returns:
-            Configuración dinámica de Gemini
+            Respuesta del proveedor de LLM
         """
-        return await _tryon_guidance_call(user_message=user_message, context=context)
+        return await self._run_call(
+            "tryon_guidance", _tryon_guidance_call, user_message=user_message, context=context
+        )
     
+    async def _add_image_context(
+        self,
+        context: Optional[str],
+        images: Optional[List[str]],
+    ) -> Tuple[Optional[str], List[str]]:
+        """
+        Analiza las imágenes adjuntas y agrega sus descripciones al contexto
+
+        Returns:
+            Tupla (contexto resultante, análisis obtenidos)
+        """
+        image_analyses = await self.analyze_images(images) if images else []
+        if image_analyses:
+            if context:
+                context += "\n\nImágenes adjuntas:\n" + "\n".join(image_analyses)
+            else:
+                context = "Imágenes adjuntas:\n" + "\n".join(image_analyses)
+        return context, image_analyses
+
+    async def orchestrate_stream(
+        self,
+        user_message: str,
+        context: Optional[str] = None,
+        images: Optional[List[str]] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Igual que orchestrate con el agente general, pero transmite la respuesta
+        en fragmentos de texto a medida que el modelo los genera.
+
+        Args:
+            user_message: Mensaje del usuario
+            context: Contexto de la conversación
+            images: Lista de URLs de imágenes
+
+        Yields:
+            Fragmentos de texto de la respuesta
+        """
+        context, _ = await self._add_image_context(context, images)
+        started = time.monotonic()
+        first_delta_at: Optional[float] = None
+        outcome = "ok"
+        deltas = self.provider.stream(
+            "fashion_agent",
+            _fashion_agent_call,
+            {"user_message": user_message, "context": context or "No hay contexto previo"},
+            prefix=STATIC_PREFIXES["fashion_agent"],
+        )
+        try:
+            deadline = started + call_timeout(settings.llm_call_timeout("fashion_agent"))
+            while True:
+                # El plazo se aplica a cada fragmento y nunca mientras el generador está
+                # suspendido en el yield: un asyncio.timeout abierto ahí cancelaría al
+                # consumidor (la respuesta SSE) en lugar de lanzar TimeoutError aquí
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError("El modelo no termino de responder a tiempo")
+                try:
+                    delta = await asyncio.wait_for(anext(deltas), remaining)
+                except StopAsyncIteration:
+                    break
+                if first_delta_at is None:
+                    first_delta_at = time.monotonic()
+                yield delta
+        except BaseException as exc:
+            # GeneratorExit: el cliente dejó de leer antes de terminar
+            outcome = "cancelled" if isinstance(exc, GeneratorExit) else outcome_for(exc)
+            raise
+        finally:
+            await deltas.aclose()
+            record_llm_call(LLMCallRecord(
+                call_type="fashion_agent",
+                model=self.provider.model,
+                outcome=outcome,
+                wall_seconds=time.monotonic() - started,
+                ttft_seconds=first_delta_at - started if first_delta_at is not None else None,
+                streamed=True,
+            ))
+
     async def orchestrate(
         self,
         user_message: str,
@@ -249,51 +686,44 @@ class FashionOrchestrator:
         Returns:
             Respuesta del agente
         """
-        try:
-            # Si hay imágenes, primero analizarlas
-            image_analyses = []
-            if images:
-                for img_url in images:
-                    response = await self.analyze_image(image_url=img_url)
-                    image_analyses.append(self._extract_text(response))
-                
-                # Agregar análisis al contexto
-                if context:
-                    context += "\n\nImágenes adjuntas:\n" + "\n".join(image_analyses)
+        with collect_llm_calls() as llm_calls:
+            try:
+                # Si hay imágenes, primero analizarlas (en paralelo, conservando el orden)
+                context, image_analyses = await self._add_image_context(context, images)
+
+                # Seleccionar agente según intent
+                if intent == "design":
+                    response = await self.generate_design_prompt(
+                        user_request=user_message,
+                        garment_type="camiseta"  # Puede ser dinámico
+                    )
+                elif intent == "tryon":
+                    response = await self.tryon_guidance(
+                        user_message=user_message,
+                        context=context or "Primera consulta"
+                    )
                 else:
-                    context = "Imágenes adjuntas:\n" + "\n".join(image_analyses)
-            
-            # Seleccionar agente según intent
-            if intent == "design":
-                response = await self.generate_design_prompt(
-                    user_request=user_message,
-                    garment_type="camiseta"  # Puede ser dinámico
-                )
-            elif intent == "tryon":
-                response = await self.tryon_guidance(
-                    user_message=user_message,
-                    context=context or "Primera consulta"
+                    # Agente general de moda
+                    response = await self.fashion_agent(
+                        user_message=user_message,
+                        context=context or "No hay contexto previo"
+                    )
+
+                return AgentResponse(
+                    content=self._extract_text(response),
+                    metadata={
+                        "intent": intent,
+                        "images_analyzed": len(image_analyses),
+                        "images_skipped": len(images or []) - len(image_analyses),
+                        "llm": summarize_llm_calls(llm_calls),
+                    }
                 )
-            else:
-                # Agente general de moda
-                response = await self.fashion_agent(
-                    user_message=user_message,
-                    context=context or "No hay contexto previo"
+
+            except Exception as e:
+                return AgentResponse(
+                    content=f"Lo siento, hubo un error al procesar tu solicitud: {str(e)}",
+                    metadata={"error": str(e), "llm": summarize_llm_calls(llm_calls)}
                 )
-            
-            return AgentResponse(
-                content=self._extract_text(response),
-                metadata={
-                    "intent": intent,
-                    "images_analyzed": len(image_analyses) if images else 0
-                }
-            )
-            
-        except Exception as e:
-            return AgentResponse(
-                content=f"Lo siento, hubo un error al procesar tu solicitud: {str(e)}",
-                metadata={"error": str(e)}
-            )
 
 
 # Instancia global del orquestador
@@ -0,0 +1,199 @@
+"""
+Cache de prefijos de prompt en el proveedor
+
+Los prompts de sistema de fashion_agent y design_prompt son largos e idénticos
+en cada turno. Se registran una vez como contenido cacheado del proveedor y
+cada llamada envía solo el contexto del turno y el mensaje del usuario.
+
+1. GeminiPrefixCache: cached contents de la API de Gemini (google-genai)
+2. LocalPrefixCache: equivalente en memoria para el proveedor local y pruebas
+
+El cache se renueva (se extiende su TTL) antes de expirar. Si el proveedor no
+acepta el prefijo (p. ej. es más corto que el mínimo cacheable) la llamada
+sigue por el camino normal y no se reintenta hasta LLM_PROMPT_CACHE_RETRY_SECONDS.
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional, Tuple
+
+from google.genai import types as genai_types
+
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+PROMPT_CACHE_EVENTS = metrics.counter(
+    "agent_llm_prompt_cache_events_total",
+    "Eventos del cache de prefijos de prompt (registered, hit, refreshed, skipped, failed, invalidated)",
+    ("prefix", "event"),
+)
+
+# Aproximación de caracteres por token para decidir si un prefijo es cacheable
+CHARS_PER_TOKEN = 4
+
+
+@dataclass(frozen=True)
+class StaticPrefix:
+    """Prompt de sistema estático de un tipo de llamada"""
+    key: str
+    system: str
+    # Construye la parte variable (mensaje del usuario) a partir de los argumentos de la llamada
+    render_user: Callable[..., str] = field(compare=False)
+
+    @property
+    def digest(self) -> str:
+        return hashlib.sha256(self.system.encode("utf-8")).hexdigest()
+
+    @property
+    def estimated_tokens(self) -> int:
+        return len(self.system) // CHARS_PER_TOKEN
+
+
+@dataclass
+class _CacheEntry:
+    handle: Optional[str]
+    expires_at: float  # Si handle es None: momento a partir del cual se reintenta
+
+
+class PromptPrefixCache(ABC):
+    """
+    Registro de prefijos cacheados por (modelo, prefijo)
+
+    Las subclases implementan _create (registrar el prefijo en el proveedor)
+    y _extend (extender su vigencia).
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float,
+        refresh_margin_seconds: float,
+        retry_seconds: float,
+        min_tokens: int = 0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin_seconds = min(refresh_margin_seconds, ttl_seconds / 2)
+        self.retry_seconds = retry_seconds
+        self.min_tokens = min_tokens
+        self._clock = clock
+        self._entries: Dict[Tuple[str, str], _CacheEntry] = {}
+        self._locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+
+    @abstractmethod
+    async def _create(self, model: str, prefix: StaticPrefix) -> str:
+        """Registra el prefijo en el proveedor y devuelve su identificador."""
+
+    @abstractmethod
+    async def _extend(self, model: str, handle: str) -> None:
+        """Extiende la vigencia de un prefijo ya registrado."""
+
+    @staticmethod
+    def _key(model: str, prefix: StaticPrefix) -> Tuple[str, str]:
+        # El digest hace que un cambio del prompt (nuevo despliegue) registre un prefijo nuevo
+        return model, f"{prefix.key}:{prefix.digest}"
+
+    async def handle_for(self, model: str, prefix: StaticPrefix) -> Optional[str]:
+        """
+        Identificador del prefijo cacheado, registrándolo o renovándolo si hace falta
+
+        Returns:
+            Nombre del contenido cacheado, o None si el prefijo no se puede cachear
+        """
+        if prefix.estimated_tokens < self.min_tokens:
+            PROMPT_CACHE_EVENTS.inc(prefix=prefix.key, event="skipped")
+            return None
+
+        key = self._key(model, prefix)
+        entry = self._entries.get(key)
+        if entry and self._is_fresh(entry):
+            PROMPT_CACHE_EVENTS.inc(prefix=prefix.key, event="hit")
+            return entry.handle
+        if entry and entry.handle is None and self._clock() < entry.expires_at:
+            return None
+
+        # Un solo registro/renovación por prefijo aunque lleguen varias peticiones a la vez
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            entry = self._entries.get(key)
+            if entry and self._is_fresh(entry):
+                PROMPT_CACHE_EVENTS.inc(prefix=prefix.key, event="hit")
+                return entry.handle
+
+            if entry and entry.handle and self._clock() < entry.expires_at:
+                try:
+                    await self._extend(model, entry.handle)
+                    entry.expires_at = self._clock() + self.ttl_seconds
+                    PROMPT_CACHE_EVENTS.inc(prefix=prefix.key, event="refreshed")
+                    return entry.handle
+                except Exception as exc:
+                    logger.warning("No se pudo renovar el prefijo cacheado %s: %s", prefix.key, exc)
+
+            try:
+                handle = await self._create(model, prefix)
+            except Exception as exc:
+                logger.warning("No se pudo cachear el prefijo %s en %s: %s", prefix.key, model, exc)
+                self._entries[key] = _CacheEntry(None, self._clock() + self.retry_seconds)
+                PROMPT_CACHE_EVENTS.inc(prefix=prefix.key, event="failed")
+                return None
+
+            self._entries[key] = _CacheEntry(handle, self._clock() + self.ttl_seconds)
+            PROMPT_CACHE_EVENTS.inc(prefix=prefix.key, event="registered")
+            return handle
+
+    def _is_fresh(self, entry: _CacheEntry) -> bool:
+        """True si el prefijo está registrado y no entra todavía en el margen de renovación."""
+        return bool(entry.handle) and self._clock() < entry.expires_at - self.refresh_margin_seconds
+
+    def invalidate(self, model: str, prefix: StaticPrefix) -> None:
+        """Olvida un prefijo que el proveedor ya no reconoce (expirado o borrado)."""
+        if self._entries.pop(self._key(model, prefix), None) is not None:
+            PROMPT_CACHE_EVENTS.inc(prefix=prefix.key, event="invalidated")
+
+
+class GeminiPrefixCache(PromptPrefixCache):
+    """Prefijos registrados como cached contents de Gemini"""
+
+    def __init__(self, client, **kwargs):
+        super().__init__(**kwargs)
+        self.client = client
+
+    @staticmethod
+    def model_name(model: str) -> str:
+        # Mirascope usa "google/<modelo>"; la API de Gemini solo "<modelo>"
+        return model.split("/", 1)[1] if model.startswith("google/") else model
+
+    async def _create(self, model: str, prefix: StaticPrefix) -> str:
+        cached = await self.client.aio.caches.create(
+            model=self.model_name(model),
+            config=genai_types.CreateCachedContentConfig(
+                system_instruction=prefix.system,
+                ttl=f"{int(self.ttl_seconds)}s",
+                display_name=f"craftyourstyle-{prefix.key}-{prefix.digest[:12]}",
+            ),
+        )
+        return cached.name
+
+    async def _extend(self, model: str, handle: str) -> None:
+        await self.client.aio.caches.update(
+            name=handle,
+            config=genai_types.UpdateCachedContentConfig(ttl=f"{int(self.ttl_seconds)}s"),
+        )
+
+
+class LocalPrefixCache(PromptPrefixCache):
+    """Equivalente en memoria: mismas reglas de vigencia, sin red"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.created = 0
+        self.extended = 0
+
+    async def _create(self, model: str, prefix: StaticPrefix) -> str:
+        self.created += 1
+        return f"local/cachedContents/{prefix.key}-{prefix.digest[:12]}-{self.created}"
+
+    async def _extend(self, model: str, handle: str) -> None:
+        self.extended += 1
@@ -0,0 +1,414 @@
+"""
+Proveedores de LLM del orquestador
+
+El orquestador no llama a Mirascope directamente: delega en un proveedor.
+
+1. MirascopeProvider: Gemini a través de Mirascope 2.2.2 (producción)
+2. LocalProvider: respuestas deterministas con latencia simulada, sin red
+   (pruebas de carga y profiling del flujo de chat)
+
+El proveedor se elige con LLM_PROVIDER en el .env. Ambos aceptan un cache de
+prefijos (app/agents/prompt_cache.py) para no reenviar los prompts de sistema estáticos.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from google import genai
+from google.genai import errors as genai_errors
+from google.genai import types as genai_types
+from mirascope import llm
+
+from app.agents.prompt_cache import GeminiPrefixCache, LocalPrefixCache, PromptPrefixCache, StaticPrefix
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LLMResult:
+    """Resultado normalizado de una llamada al LLM"""
+    content: str
+    model: str
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    # Parte de input_tokens servida desde el prefijo cacheado
+    cached_input_tokens: Optional[int] = None
+
+
+def response_text(response) -> str:
+    """Normaliza AsyncResponse/Response de Mirascope a texto plano (vacío si no hay texto)."""
+    texts = [getattr(part, "text", "").strip() for part in getattr(response, "texts", [])]
+    texts = [t for t in texts if t]
+    if texts:
+        return "\n".join(texts)
+
+    content = getattr(response, "content", None)
+    if isinstance(content, str):
+        return content.strip()
+
+    if isinstance(content, list):
+        fallback = []
+        for part in content:
+            text = getattr(part, "text", None)
+            if isinstance(text, str) and text.strip():
+                fallback.append(text.strip())
+        return "\n".join(fallback)
+
+    return ""
+
+
+class LLMProvider(ABC):
+    """
+    Interfaz común de los proveedores
+
+    Cada llamada recibe el tipo de llamada (fashion_agent, design_prompt, ...),
+    la función de prompt decorada con @llm.call y sus argumentos. Si además
+    recibe el prefijo estático de la llamada y hay cache de prefijos, solo se
+    envía la parte variable.
+    """
+
+    name = "base"
+
+    def __init__(self, model: str, prefix_cache: Optional[PromptPrefixCache] = None):
+        self.model = model
+        self.prefix_cache = prefix_cache
+
+    @abstractmethod
+    async def complete(
+        self,
+        call_type: str,
+        call,
+        kwargs: Dict[str, Any],
+        model: Optional[str] = None,
+        prefix: Optional[StaticPrefix] = None,
+    ) -> LLMResult:
+        """Ejecuta la llamada completa; model permite usar un modelo distinto (respaldo)."""
+
+    @abstractmethod
+    def stream(
+        self,
+        call_type: str,
+        call,
+        kwargs: Dict[str, Any],
+        prefix: Optional[StaticPrefix] = None,
+    ) -> AsyncIterator[str]:
+        """Ejecuta la llamada transmitiendo fragmentos de texto."""
+
+    async def _prefix_handle(self, model: str, prefix: Optional[StaticPrefix]) -> Optional[str]:
+        if prefix is None or self.prefix_cache is None:
+            return None
+        return await self.prefix_cache.handle_for(model, prefix)
+
+
+class MirascopeProvider(LLMProvider):
+    """Gemini vía Mirascope 2.2.2 (las llamadas con prefijo cacheado van directo a google-genai)"""
+
+    name = "mirascope"
+    # Errores de la API que indican que el contenido cacheado ya no existe o no es accesible
+    STALE_CACHE_STATUS = {403, 404}
+
+    def __init__(
+        self,
+        model: str,
+        api_key: Optional[str] = None,
+        prefix_cache: Optional[GeminiPrefixCache] = None,
+    ):
+        super().__init__(model, prefix_cache)
+        if api_key:
+            os.environ.setdefault("GOOGLE_API_KEY", api_key)
+
+    def _model_for(self, call, model: Optional[str]) -> llm.Model:
+        # Conserva los parámetros del decorador (temperature, ...) al cambiar de modelo
+        return llm.Model(model or self.model, **call.default_model.params)
+
+    def _cached_request(self, call, model: str, handle: str, prefix: StaticPrefix, kwargs: Dict[str, Any]):
+        return dict(
+            model=GeminiPrefixCache.model_name(model),
+            contents=prefix.render_user(**kwargs),
+            config=genai_types.GenerateContentConfig(
+                cached_content=handle,
+                temperature=call.default_model.params.get("temperature"),
+            ),
+        )
+
+    def _is_stale_cache_error(self, exc: Exception) -> bool:
+        return isinstance(exc, genai_errors.APIError) and exc.code in self.STALE_CACHE_STATUS
+
+    async def complete(
+        self,
+        call_type: str,
+        call,
+        kwargs: Dict[str, Any],
+        model: Optional[str] = None,
+        prefix: Optional[StaticPrefix] = None,
+    ) -> LLMResult:
+        model_id = model or self.model
+        handle = await self._prefix_handle(model_id, prefix)
+        if handle:
+            try:
+                response = await self.prefix_cache.client.aio.models.generate_content(
+                    **self._cached_request(call, model_id, handle, prefix, kwargs)
+                )
+                usage = response.usage_metadata
+                return LLMResult(
+                    content=(response.text or "").strip(),
+                    model=model_id,
+                    input_tokens=getattr(usage, "prompt_token_count", None),
+                    output_tokens=getattr(usage, "candidates_token_count", None),
+                    cached_input_tokens=getattr(usage, "cached_content_token_count", None),
+                )
+            except Exception as exc:
+                if not self._is_stale_cache_error(exc):
+                    raise
+                # El cache expiró o se borró del lado del proveedor: se vuelve a registrar en la próxima llamada
+                logger.warning("Prefijo cacheado no disponible (%s), se usa el prompt completo", exc)
+                self.prefix_cache.invalidate(model_id, prefix)
+
+        with self._model_for(call, model_id):
+            response = await call(**kwargs)
+
+        usage = getattr(response, "usage", None)
+        return LLMResult(
+            content=response_text(response),
+            model=model_id,
+            input_tokens=getattr(usage, "input_tokens", None),
+            output_tokens=getattr(usage, "output_tokens", None),
+        )
+
+    async def stream(
+        self,
+        call_type: str,
+        call,
+        kwargs: Dict[str, Any],
+        prefix: Optional[StaticPrefix] = None,
+    ) -> AsyncIterator[str]:
+        handle = await self._prefix_handle(self.model, prefix)
+        if handle:
+            try:
+                chunks = await self.prefix_cache.client.aio.models.generate_content_stream(
+                    **self._cached_request(call, self.model, handle, prefix, kwargs)
+                )
+            except Exception as exc:
+                if not self._is_stale_cache_error(exc):
+                    raise
+                logger.warning("Prefijo cacheado no disponible (%s), se usa el prompt completo", exc)
+                self.prefix_cache.invalidate(self.model, prefix)
+            else:
+                async for chunk in chunks:
+                    if chunk.text:
+                        yield chunk.text
+                return
+
+        with self._model_for(call, None):
+            response_stream = await call.stream(**kwargs)
+            async for delta in response_stream.text_stream():
+                if delta:
+                    yield delta
+
+
+class LocalProvider(LLMProvider):
+    """
+    Proveedor local determinista para benchmarks
+
+    - La latencia sigue la distribución configurada (fixed | uniform | lognormal)
+      con media por tipo de llamada
+    - El texto sale de respuestas predefinidas por tipo de llamada; admiten
+      los argumentos de la llamada como marcadores, p. ej. "{user_message}"
+    - Con la misma semilla y los mismos argumentos, latencia y texto se repiten
+      aunque las llamadas se ejecuten en otro orden
+    """
+
+    name = "local"
+
+    DEFAULT_RESPONSES: Dict[str, str] = {
+        "fashion_agent": (
+            "Perfecto, trabajemos sobre tu prenda actual. "
+            "Puedo cambiar el color base, agregar un logo y ubicarlo donde prefieras. "
+            "Confirmame color, logo y posicion para generar la personalizacion."
+        ),
+        "design_prompt": (
+            "Same garment, same silhouette and catalog framing. "
+            "Apply the requested customization exactly: {user_request}. "
+            "Garment type: {garment_type}. Photorealistic product photo."
+        ),
+        "design_prompt_variants": (
+            "1. Same garment, same silhouette and catalog framing, customization applied as requested "
+            "in a deeper shade. Garment type: {garment_type}. Photorealistic product photo.\n"
+            "2. Same garment, same silhouette and catalog framing, customization applied as requested "
+            "at a larger scale. Garment type: {garment_type}. Photorealistic product photo.\n"
+            "3. Same garment, same silhouette and catalog framing, customization applied as requested "
+            "in a lighter, minimal version. Garment type: {garment_type}. Photorealistic product photo."
+        ),
+        "analyze_image": (
+            "Imagen de referencia con un logo central, colores dominantes azul y blanco, "
+            "estilo minimalista. Sugerencia: ubicar el logo en el pecho."
+        ),
+        "tryon_guidance": (
+            "Sube una foto clara de frente, confirma la prenda y generaremos una visualizacion realista."
+        ),
+        "session_summary": json.dumps(
+            {"color": "azul", "logo": None, "ubicacion": None, "patron": None, "notas": None},
+            ensure_ascii=False,
+        ),
+    }
+    # Tokens aproximados por palabra para simular el consumo
+    TOKENS_PER_WORD = 1.3
+
+    def __init__(
+        self,
+        model: str = "local/deterministic",
+        seed: int = 0,
+        distribution: str = "lognormal",
+        latency_ms: Optional[Dict[str, float]] = None,
+        jitter: float = 0.25,
+        stream_chunk_ms: float = 15.0,
+        responses: Optional[Dict[str, str]] = None,
+        prefix_cache: Optional[LocalPrefixCache] = None,
+        cached_latency_factor: float = 0.85,
+    ):
+        super().__init__(model, prefix_cache)
+        if distribution not in {"fixed", "uniform", "lognormal"}:
+            raise ValueError(f"Distribución de latencia no soportada: {distribution}")
+        self.seed = seed
+        self.distribution = distribution
+        self.latency_ms = latency_ms or {}
+        self.jitter = max(0.0, jitter)
+        self.stream_chunk_ms = stream_chunk_ms
+        self.responses = {**self.DEFAULT_RESPONSES, **(responses or {})}
+        # Con prefijo cacheado la latencia simulada se multiplica por este factor
+        self.cached_latency_factor = cached_latency_factor
+
+    def _rng(self, call_type: str, kwargs: Dict[str, Any]) -> random.Random:
+        # Semilla derivada de la llamada: el resultado no depende del orden de ejecución
+        raw = json.dumps([self.seed, call_type, kwargs], sort_keys=True, ensure_ascii=False, default=str)
+        return random.Random(int(hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16], 16))
+
+    def sample_latency(self, call_type: str, kwargs: Dict[str, Any]) -> float:
+        """Latencia simulada en segundos para una llamada."""
+        mean = self.latency_ms.get(call_type, self.latency_ms.get("default", 0.0)) / 1000
+        if mean <= 0:
+            return 0.0
+
+        rng = self._rng(call_type, kwargs)
+        if self.distribution == "fixed" or self.jitter == 0:
+            return mean
+        if self.distribution == "uniform":
+            return rng.uniform(mean * (1 - self.jitter), mean * (1 + self.jitter))
+        # lognormal con la media indicada: mu = ln(media) - sigma^2 / 2
+        sigma = self.jitter
+        return rng.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma)
+
+    def render(self, call_type: str, kwargs: Dict[str, Any]) -> str:
+        """Texto predefinido de la llamada con los argumentos sustituidos."""
+        template = self.responses.get(call_type, "Respuesta local para {call_type}.")
+        values = {key: str(value) for key, value in kwargs.items()}
+        values["call_type"] = call_type
+        for key, value in values.items():
+            template = template.replace("{" + key + "}", value)
+        return template
+
+    def _estimate_tokens(self, text: str) -> int:
+        return int(len(text.split()) * self.TOKENS_PER_WORD)
+
+    async def _simulated_latency(
+        self, call_type: str, kwargs: Dict[str, Any], model: str, prefix: Optional[StaticPrefix]
+    ) -> Tuple[float, Optional[str]]:
+        handle = await self._prefix_handle(model, prefix)
+        latency = self.sample_latency(call_type, kwargs)
+        return (latency * self.cached_latency_factor if handle else latency), handle
+
+    async def complete(
+        self,
+        call_type: str,
+        call,
+        kwargs: Dict[str, Any],
+        model: Optional[str] = None,
+        prefix: Optional[StaticPrefix] = None,
+    ) -> LLMResult:
+        model_id = model or self.model
+        latency, handle = await self._simulated_latency(call_type, kwargs, model_id, prefix)
+        await asyncio.sleep(latency)
+        content = self.render(call_type, kwargs)
+
+        if prefix is not None:
+            prefix_tokens = self._estimate_tokens(prefix.system)
+            input_tokens = prefix_tokens + self._estimate_tokens(prefix.render_user(**kwargs))
+        else:
+            prefix_tokens = 0
+            input_tokens = sum(self._estimate_tokens(str(value)) for value in kwargs.values())
+        return LLMResult(
+            content=content,
+            model=model_id,
+            input_tokens=input_tokens,
+            output_tokens=self._estimate_tokens(content),
+            cached_input_tokens=prefix_tokens if handle else None,
+        )
+
+    async def stream(
+        self,
+        call_type: str,
+        call,
+        kwargs: Dict[str, Any],
+        prefix: Optional[StaticPrefix] = None,
+    ) -> AsyncIterator[str]:
+        # La latencia simulada es el tiempo hasta el primer fragmento
+        latency, _ = await self._simulated_latency(call_type, kwargs, self.model, prefix)
+        await asyncio.sleep(latency)
+        words = self.render(call_type, kwargs).split(" ")
+        for index, word in enumerate(words):
+            if index and self.stream_chunk_ms > 0:
+                await asyncio.sleep(self.stream_chunk_ms / 1000)
+            yield word if index == len(words) - 1 else word + " "
+
+
+def _load_local_responses(path: Optional[str]) -> Optional[Dict[str, str]]:
+    if not path:
+        return None
+    with open(path, encoding="utf-8") as responses_file:
+        return json.load(responses_file)
+
+
+def _prefix_cache_settings() -> Dict[str, Any]:
+    return dict(
+        ttl_seconds=settings.LLM_PROMPT_CACHE_TTL_SECONDS,
+        refresh_margin_seconds=settings.LLM_PROMPT_CACHE_REFRESH_MARGIN_SECONDS,
+        retry_seconds=settings.LLM_PROMPT_CACHE_RETRY_SECONDS,
+    )
+
+
+def build_provider() -> LLMProvider:
+    """Crea el proveedor configurado en LLM_PROVIDER."""
+    if settings.LLM_PROVIDER == "local":
+        # Sin mínimo: el proveedor local ejercita registro, renovación e invalidación
+        # con los prefijos actuales, que en Gemini quedan por debajo del mínimo cacheable
+        prefix_cache = (
+            LocalPrefixCache(min_tokens=0, **_prefix_cache_settings())
+            if settings.LLM_PROMPT_CACHE_ENABLED
+            else None
+        )
+        return LocalProvider(
+            seed=settings.LLM_LOCAL_SEED,
+            distribution=settings.LLM_LOCAL_LATENCY_DISTRIBUTION,
+            latency_ms=settings.LLM_LOCAL_LATENCY_MS,
+            jitter=settings.LLM_LOCAL_LATENCY_JITTER,
+            stream_chunk_ms=settings.LLM_LOCAL_STREAM_CHUNK_MS,
+            responses=_load_local_responses(settings.LLM_LOCAL_RESPONSES_FILE),
+            prefix_cache=prefix_cache,
+        )
+
+    prefix_cache = None
+    if settings.LLM_PROMPT_CACHE_ENABLED:
+        prefix_cache = GeminiPrefixCache(
+            genai.Client(api_key=settings.GEMINI_API_KEY),
+            min_tokens=settings.LLM_PROMPT_CACHE_MIN_TOKENS,
+            **_prefix_cache_settings(),
+        )
+    return MirascopeProvider(settings.LLM_MODEL, api_key=settings.GEMINI_API_KEY, prefix_cache=prefix_cache)
@@ -12,7 +12,13 @@ engine = create_engine(
     settings.database_url,  # URL de conexión (viene de settings.py)
     pool_pre_ping=True,  # Verifica que la conexión esté viva antes de usarla
     pool_recycle=3600,  # Recicla conexiones cada hora (3600 segundos) para evitar timeouts
-    echo=False  # Si es True, imprime todas las consultas SQL (usar solo para debug)
+    echo=False,  # Si es True, imprime todas las consultas SQL (usar solo para debug)
+    # SQLite (benchmarks): las sesiones se usan también desde hilos (asyncio.to_thread)
+    connect_args=(
+        {"check_same_thread": False, "timeout": 30}
+        if settings.database_url.startswith("sqlite")
+        else {}
+    ),
 )
 
 # ==================== SESSION MAKER ====================
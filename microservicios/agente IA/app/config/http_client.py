@@ -0,0 +1,168 @@
+# ==================== CLIENTE HTTP COMPARTIDO ====================
+# Un único httpx.AsyncClient para todo el tráfico saliente (Replicate, descargas de imágenes)
+#
+# - Se crea al arrancar la aplicación y se cierra al apagarla (lifespan en app/main.py)
+# - Mantiene conexiones vivas (keep-alive) entre peticiones: sin handshake TCP/TLS por generación
+# - Usa HTTP/2 si el paquete h2 está instalado
+# - Los timeouts se definen por operación (crear predicción, consultar estado, ...)
+import importlib.util
+import logging
+from typing import Optional
+
+import httpx
+
+from app.config.settings import settings
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+POOL_NAME = "shared"
+
+HTTP_REQUESTS_IN_FLIGHT = metrics.gauge(
+    "agent_http_pool_requests_in_flight",
+    "Peticiones HTTP salientes en curso en el pool compartido",
+    ("pool",),
+)
+HTTP_POOL_UTILIZATION = metrics.gauge(
+    "agent_http_pool_utilization_ratio",
+    "Peticiones en curso / máximo de conexiones del pool",
+    ("pool",),
+)
+HTTP_POOL_CONNECTIONS = metrics.gauge(
+    "agent_http_pool_connections",
+    "Conexiones abiertas del pool por estado (active, idle)",
+    ("pool", "state"),
+)
+HTTP_REQUESTS = metrics.counter(
+    "agent_http_requests_total",
+    "Peticiones HTTP salientes por host y clase de estado",
+    ("pool", "host", "status"),
+)
+
+
+class _ReleaseTrackingStream(httpx.AsyncByteStream):
+    """Cuerpo de respuesta que libera el contador de peticiones en curso al cerrarse"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            self._on_close()
+
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """Transporte con métricas de uso del pool (la petición cuenta hasta que se cierra su respuesta)"""
+
+    def __init__(self, transport: httpx.AsyncHTTPTransport, max_connections: int, pool: str = POOL_NAME):
+        self._transport = transport
+        self.max_connections = max_connections
+        self.pool = pool
+        self.in_flight = 0
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        HTTP_REQUESTS_IN_FLIGHT.set(self.in_flight, pool=self.pool)
+
+    def connection_counts(self) -> tuple[int, int]:
+        """(activas, ociosas) según el pool de httpcore; (0, 0) si no está disponible."""
+        # httpx no expone su pool; httpcore sí expone `connections` en el pool interno
+        connections = getattr(getattr(self._transport, "_pool", None), "connections", None) or []
+        idle = sum(1 for connection in connections if connection.is_idle())
+        return len(connections) - idle, idle
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.in_flight += 1
+        HTTP_REQUESTS_IN_FLIGHT.set(self.in_flight, pool=self.pool)
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            self._release()
+            HTTP_REQUESTS.inc(pool=self.pool, host=request.url.host, status="error")
+            raise
+
+        HTTP_REQUESTS.inc(pool=self.pool, host=request.url.host, status=f"{response.status_code // 100}xx")
+        response.stream = _ReleaseTrackingStream(response.stream, self._release)
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """Crea el cliente compartido con los límites de pool configurados."""
+    http2 = settings.HTTP2_ENABLED and _http2_available()
+    if settings.HTTP2_ENABLED and not http2:
+        logger.info("HTTP/2 deshabilitado: instala httpx[http2] para activarlo")
+
+    limits = httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    )
+    transport = InstrumentedTransport(
+        httpx.AsyncHTTPTransport(http2=http2, limits=limits, retries=0),
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+    )
+    HTTP_POOL_UTILIZATION.set_function(
+        lambda: transport.in_flight / max(1, transport.max_connections), pool=transport.pool
+    )
+    HTTP_POOL_CONNECTIONS.set_function(lambda: transport.connection_counts()[0], pool=transport.pool, state="active")
+    HTTP_POOL_CONNECTIONS.set_function(lambda: transport.connection_counts()[1], pool=transport.pool, state="idle")
+    return httpx.AsyncClient(transport=transport, timeout=operation_timeout("default"))
+
+
+def operation_timeout(operation: str) -> httpx.Timeout:
+    """
+    Timeout de una operación HTTP
+
+    El valor de HTTP_OPERATION_TIMEOUTS es el tiempo máximo de lectura; conexión y
+    espera de una conexión libre del pool tienen sus propios límites.
+    """
+    read_timeout = settings.http_operation_timeout(operation)
+    return httpx.Timeout(
+        read_timeout,
+        connect=settings.HTTP_CONNECT_TIMEOUT_SECONDS,
+        pool=settings.HTTP_POOL_TIMEOUT_SECONDS,
+    )
+
+
+async def start_http_client() -> None:
+    """Crea el cliente compartido (lifespan de la aplicación)."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_http_client()
+
+
+async def close_http_client() -> None:
+    """Cierra el cliente compartido y sus conexiones (lifespan de la aplicación)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Cliente HTTP compartido
+
+    Fuera del lifespan (scripts, consola) se crea bajo demanda y se reutiliza.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_http_client()
+    return _client
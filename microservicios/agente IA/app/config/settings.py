@@ -3,7 +3,7 @@
 # SettingsConfigDict: Para configurar cómo se leen las variables de entorno
 from pydantic_settings import BaseSettings, SettingsConfigDict
 # Optional: Indica que un valor puede ser None
-from typing import Optional
+from typing import Dict, Optional
 
 
 class Settings(BaseSettings):
@@ -27,6 +27,7 @@ class Settings(BaseSettings):
     DB_PASSWORD: str = ""  # Contraseña (vacía por defecto en desarrollo)
     DB_NAME: str = "CraftYourStyle_AgenteIA"  # Nombre de la base de datos
     DB_PORT: int = 3306  # Puerto de MySQL (3306 es el estándar)
+    DATABASE_URL: Optional[str] = None  # URL completa de SQLAlchemy; si se define reemplaza a DB_* (p. ej. sqlite:// en benchmarks)
     
     # ==================== CONFIGURACIÓN DEL SERVIDOR ====================
     PORT: int = 10105  # Puerto en el que escucha este microservicio
@@ -35,16 +36,114 @@ class Settings(BaseSettings):
     
     # ==================== API DE INTELIGENCIA ARTIFICIAL ====================
     # Gemini (Google AI) - Para el agente conversacional de IA
-    GEMINI_API_KEY: str  # API key de Google Gemini (obligatorio)
+    GEMINI_API_KEY: Optional[str] = None  # API key de Google Gemini (obligatorio con LLM_PROVIDER=mirascope)
     IMAGEN_MODEL: str = "imagen-4.0-generate-001"  # Modelo por defecto para generación de imágenes
     IMAGEN_FALLBACK_MODELS: str = "imagen-4.0-fast-generate-001,imagen-3.0-generate-002"  # Fallbacks separados por coma
-    
+
+    # Proveedor de LLM del orquestador
+    LLM_PROVIDER: str = "mirascope"  # mirascope (Gemini real) | local (determinista, sin red)
+    LLM_MODEL: str = "google/gemini-2.5-flash"  # Modelo principal (Mirascope usa "proveedor/modelo")
+    LLM_LOCAL_SEED: int = 0  # Semilla del proveedor local
+    LLM_LOCAL_LATENCY_DISTRIBUTION: str = "lognormal"  # fixed | uniform | lognormal
+    LLM_LOCAL_LATENCY_MS: Dict[str, float] = {  # Latencia media simulada por tipo de llamada ("default" para el resto)
+        "fashion_agent": 1200.0,
+        "design_prompt": 900.0,
+        "design_prompt_variants": 1300.0,
+        "analyze_image": 1500.0,
+        "tryon_guidance": 1000.0,
+        "session_summary": 600.0,
+    }
+    LLM_LOCAL_LATENCY_JITTER: float = 0.25  # Dispersión relativa (sigma en lognormal, +/- en uniform)
+    LLM_LOCAL_STREAM_CHUNK_MS: float = 15.0  # Pausa entre fragmentos al transmitir
+    LLM_LOCAL_RESPONSES_FILE: Optional[str] = None  # JSON {tipo_de_llamada: texto} que reemplaza las respuestas por defecto
+
+    # Cache de prefijos: los prompts de sistema estáticos se registran una vez en el proveedor
+    LLM_PROMPT_CACHE_ENABLED: bool = True
+    LLM_PROMPT_CACHE_TTL_SECONDS: int = 3600  # Vigencia del contenido cacheado en el proveedor
+    LLM_PROMPT_CACHE_REFRESH_MARGIN_SECONDS: int = 300  # Se extiende el TTL cuando falta menos que esto
+    # Mínimo cacheable de Gemini; prefijos más cortos van sin cache. Los prompts de sistema actuales
+    # (~200-350 tokens) quedan por debajo: en Gemini solo aplica la separación system/user
+    LLM_PROMPT_CACHE_MIN_TOKENS: int = 1024
+    LLM_PROMPT_CACHE_RETRY_SECONDS: int = 600  # Espera antes de reintentar un registro fallido
+
+    # Análisis de imágenes de referencia (se ejecutan en paralelo antes de responder)
+    IMAGE_ANALYSIS_MAX_CONCURRENCY: int = 4  # Máximo de análisis en vuelo por turno
+    IMAGE_ANALYSIS_TIMEOUT_SECONDS: float = 20.0  # Plazo por imagen; si se excede, la imagen se omite
+    IMAGE_ANALYSIS_CACHE_ENABLED: bool = True  # Reutiliza análisis de imágenes ya vistas
+    IMAGE_ANALYSIS_CACHE_TTL_SECONDS: int = 86400  # Vigencia de un análisis cacheado (24 horas)
+    IMAGE_ANALYSIS_CACHE_MAX_ENTRIES: int = 1024  # Máximo de análisis en memoria (LRU)
+    IMAGE_ANALYSIS_CACHE_PERSISTENT: bool = False  # Guarda también en la tabla cache_analisis_imagenes
+
+    # Memo de prompts de diseño (evita reescribir el mismo prompt en reintentos)
+    DESIGN_PROMPT_CACHE_ENABLED: bool = True  # False desactiva el memo para todas las llamadas
+    DESIGN_PROMPT_CACHE_TTL_SECONDS: int = 1800  # Vigencia de un prompt memorizado (30 minutos)
+    DESIGN_PROMPT_CACHE_MAX_ENTRIES: int = 256  # Máximo de prompts en memoria (LRU)
+
+    # Plazos y hedging de llamadas a Gemini (los diccionarios se leen como JSON desde el .env)
+    LLM_REQUEST_BUDGET_SECONDS: float = 45.0  # Presupuesto total de llamadas LLM por petición
+    LLM_CALL_TIMEOUTS: Dict[str, float] = {  # Timeout por tipo de llamada (segundos)
+        "fashion_agent": 30.0,
+        "design_prompt": 25.0,
+        "design_prompt_variants": 30.0,
+        "analyze_image": 20.0,
+        "tryon_guidance": 25.0,
+        "session_summary": 20.0,
+    }
+    LLM_HEDGE_PERCENTILES: Dict[str, float] = {  # Percentil de latencia tras el que se cubre con el respaldo (0 = sin hedging)
+        "fashion_agent": 0.95,
+        "design_prompt": 0.95,
+        "design_prompt_variants": 0.95,
+        "analyze_image": 0.9,
+        "tryon_guidance": 0.95,
+        "session_summary": 0.0,
+    }
+    LLM_HEDGE_MIN_SAMPLES: int = 20  # Muestras necesarias antes de usar el percentil observado
+    LLM_HEDGE_DEFAULT_DELAY_SECONDS: float = 10.0  # Umbral de hedging mientras no hay suficientes muestras
+    LLM_FALLBACK_MODEL: str = "google/gemini-2.5-flash-lite"  # Modelo de respaldo (vacío = sin respaldo)
+
+    # Variantes de diseño ("dos o tres opciones" en un mismo turno; cuentan como un solo uso)
+    DESIGN_VARIANTS_MAX: int = 3  # Máximo de opciones por turno
+    DESIGN_VARIANTS_MAX_CONCURRENCY: int = 3  # Predicciones de Replicate simultáneas por turno
+
+    # Cache de resultados de generación de diseño (mismo prompt final, referencias, formato y modelo)
+    DESIGN_RESULT_CACHE_ENABLED: bool = True  # False genera siempre una predicción nueva
+    DESIGN_RESULT_CACHE_TTL_SECONDS: int = 604800  # Vigencia de una imagen cacheada (7 días)
+    DESIGN_RESULT_CACHE_MAX_ENTRIES: int = 512  # Máximo de resultados en memoria (LRU)
+    DESIGN_RESULT_CACHE_PERSISTENT: bool = True  # Guarda también en la tabla cache_generaciones_diseno
+
+    # Resumen incremental del diseño por sesión (reemplaza al historial completo en los prompts)
+    SESSION_SUMMARY_ENABLED: bool = True
+
     # ==================== ALMACENAMIENTO DE IMÁGENES ====================
+    STORAGE_BACKEND: str = "cloudinary"  # cloudinary | local (disco servido por la app; desarrollo y benchmarks sin credenciales)
+    STORAGE_LOCAL_ROOT: str = "media"  # Directorio de las imágenes con STORAGE_BACKEND=local
+    STORAGE_LOCAL_PUBLIC_URL: str = "http://localhost:10105/media"  # URL base pública; su ruta es donde se montan los archivos
+
     # Cloudinary - Servicio en la nube para almacenar imágenes
     # Usado para guardar fotos de usuarios y diseños personalizados
     CLOUDINARY_CLOUD_NAME: Optional[str] = None  # Nombre de tu cloud
     CLOUDINARY_API_KEY: Optional[str] = None  # Tu API key
     CLOUDINARY_API_SECRET: Optional[str] = None  # Tu API secret
+    STORAGE_MAX_WORKERS: int = 8  # Subidas/borrados simultáneos (hilos dedicados; el resto espera en cola)
+    STORAGE_UPLOAD_CHUNK_BYTES: int = 6 * 1024 * 1024  # Trozo de las subidas por stream (Cloudinary exige >= 5 MB salvo el último)
+    UPLOAD_MAX_BYTES: int = 10 * 1024 * 1024  # Tamaño máximo de una imagen subida por el usuario
+    UPLOAD_DEDUP_ENABLED: bool = True  # Fotos y referencias repetidas (mismo SHA-256 y usuario) reutilizan la URL ya subida
+    REFERENCE_BATCH_MAX_FILES: int = 10  # Archivos por petición en POST /images/references/batch
+    REFERENCE_BATCH_MAX_CONCURRENCY: int = 4  # Subidas simultáneas de un mismo lote
+    UPLOAD_HASH_MEMORY_ENTRIES: int = 4096  # URLs con hash de contenido conocido en memoria (claves de los caches de análisis y generación)
+
+    # Derivadas WebP de cada imagen estabilizada (las genera Cloudinary al subir; el backend local no tiene; ver app/config/storage.py)
+    IMAGE_DERIVATIVES_ENABLED: bool = True
+    IMAGE_THUMBNAIL_SIZE: int = 256  # Lado (px) de la miniatura cuadrada (historial, galería)
+    IMAGE_MEDIUM_SIZE: int = 768  # Lado máximo (px) del tamaño medio (vista de detalle)
+
+    # Normalización de fotos de persona y de referencia antes de subirlas (ver app/utils/image_normalization.py)
+    IMAGE_NORMALIZE_ENABLED: bool = True
+    IMAGE_NORMALIZE_MAX_EDGE: int = 2048  # Lado máximo (px) de la foto almacenada (suficiente para try-on y edición)
+    IMAGE_NORMALIZE_FORMAT: str = "jpeg"  # "jpeg" o "webp" (tamaño parecido, pero codificar WebP cuesta varias veces más CPU)
+    IMAGE_NORMALIZE_QUALITY: int = 85
+    IMAGE_NORMALIZE_WORKERS: int = 2  # Procesos dedicados a decodificar/recodificar (CPU)
+    IMAGE_NORMALIZE_MAX_INPUT_BYTES: int = 25 * 1024 * 1024  # Tamaño máximo de una foto que se normaliza (sustituye a UPLOAD_MAX_BYTES)
     
     # ==================== MODELOS DE MACHINE LEARNING ====================
     # Replicate - Plataforma para ejecutar modelos de IA
@@ -56,6 +155,45 @@ class Settings(BaseSettings):
         "0452664a003fbcc9bd2b9dbe31207b6bde4fb33932a226d67b72a28e5306bf77"
     )
     REPLICATE_TRYON_DEFAULT_CATEGORY: str = "upper_body"
+    REPLICATE_API_BASE_URL: str = "https://api.replicate.com/v1"  # Cambiable para apuntar a un Replicate falso local
+    REPLICATE_SYNC_WAIT_SECONDS: int = 60  # "Prefer: wait" al crear (0 = siempre asíncrono; se omite si el cliente puede desconectarse)
+
+    # Finalización de predicciones: webhook de Replicate con consulta de estado como respaldo
+    # URL pública de POST /webhooks/replicate (vacía = sin webhook, solo consulta de estado)
+    REPLICATE_WEBHOOK_URL: Optional[str] = None
+    REPLICATE_WEBHOOK_SECRET: Optional[str] = None  # "whsec_..." de la cuenta de Replicate (verifica la firma)
+    REPLICATE_WEBHOOK_TOLERANCE_SECONDS: int = 300  # Antigüedad máxima aceptada de un webhook firmado
+    REPLICATE_POLL_INITIAL_SECONDS: float = 0.5  # Primera consulta de estado sin webhook
+    REPLICATE_WEBHOOK_POLL_INITIAL_SECONDS: float = 5.0  # Primera consulta de respaldo si se espera un webhook
+    REPLICATE_POLL_MAX_SECONDS: float = 5.0  # Intervalo máximo entre consultas de estado
+    REPLICATE_POLL_BACKOFF: float = 1.6  # Factor de crecimiento del intervalo entre consultas
+    REPLICATE_DESIGN_MAX_WAIT_SECONDS: float = 120.0  # Espera máxima de una generación de diseño
+    REPLICATE_TRYON_MAX_WAIT_SECONDS: float = 180.0  # Espera máxima de un try-on
+
+    # Trabajos de generación asíncronos (cabecera "Prefer: respond-async" -> 202 + /jobs/{id})
+    JOB_WORKERS: int = 4  # Generaciones ejecutándose a la vez por proceso
+    JOB_QUEUE_MAX_SIZE: int = 100  # Trabajos en espera admitidos; por encima se responde 503
+    JOB_TIMEOUT_SECONDS: float = 300.0  # Duración máxima de un trabajo
+    JOB_MAX_ATTEMPTS: int = 2  # Ejecuciones máximas de un trabajo de diseño interrumpido por un reinicio
+    JOB_EVENTS_POLL_SECONDS: float = 2.0  # Relectura del estado en SSE si el trabajo corre en otro proceso
+    JOB_EVENTS_KEEPALIVE_SECONDS: float = 15.0  # Comentario SSE para mantener viva la conexión
+
+    # ==================== CLIENTE HTTP SALIENTE ====================
+    # Cliente httpx compartido para Replicate y descargas (se crea en el lifespan de la app)
+    HTTP2_ENABLED: bool = True  # Usa HTTP/2 si el paquete h2 está instalado
+    HTTP_MAX_CONNECTIONS: int = 50  # Conexiones simultáneas máximas del pool
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20  # Conexiones ociosas que se mantienen abiertas
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 60.0  # Tiempo que una conexión ociosa sigue viva
+    HTTP_CONNECT_TIMEOUT_SECONDS: float = 10.0  # Plazo para abrir una conexión
+    HTTP_POOL_TIMEOUT_SECONDS: float = 10.0  # Espera máxima por una conexión libre del pool
+    HTTP_OPERATION_TIMEOUTS: Dict[str, float] = {  # Timeout de lectura por operación (segundos)
+        "default": 30.0,
+        "replicate_create": 90.0,  # Incluye la espera síncrona "Prefer: wait=60"
+        "replicate_poll": 15.0,
+        "replicate_cancel": 10.0,
+        "reference_prefetch": 5.0,  # HEAD a las imágenes de referencia antes de generar
+        "storage_download": 60.0,  # Descarga de imágenes remotas con STORAGE_BACKEND=local
+    }
     
     # ==================== MENSAJERÍA ENTRE MICROSERVICIOS ====================
     # RabbitMQ - Sistema de colas para comunicación asíncrona entre microservicios
@@ -89,12 +227,28 @@ class Settings(BaseSettings):
         Returns:
             str: URL completa de conexión
         """
+        if self.DATABASE_URL:
+            return self.DATABASE_URL
         return f"mysql+pymysql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
 
     @property
     def cors_origins_list(self) -> list[str]:
         return [origin.strip().rstrip("/") for origin in self.CORS_ORIGINS.split(",") if origin.strip()]
 
+    def llm_call_timeout(self, call_type: str) -> float:
+        return self.LLM_CALL_TIMEOUTS.get(call_type, self.LLM_REQUEST_BUDGET_SECONDS)
+
+    def llm_hedge_percentile(self, call_type: str) -> float:
+        return self.LLM_HEDGE_PERCENTILES.get(call_type, 0.0)
+
+    def http_operation_timeout(self, operation: str) -> float:
+        return self.HTTP_OPERATION_TIMEOUTS.get(operation, self.HTTP_OPERATION_TIMEOUTS.get("default", 30.0))
+
+    @property
+    def replicate_webhooks_enabled(self) -> bool:
+        # Sin secreto no se puede verificar la firma: no se piden webhooks
+        return bool(self.REPLICATE_WEBHOOK_URL and self.REPLICATE_WEBHOOK_SECRET)
+
     @property
     def is_production(self) -> bool:
         return self.ENVIRONMENT.lower() in {"production", "prod"}
@@ -102,6 +256,12 @@ class Settings(BaseSettings):
     def model_post_init(self, __context) -> None:
         if self.is_production and not self.JWT_SECRET:
             raise ValueError("JWT_SECRET es obligatorio cuando ENVIRONMENT=production")
+        if self.LLM_PROVIDER not in {"mirascope", "local"}:
+            raise ValueError("LLM_PROVIDER debe ser 'mirascope' o 'local'")
+        if self.LLM_PROVIDER == "mirascope" and not self.GEMINI_API_KEY:
+            raise ValueError("GEMINI_API_KEY es obligatorio cuando LLM_PROVIDER=mirascope")
+        if self.STORAGE_BACKEND not in {"cloudinary", "local"}:
+            raise ValueError("STORAGE_BACKEND debe ser 'cloudinary' o 'local'")
 
 
 # ==================== INSTANCIA GLOBAL ====================
@@ -1,82 +1,418 @@
+"""
+Almacenamiento de imágenes
+
+Los servicios no hablan con Cloudinary directamente: usan el backend configurado
+en STORAGE_BACKEND a través de la instancia global `storage`.
+
+1. CloudinaryStorage: Cloudinary (producción); derivadas WebP generadas por su CDN
+2. LocalStorage: disco local servido por la propia aplicación (ruta estática de
+   STORAGE_LOCAL_PUBLIC_URL), para desarrollo, benchmarks y pruebas de carga sin
+   credenciales
+
+Ambos devuelven el mismo dict al subir: url, public_id, width, height,
+thumbnail_url y medium_url.
+"""
+import asyncio
+import base64
+import binascii
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Optional, TypeVar
+from urllib.parse import urlparse
+
 import cloudinary
 import cloudinary.uploader
+import cloudinary.utils
+import httpx
+
+from app.config.http_client import get_http_client, operation_timeout
 from app.config.settings import settings
+from app.utils.metrics import metrics
+from app.utils.uploads import SNIFF_BYTES, sniff_image_type
 
-# Configurar Cloudinary
-if settings.CLOUDINARY_CLOUD_NAME:
-    cloudinary.config(
-        cloud_name=settings.CLOUDINARY_CLOUD_NAME,
-        api_key=settings.CLOUDINARY_API_KEY,
-        api_secret=settings.CLOUDINARY_API_SECRET
-    )
+T = TypeVar("T")
 
+# ==================== POOL DE HILOS DE ALMACENAMIENTO ====================
+# El SDK de Cloudinary es síncrono (urllib3) y la escritura en disco también bloquea:
+# llamadas desde una corrutina bloquearían el event loop durante toda la subida. Cada
+# llamada corre en un pool de hilos propio y acotado, separado del pool por defecto de
+# asyncio (BD, to_thread); si todos los hilos están ocupados, las llamadas esperan en cola.
+STORAGE_QUEUED = metrics.gauge(
+    "agent_storage_queued_operations",
+    "Operaciones de almacenamiento esperando un hilo libre",
+)
+STORAGE_IN_FLIGHT = metrics.gauge(
+    "agent_storage_operations_in_flight",
+    "Operaciones de almacenamiento en curso",
+)
+STORAGE_QUEUE_WAIT = metrics.histogram(
+    "agent_storage_queue_wait_seconds",
+    "Espera en cola antes de que un hilo tome la operación de almacenamiento",
+    ("operation",),
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+STORAGE_DURATION = metrics.histogram(
+    "agent_storage_operation_seconds",
+    "Duración de las operaciones de almacenamiento por operación y resultado",
+    ("operation", "outcome"),
+)
 
-async def upload_image(file_path: str, folder: str = "craftyourstyle") -> dict:
+_storage_executor = ThreadPoolExecutor(
+    max_workers=settings.STORAGE_MAX_WORKERS,
+    thread_name_prefix="storage",
+)
+
+
+async def _run_in_storage_pool(operation: str, function: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Ejecuta una llamada bloqueante del SDK en el pool de almacenamiento."""
+    queued_at = time.perf_counter()
+    STORAGE_QUEUED.inc()
+
+    def call() -> T:
+        started_at = time.perf_counter()
+        STORAGE_QUEUED.dec()
+        STORAGE_IN_FLIGHT.inc()
+        STORAGE_QUEUE_WAIT.observe(started_at - queued_at, operation=operation)
+        outcome = "error"
+        try:
+            result = function(*args, **kwargs)
+            outcome = "ok"
+            return result
+        finally:
+            STORAGE_IN_FLIGHT.dec()
+            STORAGE_DURATION.observe(time.perf_counter() - started_at, operation=operation, outcome=outcome)
+
+    future = _storage_executor.submit(call)
+    try:
+        return await asyncio.wrap_future(future)
+    except asyncio.CancelledError:
+        # Si aún no había empezado no llegará a correr: sale de la cola aquí
+        if future.cancel():
+            STORAGE_QUEUED.dec()
+        raise
+
+
+# ==================== DERIVADAS (CLOUDINARY) ====================
+# Miniatura y tamaño medio en WebP para listados: la imagen original (PNG a tamaño
+# completo) se conserva para producción. Cloudinary las genera a partir de la URL;
+# al subir se piden "eager" en segundo plano para que la primera visita no espere.
+DELIVERY_SEGMENT = "/image/upload/"
+DERIVATIVE_FORMAT = "webp"
+DERIVATIVE_FORMATS_REPLACED = {"png", "jpg", "jpeg", "webp", "gif", "bmp", "tiff", "avif", "heic"}
+
+
+def _derivative_transformations() -> Dict[str, str]:
+    thumbnail = settings.IMAGE_THUMBNAIL_SIZE
+    medium = settings.IMAGE_MEDIUM_SIZE
+    return {
+        "thumbnail_url": f"c_fill,g_auto,w_{thumbnail},h_{thumbnail},q_auto",
+        "medium_url": f"c_limit,w_{medium},h_{medium},q_auto",
+    }
+
+
+def _no_derivatives() -> Dict[str, Optional[str]]:
+    return {name: None for name in _derivative_transformations()}
+
+
+def derivative_urls(image_url: Optional[str]) -> Dict[str, Optional[str]]:
     """
-    Sube una imagen a Cloudinary
-    
-    Args:
-        file_path: Ruta local del archivo
-        folder: Carpeta en Cloudinary
-        
+    URLs de las derivadas WebP de una imagen de Cloudinary
+
     Returns:
-        dict con url, public_id, etc.
+        {"thumbnail_url": ..., "medium_url": ...}; valores None si la imagen no
+        está en Cloudinary o las derivadas están desactivadas
     """
-    try:
-        result = cloudinary.uploader.upload(
-            file_path,
-            folder=folder,
-            resource_type="image"
+    transformations = _derivative_transformations()
+    prefix, segment, asset = (image_url or "").partition(DELIVERY_SEGMENT)
+    if not settings.IMAGE_DERIVATIVES_ENABLED or not segment or not asset:
+        return _no_derivatives()
+
+    stem, dot, extension = asset.rpartition(".")
+    if dot and extension.lower() in DERIVATIVE_FORMATS_REPLACED:
+        asset = stem
+    return {
+        name: f"{prefix}{DELIVERY_SEGMENT}{transformation}/{asset}.{DERIVATIVE_FORMAT}"
+        for name, transformation in transformations.items()
+    }
+
+
+def _eager_derivatives() -> dict:
+    """Opciones de subida que piden las derivadas en segundo plano (eager_async)."""
+    if not settings.IMAGE_DERIVATIVES_ENABLED:
+        return {}
+    return {
+        "eager": [
+            {"raw_transformation": transformation, "format": DERIVATIVE_FORMAT}
+            for transformation in _derivative_transformations().values()
+        ],
+        "eager_async": True,
+    }
+
+
+# ==================== BACKENDS ====================
+class StorageBackend(ABC):
+    """
+    Interfaz común de los backends de almacenamiento
+
+    - put: sube el contenido de un archivo abierto
+    - put_remote: guarda una copia estable de una imagen remota (URL http(s) o data URI)
+    - delete: elimina una imagen por su public_id
+    - url_for: URL pública de un public_id
+    - derivatives: URLs de miniatura y tamaño medio de una URL del backend
+    - owns: si una URL ya está guardada en este backend (no hace falta copiarla)
+    """
+
+    name = "base"
+
+    @abstractmethod
+    async def put(self, stream: BinaryIO, folder: str = "craftyourstyle", filename: Optional[str] = None) -> dict:
+        ...
+
+    @abstractmethod
+    async def put_remote(self, source: str, folder: str = "craftyourstyle") -> dict:
+        ...
+
+    @abstractmethod
+    async def delete(self, public_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def url_for(self, public_id: str) -> str:
+        ...
+
+    def derivatives(self, image_url: Optional[str]) -> Dict[str, Optional[str]]:
+        return _no_derivatives()
+
+    def owns(self, image_url: Optional[str]) -> bool:
+        return False
+
+
+class CloudinaryStorage(StorageBackend):
+    """Cloudinary: SDK síncrono en el pool de almacenamiento, derivadas por transformación de URL"""
+
+    name = "cloudinary"
+
+    def __init__(self):
+        if settings.CLOUDINARY_CLOUD_NAME:
+            cloudinary.config(
+                cloud_name=settings.CLOUDINARY_CLOUD_NAME,
+                api_key=settings.CLOUDINARY_API_KEY,
+                api_secret=settings.CLOUDINARY_API_SECRET
+            )
+        # urllib3 guarda por defecto una sola conexión por host: con varios hilos el resto
+        # se abre y se descarta en cada subida. Una por hilo mantiene el keep-alive.
+        cloudinary.uploader._http = cloudinary.utils.get_http_connector(
+            cloudinary.config(),
+            {**cloudinary.CERT_KWARGS, "maxsize": settings.STORAGE_MAX_WORKERS},
         )
+
+    @staticmethod
+    def _upload_result(result: dict) -> dict:
+        url = result.get("secure_url")
         return {
-            "url": result.get("secure_url"),
+            "url": url,
             "public_id": result.get("public_id"),
             "width": result.get("width"),
-            "height": result.get("height")
+            "height": result.get("height"),
+            **derivative_urls(url),
         }
-    except Exception as e:
-        raise Exception(f"Error al subir imagen: {str(e)}")
 
+    async def put(self, stream: BinaryIO, folder: str = "craftyourstyle", filename: Optional[str] = None) -> dict:
+        """
+        Sube a Cloudinary el contenido de un archivo abierto, por trozos
+
+        Se envía en trozos de STORAGE_UPLOAD_CHUNK_BYTES (subida "large" con
+        Content-Range): la memoria usada no depende del tamaño del archivo y no se
+        escribe ningún archivo temporal. El stream debe admitir seek (para medirlo).
+        """
+        try:
+            result = await _run_in_storage_pool(
+                "upload",
+                cloudinary.uploader.upload_large,
+                stream,
+                folder=folder,
+                resource_type="image",
+                chunk_size=settings.STORAGE_UPLOAD_CHUNK_BYTES,
+                filename=filename or "upload",
+                **_eager_derivatives()
+            )
+            return self._upload_result(result)
+        except Exception as e:
+            raise Exception(f"Error al subir imagen: {str(e)}")
+
+    async def put_remote(self, source: str, folder: str = "craftyourstyle") -> dict:
+        """Cloudinary descarga la imagen por su cuenta (acepta URLs y data URIs)."""
+        try:
+            result = await _run_in_storage_pool(
+                "upload_remote",
+                cloudinary.uploader.upload,
+                source,
+                folder=folder,
+                resource_type="image",
+                **_eager_derivatives()
+            )
+            return self._upload_result(result)
+        except Exception as e:
+            raise Exception(f"Error al subir imagen remota: {str(e)}")
+
+    async def delete(self, public_id: str) -> bool:
+        try:
+            result = await _run_in_storage_pool("delete", cloudinary.uploader.destroy, public_id)
+            return result.get("result") == "ok"
+        except Exception as e:
+            raise Exception(f"Error al eliminar imagen: {str(e)}")
 
-async def upload_remote_image(image_url: str, folder: str = "craftyourstyle") -> dict:
+    def url_for(self, public_id: str) -> str:
+        return cloudinary.utils.cloudinary_url(public_id, resource_type="image", secure=True)[0]
+
+    def derivatives(self, image_url: Optional[str]) -> Dict[str, Optional[str]]:
+        return derivative_urls(image_url)
+
+    def owns(self, image_url: Optional[str]) -> bool:
+        return "res.cloudinary.com" in (image_url or "")
+
+
+class LocalStorage(StorageBackend):
     """
-    Sube una imagen remota a Cloudinary a partir de su URL.
+    Disco local bajo STORAGE_LOCAL_ROOT, servido en STORAGE_LOCAL_PUBLIC_URL
 
-    Args:
-        image_url: URL pública de la imagen remota
-        folder: Carpeta en Cloudinary
+    Cada archivo se escribe en un temporal del mismo directorio y se renombra al
+    terminar (os.replace): quien lo sirva nunca ve un archivo a medio escribir. El
+    public_id es la ruta relativa (carpeta/nombre.ext). No genera derivadas: los
+    listados usan la imagen original.
 
-    Returns:
-        dict con url, public_id, etc.
+    Las URLs deben ser alcanzables por quien las descargue (Replicate): sirve para
+    el Replicate falso de benchmarks o con una URL pública (túnel) en desarrollo.
     """
-    try:
-        result = cloudinary.uploader.upload(
-            image_url,
-            folder=folder,
-            resource_type="image"
-        )
+
+    name = "local"
+
+    EXTENSIONS = {
+        "image/png": ".png",
+        "image/jpeg": ".jpg",
+        "image/gif": ".gif",
+        "image/webp": ".webp",
+        "image/heic": ".heic",
+        "image/heif": ".heif",
+        "image/avif": ".avif",
+    }
+    COPY_BUFFER_BYTES = 1024 * 1024
+
+    def __init__(self, root: str, public_url: str):
+        self.root = Path(root).resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.public_url = public_url.rstrip("/")
+
+    @property
+    def route_path(self) -> str:
+        """Ruta de la aplicación donde se montan los archivos (ver app/main.py)."""
+        return urlparse(self.public_url).path or "/"
+
+    def _path_for(self, public_id: str) -> Path:
+        path = (self.root / public_id).resolve()
+        if not path.is_relative_to(self.root):
+            raise ValueError(f"public_id fuera del almacenamiento: {public_id}")
+        return path
+
+    def _new_public_id(self, folder: str, head: bytes, filename: Optional[str]) -> str:
+        extension = self.EXTENSIONS.get(sniff_image_type(head) or "")
+        if extension is None:
+            extension = Path(filename or "").suffix.lower() or ".bin"
+        return f"{folder.strip('/')}/{uuid.uuid4().hex[:20]}{extension}".lstrip("/")
+
+    def _write_atomic(self, public_id: str, write: Callable[[BinaryIO], None]) -> dict:
+        path = self._path_for(public_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        descriptor, temp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as temp_file:
+                write(temp_file)
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+            os.replace(temp_path, path)
+        except BaseException:
+            with suppress(FileNotFoundError):
+                os.unlink(temp_path)
+            raise
         return {
-            "url": result.get("secure_url"),
-            "public_id": result.get("public_id"),
-            "width": result.get("width"),
-            "height": result.get("height")
+            "url": self.url_for(public_id),
+            "public_id": public_id,
+            "width": None,
+            "height": None,
+            **_no_derivatives(),
         }
-    except Exception as e:
-        raise Exception(f"Error al subir imagen remota: {str(e)}")
 
+    def _put_sync(self, stream: BinaryIO, folder: str, filename: Optional[str]) -> dict:
+        head = stream.read(SNIFF_BYTES)
+        public_id = self._new_public_id(folder, head, filename)
 
-async def delete_image(public_id: str) -> bool:
-    """
-    Elimina una imagen de Cloudinary
-    
-    Args:
-        public_id: ID público de la imagen en Cloudinary
-        
-    Returns:
-        True si se eliminó correctamente
-    """
-    try:
-        result = cloudinary.uploader.destroy(public_id)
-        return result.get("result") == "ok"
-    except Exception as e:
-        raise Exception(f"Error al eliminar imagen: {str(e)}")
+        def write(target: BinaryIO) -> None:
+            target.write(head)
+            shutil.copyfileobj(stream, target, self.COPY_BUFFER_BYTES)
+
+        return self._write_atomic(public_id, write)
+
+    def _put_bytes_sync(self, data: bytes, folder: str) -> dict:
+        public_id = self._new_public_id(folder, data[:SNIFF_BYTES], None)
+        return self._write_atomic(public_id, lambda target: target.write(data))
+
+    async def put(self, stream: BinaryIO, folder: str = "craftyourstyle", filename: Optional[str] = None) -> dict:
+        try:
+            return await _run_in_storage_pool("upload", self._put_sync, stream, folder, filename)
+        except Exception as e:
+            raise Exception(f"Error al subir imagen: {str(e)}")
+
+    async def put_remote(self, source: str, folder: str = "craftyourstyle") -> dict:
+        """Descarga la imagen (cliente HTTP compartido) o decodifica el data URI y la guarda."""
+        try:
+            if source.startswith("data:"):
+                _, _, payload = source.partition(",")
+                data = base64.b64decode(payload, validate=True)
+            else:
+                response = await get_http_client().get(
+                    source,
+                    follow_redirects=True,
+                    timeout=operation_timeout("storage_download"),
+                )
+                response.raise_for_status()
+                data = response.content
+            return await _run_in_storage_pool("upload_remote", self._put_bytes_sync, data, folder)
+        except (httpx.HTTPError, binascii.Error, OSError, ValueError) as e:
+            raise Exception(f"Error al subir imagen remota: {str(e)}")
+
+    async def delete(self, public_id: str) -> bool:
+        def remove() -> bool:
+            try:
+                self._path_for(public_id).unlink()
+            except FileNotFoundError:
+                return False
+            return True
+
+        try:
+            return await _run_in_storage_pool("delete", remove)
+        except Exception as e:
+            raise Exception(f"Error al eliminar imagen: {str(e)}")
+
+    def url_for(self, public_id: str) -> str:
+        return f"{self.public_url}/{public_id}"
+
+    def owns(self, image_url: Optional[str]) -> bool:
+        return (image_url or "").startswith(f"{self.public_url}/")
+
+
+def build_storage() -> StorageBackend:
+    """Crea el backend configurado en STORAGE_BACKEND."""
+    if settings.STORAGE_BACKEND == "local":
+        return LocalStorage(settings.STORAGE_LOCAL_ROOT, settings.STORAGE_LOCAL_PUBLIC_URL)
+    return CloudinaryStorage()
+
+
+# ==================== INSTANCIA GLOBAL ====================
+storage = build_storage()
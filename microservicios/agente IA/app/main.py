@@ -1,22 +1,60 @@
 # ==================== IMPORTS ====================
+# asynccontextmanager - Para definir el ciclo de vida (arranque/apagado) de la aplicación
+from contextlib import asynccontextmanager
 # FastAPI - Framework web moderno y rápido para crear APIs
 from fastapi import FastAPI
 # CORSMiddleware - Middleware para manejar CORS (Cross-Origin Resource Sharing)
 from fastapi.middleware.cors import CORSMiddleware
+# PlainTextResponse - Respuesta de texto plano (formato de Prometheus)
+from fastapi.responses import PlainTextResponse
+# StaticFiles - Sirve las imágenes del almacenamiento local
+from fastapi.staticfiles import StaticFiles
 # Importa todos los routers (grupos de endpoints)
-from app.routes import chat_router, images_router, tryon_router, legacy_generate_router
+from app.routes import chat_router, images_router, tryon_router, legacy_generate_router, webhooks_router, jobs_router
 # Importa la configuración de la aplicación
 from app.config.settings import settings
+# Registro de métricas del proceso (llamadas al LLM, etc.)
+from app.utils.metrics import metrics
+# Cliente HTTP compartido (pool de conexiones hacia Replicate y otros servicios externos)
+from app.config.http_client import close_http_client, start_http_client
+# Backend de almacenamiento de imágenes (Cloudinary o disco local)
+from app.config.storage import LocalStorage, storage
+# Pool de workers de los trabajos de generación asíncronos
+from app.services import job_runner
+# Procesos que normalizan las fotos subidas
+from app.utils.image_normalization import shutdown_normalization_pool
 # Uvicorn - Servidor ASGI para correr la aplicación FastAPI
 import uvicorn
 
+# ==================== CICLO DE VIDA ====================
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Recursos que viven mientras la aplicación está encendida
+
+    - Cliente HTTP compartido: se abre al arrancar y se cierra (con sus conexiones) al apagar
+    - Workers de trabajos de generación: recuperan los trabajos pendientes al arrancar;
+      al apagar, los trabajos en curso vuelven a quedar pendientes
+    - Procesos de normalización de fotos: se crean con la primera subida y se detienen al apagar
+    """
+    await start_http_client()
+    await job_runner.start()
+    try:
+        yield
+    finally:
+        await job_runner.stop()
+        await close_http_client()
+        shutdown_normalization_pool()
+
+
 # ==================== CREAR APLICACIÓN FASTAPI ====================
 # Crea la instancia principal de la aplicación FastAPI
 # Esta aplicación es el punto de entrada de todo el microservicio
 app = FastAPI(
     title="CraftYourStyle - AI Agent API",  # Nombre que aparece en la documentación
     description="Microservicio de agente de IA para personalización de moda",  # Descripción
-    version="1.0.0"  # Versión del API
+    version="1.0.0",  # Versión del API
+    lifespan=lifespan  # Arranque y apagado de recursos compartidos
 )
 # FastAPI automáticamente genera documentación en:
 # - http://localhost:10105/docs (Swagger UI)
@@ -42,6 +80,12 @@ app.include_router(chat_router)  # Endpoints de chat: /chat/*
 app.include_router(images_router)  # Endpoints de imágenes: /images/*
 app.include_router(tryon_router)  # Endpoints de virtual try-on: /tryon/*
 app.include_router(legacy_generate_router)  # Endpoint legacy: /generate
+app.include_router(webhooks_router)  # Avisos de servicios externos: /webhooks/*
+app.include_router(jobs_router)  # Trabajos de generación asíncronos: /jobs/*
+
+# Con STORAGE_BACKEND=local las imágenes se sirven desde aquí (p. ej. /media/users/1/photos/...)
+if isinstance(storage, LocalStorage):
+    app.mount(storage.route_path, StaticFiles(directory=storage.root), name="media")
 
 
 # ==================== ENDPOINTS PRINCIPALES ====================
@@ -77,6 +121,20 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """
+    Métricas en formato de texto de Prometheus
+
+    Incluye por tipo de llamada al LLM: conteo por resultado, tiempo total,
+    tiempo hasta el primer token y tokens de entrada/salida.
+
+    Returns:
+        str: Métricas en formato de exposición de Prometheus
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 # ==================== PUNTO DE ENTRADA ====================
 # Este bloque solo se ejecuta si corres el archivo directamente: python app/main.py
 # Si importas main.py desde otro archivo, este bloque NO se ejecuta
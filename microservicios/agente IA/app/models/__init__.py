@@ -5,6 +5,10 @@ from .foto_usuario import FotoUsuario
 from .prueba_virtual import PruebaVirtual
 from .personalizacion import Personalizacion
 from .uso_agente import UsoAgenteIA, TipoUsoAgente
+from .analisis_imagen import AnalisisImagenCache
+from .generacion_cache import GeneracionDisenoCache
+from .trabajo_generacion import TrabajoGeneracion, TipoTrabajo, EstadoTrabajo
+from .subida_usuario import SubidaUsuario
 
 __all__ = [
     "SesionIA",
@@ -19,4 +23,10 @@ __all__ = [
     "Personalizacion",
     "UsoAgenteIA",
     "TipoUsoAgente",
+    "AnalisisImagenCache",
+    "GeneracionDisenoCache",
+    "TrabajoGeneracion",
+    "TipoTrabajo",
+    "EstadoTrabajo",
+    "SubidaUsuario",
 ]
@@ -0,0 +1,14 @@
+from sqlalchemy import Column, String, Text, DateTime
+from datetime import datetime
+from app.config.database import Base
+
+
+class AnalisisImagenCache(Base):
+    """Resultado del análisis de una imagen, indexado por URL normalizada o hash de contenido."""
+    __tablename__ = "cache_analisis_imagenes"
+
+    clave = Column(String(64), primary_key=True)
+    image_url = Column(Text, nullable=True)
+    analisis = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expira_en = Column(DateTime, nullable=False, index=True)
@@ -0,0 +1,15 @@
+from sqlalchemy import Column, String, Text, DateTime
+from datetime import datetime
+from app.config.database import Base
+
+
+class GeneracionDisenoCache(Base):
+    """URL estabilizada de una generación de diseño, indexada por hash de sus entradas."""
+    __tablename__ = "cache_generaciones_diseno"
+
+    # SHA-256 de (prompt final, referencias normalizadas, aspect ratio, modelo)
+    clave = Column(String(64), primary_key=True)
+    image_url = Column(Text, nullable=False)
+    modelo = Column(String(100), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expira_en = Column(DateTime, nullable=False, index=True)
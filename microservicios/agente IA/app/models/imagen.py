@@ -21,6 +21,9 @@ class Imagen(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     id_user = Column(Integer, nullable=True)
     image_url = Column(String(255), nullable=False)
+    # Derivadas WebP para listados (ver app/config/storage.py)
+    thumbnail_url = Column(String(512), nullable=True)
+    medium_url = Column(String(512), nullable=True)
     variant_id = Column(Integer, nullable=True)
     tipo = Column(
         Enum(TipoImagen, values_callable=lambda obj: [e.value for e in obj]),
@@ -1,6 +1,6 @@
 # ==================== IMPORTS ====================
 # SQLAlchemy - Imports para definir columnas y tipos de datos
-from sqlalchemy import Column, Integer, String, DateTime, Enum
+from sqlalchemy import Column, Integer, String, DateTime, Enum, JSON
 # relationship - Para definir relaciones entre tablas (sesiones tienen mensajes)
 from sqlalchemy.orm import relationship
 # datetime - Para manejar fechas y horas
@@ -79,6 +79,16 @@ class SesionIA(Base):
     # Por defecto es ACTIVA cuando se crea
     estado = Column(Enum(EstadoSesion), default=EstadoSesion.activa)
     
+    # Resumen incremental del estado del diseño (color, logo, ubicación, patrón, notas)
+    # Se actualiza después de cada turno, fuera del camino de la petición,
+    # y reemplaza al historial completo como contexto del agente
+    # Ejemplo: {"color": "azul marino", "logo": "escudo", "ubicacion": "pecho izquierdo", "patron": null}
+    resumen_diseno = Column(JSON, nullable=True)
+    
+    # Fecha del último mensaje incorporado al resumen: los mensajes posteriores
+    # todavía no están resumidos y se agregan literalmente al contexto
+    resumen_actualizado_en = Column(DateTime, nullable=True)
+    
     # ==================== RELACIONES ====================
     
     # Relación con la tabla mensajes_ia
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, String, DateTime, UniqueConstraint
+from datetime import datetime
+from app.config.database import Base
+
+
+class SubidaUsuario(Base):
+    """Imagen ya subida por un usuario, indexada por el SHA-256 de su contenido original."""
+    __tablename__ = "subidas_usuario"
+    __table_args__ = (
+        UniqueConstraint("id_user", "content_hash", name="uq_subidas_usuario_hash"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    id_user = Column(Integer, nullable=False)
+    content_hash = Column(String(64), nullable=False)
+    image_url = Column(String(512), nullable=False, index=True)  # Resolución URL -> hash de los caches
+    public_id = Column(String(255), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
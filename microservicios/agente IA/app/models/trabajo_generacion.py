@@ -0,0 +1,53 @@
+from datetime import datetime
+import enum
+
+from sqlalchemy import Column, DateTime, Enum, Integer, JSON, String, Text
+
+from app.config.database import Base
+
+
+class TipoTrabajo(str, enum.Enum):
+    DISENO = "diseno"  # POST /generate (legacy)
+    CHAT = "chat"  # POST /chat/session/{id}/message
+    TRYON = "tryon"  # POST /tryon/generate
+
+
+class EstadoTrabajo(str, enum.Enum):
+    PENDIENTE = "pendiente"
+    EN_PROCESO = "en_proceso"
+    COMPLETADO = "completado"
+    FALLIDO = "fallido"
+
+
+class TrabajoGeneracion(Base):
+    """
+    Trabajo de generación asíncrono (diseño, turno de chat o try-on)
+
+    Se guarda al aceptarlo (202) y lo ejecuta el pool de workers; al reiniciar
+    el servicio los trabajos pendientes y los de diseño interrumpidos se vuelven
+    a encolar (los de chat y try-on interrumpidos quedan fallidos).
+    """
+    __tablename__ = "trabajos_generacion"
+
+    id = Column(String(36), primary_key=True)
+    tipo = Column(
+        Enum(TipoTrabajo, values_callable=lambda obj: [e.value for e in obj]),
+        nullable=False,
+    )
+    estado = Column(
+        Enum(EstadoTrabajo, values_callable=lambda obj: [e.value for e in obj]),
+        default=EstadoTrabajo.PENDIENTE,
+        nullable=False,
+        index=True,
+    )
+    id_user = Column(Integer, nullable=True, index=True)
+    # Argumentos del trabajo y resultado (misma forma que la respuesta síncrona del endpoint)
+    parametros = Column(JSON, nullable=False)
+    resultado = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    # Código HTTP equivalente del error (400, 429, 503, 500) para que el cliente lo trate igual
+    codigo_error = Column(Integer, nullable=True)
+    intentos = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
@@ -1,6 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from app.config.database import get_db
+from app.config.database import SessionLocal, get_db
+from app.models import TipoTrabajo
+from app.routes.jobs import prefers_async, submit_job
 from app.schemas import (
     MensajeRequest,
     SesionCreate,
@@ -10,7 +13,10 @@ from app.schemas import (
     MensajeResponse
 )
 from app.services import AgentService, UsageLimitService
-from typing import List
+from app.utils.disconnect import CLIENT_CLOSED_REQUEST, ClientDisconnectedError, watch_disconnect
+from app.utils.sse import format_sse
+from app.utils.stage_timings import collect_stage_timings
+from typing import List, Optional
 
 router = APIRouter(prefix="/chat", tags=["Chat"])
 
@@ -31,6 +37,19 @@ def _build_session_response(sesion) -> SesionResponse:
     )
 
 
+def _validate_message_request(request: MensajeRequest) -> None:
+    if not request.terms_accepted:
+        raise HTTPException(
+            status_code=400,
+            detail="Debes aceptar los términos y condiciones antes de usar el agente."
+        )
+    if not request.product_id:
+        raise HTTPException(
+            status_code=400,
+            detail="Debes seleccionar una prenda del catálogo antes de enviar mensajes."
+        )
+
+
 @router.post("/session", response_model=SesionResponse)
 async def create_session(
     request: SesionCreate,
@@ -115,35 +134,52 @@ async def get_history(
 async def send_message(
     sesion_id: int,
     request: MensajeRequest,
+    http_request: Request,
+    response: Response,
+    prefer: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
-    """Envía un mensaje al agente y obtiene respuesta"""
-    if not request.terms_accepted:
-        raise HTTPException(
-            status_code=400,
-            detail="Debes aceptar los términos y condiciones antes de usar el agente."
-        )
-    if not request.product_id:
-        raise HTTPException(
-            status_code=400,
-            detail="Debes seleccionar una prenda del catálogo antes de enviar mensajes."
-        )
+    """
+    Envía un mensaje al agente y obtiene respuesta
+
+    Con "Prefer: respond-async" el turno (que puede terminar generando la
+    personalización) se ejecuta como trabajo: responde 202 y el ChatResponse
+    queda en GET /jobs/{id}. Si el cliente se desconecta mientras se genera la
+    personalización, la predicción se cancela en Replicate. La cabecera
+    Server-Timing trae la duración de cada etapa del turno.
+    """
+    _validate_message_request(request)
     # Verificar que la sesión existe
     sesion = await AgentService.get_session(db, sesion_id)
     if not sesion:
         raise HTTPException(status_code=404, detail="Sesión no encontrada")
+
+    if prefers_async(prefer):
+        return await submit_job(
+            db,
+            TipoTrabajo.CHAT,
+            {"sesion_id": sesion_id, **request.model_dump(exclude={"terms_accepted"})},
+            id_user=sesion.id_user,
+        )
     
     # Procesar mensaje
-    respuesta = await AgentService.process_user_message(
-        db,
-        sesion_id,
-        request.mensaje,
-        request.imagenes,
-        request.product_id,
-        request.product_name,
-        request.product_description,
-        request.product_image_url,
-    )
+    try:
+        with watch_disconnect(http_request.is_disconnected), collect_stage_timings() as timings:
+            respuesta = await AgentService.process_user_message(
+                db,
+                sesion_id,
+                request.mensaje,
+                request.imagenes,
+                request.product_id,
+                request.product_name,
+                request.product_description,
+                request.product_image_url,
+                request.regenerar_prompt,
+                request.variantes,
+            )
+    except ClientDisconnectedError as e:
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail=str(e))
+    response.headers["Server-Timing"] = timings.server_timing()
     
     return ChatResponse(
         sesion_id=sesion_id,
@@ -153,3 +189,66 @@ async def send_message(
         usos_restantes=respuesta["usage_status"]["remaining"],
         reset_at=respuesta["usage_status"]["reset_at"],
     )
+
+
+@router.post("/session/{sesion_id}/message/stream")
+async def send_message_stream(
+    sesion_id: int,
+    request: MensajeRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    Envía un mensaje al agente y transmite la respuesta con Server-Sent Events
+
+    Eventos:
+    - delta: {"texto": "..."} con cada fragmento de la respuesta
+    - image: {"url": "..."} con cada opción de diseño en cuanto está lista
+    - done: misma forma que ChatResponse más usage_status, enviado al guardar el mensaje
+    - error: {"detail": "..."} si el turno no se pudo procesar
+    """
+    _validate_message_request(request)
+    sesion = await AgentService.get_session(db, sesion_id)
+    if not sesion:
+        raise HTTPException(status_code=404, detail="Sesión no encontrada")
+
+    async def event_stream():
+        # La sesión de la dependencia se cierra antes de que empiece el streaming,
+        # por eso el generador usa su propia sesión de BD.
+        stream_db = SessionLocal()
+        try:
+            async for event, data in AgentService.stream_user_message(
+                stream_db,
+                sesion_id,
+                request.mensaje,
+                request.imagenes,
+                request.product_id,
+                request.product_name,
+                request.product_description,
+                request.product_image_url,
+                request.regenerar_prompt,
+                request.variantes,
+            ):
+                if event == "done":
+                    usage_status = data["usage_status"]
+                    data = {
+                        **ChatResponse(
+                            sesion_id=sesion_id,
+                            mensaje=data["mensaje"],
+                            imagenes_generadas=data.get("imagenes_generadas"),
+                            limite_24h=usage_status["limit"],
+                            usos_restantes=usage_status["remaining"],
+                            reset_at=usage_status["reset_at"],
+                        ).model_dump(),
+                        "usage_status": usage_status,
+                    }
+                yield format_sse(event, data)
+        except ValueError as e:
+            yield format_sse("error", {"detail": str(e)})
+        finally:
+            stream_db.close()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,9 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
 from sqlalchemy.orm import Session
 from app.config.database import get_db
+from app.config.settings import settings
 from app.schemas import (
     ImagenUploadResponse,
     ReferenciaUploadResponse,
+    ReferenciaBatchItem,
+    ReferenciaBatchResponse,
     FotoUsuarioResponse,
     ImagenSaveRequest,
     ImagenSavedResponse,
@@ -12,6 +15,7 @@ from app.schemas import (
 )
 from app.services import ImageService
 from app.models import TipoImagen
+from app.utils.uploads import UploadRejectedError
 from typing import List, Optional
 
 router = APIRouter(prefix="/images", tags=["Images"])
@@ -38,8 +42,12 @@ async def upload_design_image(
         return ImagenUploadResponse(
             id=imagen.id,
             url=imagen.image_url,
+            thumbnail_url=imagen.thumbnail_url,
+            medium_url=imagen.medium_url,
             tipo=_resolve_tipo_value(imagen.tipo)
         )
+    except UploadRejectedError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al subir imagen: {str(e)}")
 
@@ -56,10 +64,38 @@ async def upload_reference_image(
     try:
         url = await ImageService.upload_reference_image(file, id_user)
         return ReferenciaUploadResponse(url=url)
+    except UploadRejectedError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al subir referencia: {str(e)}")
 
 
+@router.post("/references/batch", response_model=ReferenciaBatchResponse)
+async def upload_reference_images(
+    files: List[UploadFile] = File(...),
+    id_user: int = Form(...),
+):
+    """
+    Sube varias referencias en una sola petición
+
+    Los archivos se suben en paralelo; la respuesta trae un resultado por archivo
+    (URL o error) aunque alguno falle.
+    """
+    if len(files) > settings.REFERENCE_BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Como máximo {settings.REFERENCE_BATCH_MAX_FILES} archivos por petición",
+        )
+
+    resultados = await ImageService.upload_reference_images(files, id_user)
+    subidas = sum(1 for resultado in resultados if resultado["url"])
+    return ReferenciaBatchResponse(
+        resultados=[ReferenciaBatchItem(**resultado) for resultado in resultados],
+        subidas=subidas,
+        fallidas=len(resultados) - subidas,
+    )
+
+
 @router.post("/photo", response_model=FotoUsuarioResponse)
 async def upload_user_photo(
     file: UploadFile = File(...),
@@ -75,6 +111,8 @@ async def upload_user_photo(
     try:
         foto = await ImageService.save_user_photo(db, file, id_user, es_principal)
         return foto
+    except UploadRejectedError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al subir foto: {str(e)}")
 
@@ -0,0 +1,87 @@
+import re
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.orm import Session
+
+from app.config.database import get_db
+from app.models import TipoTrabajo, TrabajoGeneracion
+from app.schemas import JobResponse
+from app.services import JobQueueFullError, JobService
+from app.services.job_service import TERMINAL_JOB_STATES
+from app.utils.sse import format_sse, format_sse_comment
+
+router = APIRouter(prefix="/jobs", tags=["Trabajos"])
+
+
+def prefers_async(prefer: Optional[str]) -> bool:
+    """True si la cabecera Prefer pide respuesta asíncrona (RFC 7240: respond-async)."""
+    if not prefer:
+        return False
+    return any(token.strip().lower() == "respond-async" for token in re.split(r"[,;]", prefer))
+
+
+def _job_payload(job: TrabajoGeneracion) -> Dict[str, Any]:
+    return JobResponse.model_validate(job).model_dump(mode="json")
+
+
+async def submit_job(
+    db: Session,
+    tipo: TipoTrabajo,
+    parametros: Dict[str, Any],
+    id_user: Optional[int] = None,
+) -> JSONResponse:
+    """Acepta un trabajo de generación: 202 con su estado y Location a GET /jobs/{id}."""
+    try:
+        job = await JobService.submit(db, tipo, parametros, id_user)
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+
+    return JSONResponse(
+        status_code=202,
+        content=_job_payload(job),
+        headers={"Location": f"/jobs/{job.id}", "Preference-Applied": "respond-async"},
+    )
+
+
+@router.get("/{job_id}", response_model=JobResponse)
+async def get_job(
+    job_id: str,
+    db: Session = Depends(get_db)
+):
+    """Obtiene el estado (y el resultado, si terminó) de un trabajo de generación"""
+    job = JobService.get_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return job
+
+
+@router.get("/{job_id}/events")
+async def job_events(
+    job_id: str,
+    db: Session = Depends(get_db)
+):
+    """
+    Transmite los cambios de estado de un trabajo con Server-Sent Events
+
+    Eventos:
+    - status: JobResponse cada vez que el trabajo cambia de estado (pendiente, en_proceso)
+    - done: JobResponse final (completado o fallido); después se cierra el stream
+    """
+    if not JobService.get_job(db, job_id):
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+
+    async def event_stream():
+        async for job in JobService.watch_job(job_id):
+            if job is None:
+                yield format_sse_comment()
+                continue
+            event = "done" if job.estado in TERMINAL_JOB_STATES else "status"
+            yield format_sse(event, _job_payload(job))
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
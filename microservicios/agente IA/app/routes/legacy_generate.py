@@ -1,6 +1,14 @@
-from fastapi import APIRouter, HTTPException
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response
 from pydantic import BaseModel
+from sqlalchemy.orm import Session
+from app.config.database import get_db
+from app.models import TipoTrabajo
+from app.routes.jobs import prefers_async, submit_job
 from app.services.design_generation_service import DesignGenerationService
+from app.utils.disconnect import CLIENT_CLOSED_REQUEST, ClientDisconnectedError, watch_disconnect
+from app.utils.stage_timings import collect_stage_timings
 
 router = APIRouter(tags=["Legacy"])
 
@@ -31,23 +39,48 @@ def parse_aspect_ratio(value: str | None) -> tuple[int, int]:
 
 
 @router.post("/generate")
-async def legacy_generate(payload: LegacyGenerateRequest):
+async def legacy_generate(
+    payload: LegacyGenerateRequest,
+    http_request: Request,
+    response: Response,
+    prefer: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
     """
     Endpoint de compatibilidad para clientes legacy que consumen /api/generate.
+
+    Con "Prefer: respond-async" responde 202 con un trabajo; el resultado
+    ({"url": ...}) se consulta en GET /jobs/{id}. Si el cliente se desconecta
+    antes de terminar, la predicción se cancela en Replicate.
     """
     if not payload.prompt or not payload.prompt.strip():
         raise HTTPException(status_code=400, detail="prompt es obligatorio")
 
-    try:
-        width, height = parse_aspect_ratio(payload.aspectRatio)
-        image_url = await DesignGenerationService.generate_design_image(
-            prompt=payload.prompt.strip(),
-            width=width,
-            height=height,
-            image_input=payload.image,
-            creativity=payload.creativity,
+    width, height = parse_aspect_ratio(payload.aspectRatio)
+    if prefers_async(prefer):
+        return await submit_job(
+            db,
+            TipoTrabajo.DISENO,
+            {
+                "prompt": payload.prompt.strip(),
+                "width": width,
+                "height": height,
+                "image_input": payload.image,
+                "creativity": payload.creativity,
+            },
         )
 
+    try:
+        with watch_disconnect(http_request.is_disconnected), collect_stage_timings() as timings:
+            image_url = await DesignGenerationService.generate_design_image(
+                prompt=payload.prompt.strip(),
+                width=width,
+                height=height,
+                image_input=payload.image,
+                creativity=payload.creativity,
+            )
+        response.headers["Server-Timing"] = timings.server_timing()
+
         return {
             "message": "Imagen generada exitosamente",
             "url": image_url,
@@ -61,5 +94,7 @@ async def legacy_generate(payload: LegacyGenerateRequest):
                 "creativity": payload.creativity,
             },
         }
+    except ClientDisconnectedError as e:
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"No se pudo generar la imagen: {str(e)}")
@@ -1,9 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response
 from sqlalchemy.orm import Session
 from app.config.database import get_db
+from app.models import TipoTrabajo
+from app.routes.jobs import prefers_async, submit_job
 from app.schemas import TryOnRequest, TryOnResponse, TryOnFavoritoRequest
 from app.services import TryOnService, UsageLimitExceededError
-from typing import List
+from app.utils.disconnect import CLIENT_CLOSED_REQUEST, ClientDisconnectedError, watch_disconnect
+from app.utils.stage_timings import collect_stage_timings
+from typing import List, Optional
 
 router = APIRouter(prefix="/tryon", tags=["Virtual Try-On"])
 
@@ -11,21 +15,59 @@ router = APIRouter(prefix="/tryon", tags=["Virtual Try-On"])
 @router.post("/generate", response_model=TryOnResponse)
 async def generate_tryon(
     request: TryOnRequest,
+    http_request: Request,
+    response: Response,
+    prefer: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
-    """Genera un virtual try-on"""
+    """
+    Genera un virtual try-on
+
+    Con "Prefer: respond-async" valida la solicitud, responde 202 con un trabajo
+    y el TryOnResponse queda en GET /jobs/{id} al terminar. Si el cliente se
+    desconecta antes de terminar, la predicción se cancela en Replicate.
+    """
     try:
-        prueba = await TryOnService.generate_tryon(
-            db,
-            request.id_user,
-            request.foto_usuario_id,
-            request.personalizacion_id,
-            request.variant_id,
-            request.garment_image_url,
-            request.garment_description,
-            request.garment_category,
-        )
+        if prefers_async(prefer):
+            inputs = TryOnService.prepare_tryon(
+                db,
+                request.id_user,
+                request.foto_usuario_id,
+                request.personalizacion_id,
+                request.garment_image_url,
+                request.garment_description,
+            )
+            return await submit_job(
+                db,
+                TipoTrabajo.TRYON,
+                {
+                    **inputs,
+                    "id_user": request.id_user,
+                    "foto_usuario_id": request.foto_usuario_id,
+                    "personalizacion_id": request.personalizacion_id,
+                    "variant_id": request.variant_id,
+                    "garment_category": request.garment_category,
+                },
+                id_user=request.id_user,
+            )
+
+        with watch_disconnect(http_request.is_disconnected), collect_stage_timings() as timings:
+            prueba = await TryOnService.generate_tryon(
+                db,
+                request.id_user,
+                request.foto_usuario_id,
+                request.personalizacion_id,
+                request.variant_id,
+                request.garment_image_url,
+                request.garment_description,
+                request.garment_category,
+            )
+        response.headers["Server-Timing"] = timings.server_timing()
         return prueba
+    except HTTPException:
+        raise
+    except ClientDisconnectedError as e:
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except UsageLimitExceededError as e:
@@ -0,0 +1,49 @@
+import json
+
+from fastapi import APIRouter, HTTPException, Request
+
+from app.config.settings import settings
+from app.services.replicate_predictions import (
+    TERMINAL_STATUSES,
+    WEBHOOKS_RECEIVED,
+    prediction_registry,
+    verify_webhook_signature,
+)
+
+router = APIRouter(prefix="/webhooks", tags=["Webhooks"])
+
+
+@router.post("/replicate")
+async def replicate_webhook(request: Request):
+    """
+    Recibe el aviso de Replicate cuando una predicción termina
+
+    Verifica la firma con REPLICATE_WEBHOOK_SECRET y entrega el resultado a la
+    generación que lo espera en este proceso. Si la espera está en otra réplica
+    del servicio, esa réplica lo obtiene con su consulta de estado de respaldo.
+    """
+    secret = settings.REPLICATE_WEBHOOK_SECRET
+    if not secret:
+        raise HTTPException(status_code=404, detail="Webhooks de Replicate no configurados")
+
+    body = await request.body()
+    if not verify_webhook_signature(request.headers, body, secret):
+        WEBHOOKS_RECEIVED.inc(result="rejected")
+        raise HTTPException(status_code=401, detail="Firma de webhook inválida")
+
+    try:
+        prediction = json.loads(body)
+    except ValueError:
+        WEBHOOKS_RECEIVED.inc(result="rejected")
+        raise HTTPException(status_code=400, detail="Cuerpo de webhook inválido")
+
+    prediction_id = prediction.get("id") if isinstance(prediction, dict) else None
+    if not prediction_id:
+        WEBHOOKS_RECEIVED.inc(result="rejected")
+        raise HTTPException(status_code=400, detail="El webhook no incluye el id de la predicción")
+
+    matched = False
+    if prediction.get("status") in TERMINAL_STATUSES:
+        matched = prediction_registry.resolve(prediction_id, prediction)
+    WEBHOOKS_RECEIVED.inc(result="matched" if matched else "unmatched")
+    return {"received": True, "matched": matched}
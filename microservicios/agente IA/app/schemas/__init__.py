@@ -9,6 +9,8 @@ from .chat import (
 from .image import (
     ImagenUploadResponse,
     ReferenciaUploadResponse,
+    ReferenciaBatchItem,
+    ReferenciaBatchResponse,
     FotoUsuarioCreate,
     FotoUsuarioResponse,
     ImagenSaveRequest,
@@ -21,6 +23,7 @@ from .tryon import (
     TryOnResponse,
     TryOnFavoritoRequest
 )
+from .job import JobResponse
 
 __all__ = [
     "MensajeRequest",
@@ -31,6 +34,8 @@ __all__ = [
     "ChatResponse",
     "ImagenUploadResponse",
     "ReferenciaUploadResponse",
+    "ReferenciaBatchItem",
+    "ReferenciaBatchResponse",
     "FotoUsuarioCreate",
     "FotoUsuarioResponse",
     "ImagenSaveRequest",
@@ -39,5 +44,6 @@ __all__ = [
     "ImagenAdminResponse",
     "TryOnRequest",
     "TryOnResponse",
-    "TryOnFavoritoRequest"
+    "TryOnFavoritoRequest",
+    "JobResponse"
 ]
@@ -12,6 +12,10 @@ class MensajeRequest(BaseModel):
     product_description: Optional[str] = Field(None, description="Descripción de la prenda seleccionada")
     product_image_url: Optional[str] = Field(None, description="URL de la imagen base de la prenda seleccionada")
     terms_accepted: bool = Field(False, description="Aceptación explícita de términos")
+    regenerar_prompt: bool = Field(False, description="Fuerza un prompt de diseño nuevo al generar")
+    variantes: Optional[int] = Field(
+        None, ge=1, description="Opciones de diseño a generar (máx. DESIGN_VARIANTS_MAX; por defecto, las que pida el mensaje)"
+    )
     
 
 class MensajeResponse(BaseModel):
@@ -65,6 +69,7 @@ class SesionListItemResponse(BaseModel):
     last_message_at: Optional[datetime] = None
     total_messages: int = 0
     preview_image_url: Optional[str] = None
+    preview_thumbnail_url: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 
@@ -7,6 +7,8 @@ class ImagenUploadResponse(BaseModel):
     """Response al subir una imagen"""
     id: int
     url: str
+    thumbnail_url: Optional[str] = None
+    medium_url: Optional[str] = None
     tipo: str
     mensaje: str = "Imagen subida exitosamente"
 
@@ -17,6 +19,21 @@ class ReferenciaUploadResponse(BaseModel):
     mensaje: str = "Referencia subida exitosamente"
 
 
+class ReferenciaBatchItem(BaseModel):
+    """Resultado de un archivo de un lote de referencias"""
+    filename: Optional[str] = None
+    url: Optional[str] = None
+    error: Optional[str] = None
+    status_code: int = Field(..., description="Código HTTP que habría devuelto POST /images/reference para este archivo")
+
+
+class ReferenciaBatchResponse(BaseModel):
+    """Response al subir varias referencias en una sola petición"""
+    resultados: List[ReferenciaBatchItem]  # En el orden en que se enviaron los archivos
+    subidas: int
+    fallidas: int
+
+
 class FotoUsuarioCreate(BaseModel):
     """Request para registrar foto de usuario"""
     id_user: int
@@ -51,6 +68,8 @@ class ImagenSavedResponse(BaseModel):
     id: int
     id_user: Optional[int] = None
     image_url: str
+    thumbnail_url: Optional[str] = None
+    medium_url: Optional[str] = None
     session_id: Optional[int] = None
     variant_id: Optional[int] = None
     tipo: str
@@ -75,6 +94,8 @@ class ImagenAdminResponse(BaseModel):
     id: int
     id_user: Optional[int] = None
     image_url: str
+    thumbnail_url: Optional[str] = None
+    medium_url: Optional[str] = None
     prompt: Optional[str] = None
     garment_type: Optional[str] = None
     estado: Optional[str] = None
@@ -0,0 +1,20 @@
+from pydantic import BaseModel
+from typing import Any, Dict, Optional
+from datetime import datetime
+
+
+class JobResponse(BaseModel):
+    """Estado de un trabajo de generación asíncrono"""
+    id: str
+    tipo: str
+    estado: str  # pendiente | en_proceso | completado | fallido
+    resultado: Optional[Dict[str, Any]] = None  # Misma forma que la respuesta síncrona del endpoint
+    error: Optional[str] = None
+    codigo_error: Optional[int] = None  # Código HTTP que habría devuelto el endpoint síncrono
+    intentos: int = 0
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
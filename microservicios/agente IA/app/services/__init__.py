@@ -2,6 +2,9 @@ from .agent_service import AgentService
 from .image_service import ImageService
 from .tryon_service import TryOnService
 from .usage_limit_service import UsageLimitService, UsageLimitExceededError
+from .session_summary_service import SessionSummaryService
+from .intent_detector import IntentDetector, MessageIntents
+from .job_service import JobService, JobQueueFullError, job_runner
 
 __all__ = [
     "AgentService",
@@ -9,4 +12,10 @@ __all__ = [
     "TryOnService",
     "UsageLimitService",
     "UsageLimitExceededError",
+    "SessionSummaryService",
+    "IntentDetector",
+    "MessageIntents",
+    "JobService",
+    "JobQueueFullError",
+    "job_runner",
 ]
@@ -10,19 +10,51 @@ from app.models import (
 )
 from app.agents.orchestrator import orchestrator
 from app.services.design_generation_service import DesignGenerationService
+from app.services.intent_detector import IntentDetector
 from app.services.usage_limit_service import UsageLimitExceededError, UsageLimitService
-from typing import List, Optional, Dict, Any
+from app.services.session_summary_service import SessionSummaryService
+from app.services.reference_image_service import ReferenceImageService
+from app.config.database import SessionLocal
+from app.config.storage import storage
+from app.config.settings import settings
+from app.utils.deadline import request_budget
+from app.utils.disconnect import ClientDisconnectedError
+from app.utils.stage_timings import gather_stages, stage
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
 from datetime import datetime
+import asyncio
+import logging
 import re
 
+logger = logging.getLogger(__name__)
+
 
 class AgentService:
     """Servicio para manejar la lógica del agente de IA"""
+    _pending_tasks: Set[asyncio.Task] = set()
     IMAGE_URL_PATTERN = re.compile(
         r"https?://[^\s]+(?:cloudinary\.com[^\s]*|(?:\.png|\.jpg|\.jpeg|\.webp|\.gif)(?:\?[^\s]*)?)",
         re.IGNORECASE,
     )
     SESSION_MARKER_PATTERN = re.compile(r"^\[session:(\d+)\]\s*", re.IGNORECASE)
+    TRYON_NOT_AVAILABLE_MESSAGE = (
+        "Puedo tomar tu foto como referencia visual para colores, logos o estampados "
+        "y aplicarlos sobre la prenda del catálogo que seleccionaste. "
+        "Lo que todavía no puedo hacer es try-on ni ponerte la prenda sobre tu foto desde el chat."
+    )
+    SCOPE_BREAK_MESSAGE = (
+        "En esta fase solo puedo ayudarte con la prenda del catálogo que seleccionaste. "
+        "Ahora mismo personalizo esa misma prenda con cambios de color, logos y patrones simples. "
+        "Todavía no puedo crear prendas nuevas, armar outfits completos ni hacer try-on desde el chat."
+    )
+    CUSTOMIZATION_APPLIED_MESSAGE = (
+        "Listo, ya apliqué la personalización sobre la prenda seleccionada. "
+        "Si quieres, ahora puedo hacer ajustes finos de color, tamaño, posición o patrón."
+    )
+    VARIANTS_APPLIED_MESSAGE = (
+        "Listo, te preparé {count} opciones de la personalización sobre la prenda seleccionada. "
+        "Dime cuál prefieres y sobre esa hago ajustes finos de color, tamaño, posición o patrón."
+    )
 
     @staticmethod
     def _build_usage_limit_message(status: Dict[str, Any]) -> str:
@@ -34,7 +66,6 @@ class AgentService:
 
     @staticmethod
     def _save_generated_images(
-        db: Session,
         id_user: int,
         image_urls: List[str],
         product_id: Optional[int],
@@ -42,177 +73,43 @@ class AgentService:
         sesion_id: int,
         user_message: str,
     ) -> None:
-        for image_url in image_urls:
-            db.add(
-                Imagen(
-                    id_user=id_user,
-                    image_url=image_url,
-                    variant_id=product_id,
-                    tipo=TipoImagen.USUARIO_DISEÑO,
-                    prompt=f"[session:{sesion_id}] {user_message}",
-                    garment_type=garment_type,
+        # Corre en un hilo después de responder: usa su propia sesión de BD
+        db = SessionLocal()
+        try:
+            for image_url in image_urls:
+                db.add(
+                    Imagen(
+                        id_user=id_user,
+                        image_url=image_url,
+                        **storage.derivatives(image_url),
+                        variant_id=product_id,
+                        tipo=TipoImagen.USUARIO_DISEÑO,
+                        prompt=f"[session:{sesion_id}] {user_message}",
+                        garment_type=garment_type,
+                    )
                 )
-            )
-        db.commit()
-
-
-    @staticmethod
-    def _detect_garment_type(user_message: str) -> str:
-        message = user_message.lower()
-        if any(word in message for word in [
-            "pantalon", "pantalones", "jean", "jeans", "denim",
-            "jogger", "sudadera", "leggings", "short", "shorts",
-            "bermuda", "falda", "falta"
-        ]):
-            return "pantalon"
-        if any(word in message for word in [
-            "chaqueta", "abrigo", "buzo", "saco", "hoodie",
-            "sueter", "sweater", "blazer"
-        ]):
-            return "chaqueta"
-        if any(word in message for word in [
-            "camisa", "camiseta", "blusa", "polo", "top"
-        ]):
-            return "camiseta"
-        return "camiseta"
-
-    @staticmethod
-    def _is_out_of_scope_request(user_message: str) -> bool:
-        return (
-            AgentService._is_tryon_request(user_message)
-            or AgentService._is_catalog_scope_break_request(user_message)
-        )
-
-    @staticmethod
-    def _is_tryon_request(user_message: str) -> bool:
-        message = user_message.lower()
-        forbidden_keywords = [
-            "try on",
-            "try-on",
-            "probarme",
-            "pruebamela",
-            "pruébamela",
-            "ponmela",
-            "ponérmela",
-            "ponermela",
-            "visteme",
-            "vísteme",
-            "sobre mi foto",
-            "sobre mi cuerpo",
-            "en mi cuerpo",
-            "usando mi foto",
-            "como me veria",
-            "cómo me vería",
-            "como me quedaria",
-            "cómo me quedaría",
-        ]
-        return any(keyword in message for keyword in forbidden_keywords)
-
-    @staticmethod
-    def _is_catalog_scope_break_request(user_message: str) -> bool:
-        message = user_message.lower()
-        forbidden_keywords = [
-            "outfit completo",
-            "outfit",
-            "combina",
-            "conjunto",
-            "prenda nueva",
-            "crea una prenda",
-            "generar prenda",
-            "diseña una camiseta desde cero",
-            "desde cero",
-            "nuevo modelo",
-            "nueva sudadera",
-            "nueva camisa",
-            "nueva camiseta",
-        ]
-        return any(keyword in message for keyword in forbidden_keywords)
+            db.commit()
+        except Exception as exc:
+            db.rollback()
+            logger.error("No se pudieron guardar las imagenes generadas de la sesion %s: %s", sesion_id, exc)
+        finally:
+            db.close()
 
     @staticmethod
-    def _is_generation_request(user_message: str) -> bool:
-        message = user_message.lower()
-        generation_keywords = [
-            "generala",
-            "genérala",
-            "generalo",
-            "genéralo",
-            "generar",
-            "genera",
-            "muestrame",
-            "muéstrame",
-            "muestrala",
-            "muéstrala",
-            "mostrar",
-            "muestralo",
-            "muéstralo",
-            "como se veria",
-            "cómo se vería",
-            "como quedaria",
-            "cómo quedaría",
-            "hazla",
-            "házla",
-            "hazlo",
-            "renderiza",
-            "visualizala",
-            "visualízala",
-            "visualizar",
-            "aplicalo",
-            "aplícalo",
-            "aplicala",
-            "aplícalo",
-        ]
-        return any(keyword in message for keyword in generation_keywords)
+    def _schedule_save_generated_images(**kwargs: Any) -> None:
+        """Guarda las imágenes generadas fuera del camino de la respuesta."""
+        task = asyncio.create_task(asyncio.to_thread(AgentService._save_generated_images, **kwargs))
+        # Mantener una referencia para que la tarea no sea recolectada antes de terminar
+        AgentService._pending_tasks.add(task)
+        task.add_done_callback(AgentService._pending_tasks.discard)
 
     @staticmethod
-    def _is_final_confirmation(user_message: str) -> bool:
-        message = " ".join(user_message.lower().strip().split())
-        confirmation_markers = [
-            "asi esta bien",
-            "así está bien",
-            "asi esta perfecto",
-            "así está perfecto",
-            "dejalo asi",
-            "déjalo así",
-            "solo asi",
-            "solo así",
-            "listo",
-            "quedo bien",
-            "quedó bien",
-            "esta bien asi",
-            "está bien así",
-            "no, asi esta bien",
-            "no, así está bien",
-            "no asi esta bien",
-            "no así está bien",
-            "no, solo asi",
-            "no, solo así",
-            "perfecto asi",
-            "perfecto así",
-        ]
-        return any(marker in message for marker in confirmation_markers)
+    def _detect_garment_type(user_message: str) -> str:
+        return IntentDetector.detect(user_message).garment_type
 
     @staticmethod
     def _assistant_declares_ready(agent_message: str) -> bool:
-        message = " ".join(agent_message.lower().strip().split())
-        ready_markers = [
-            "listo, ya apliqué la personalización",
-            "listo, ya aplique la personalizacion",
-            "tu personalización ha sido aplicada",
-            "tu personalizacion ha sido aplicada",
-            "ya realicé la personalización",
-            "ya realice la personalizacion",
-            "ya quedó la personalización",
-            "ya quedo la personalizacion",
-            "quedó lista la personalización",
-            "quedo lista la personalizacion",
-            "tu camiseta personalizada tendrá",
-            "tu camiseta personalizada tendra",
-            "tu prenda personalizada tendrá",
-            "tu prenda personalizada tendra",
-            "entonces, tu camiseta",
-            "entonces, tu prenda",
-        ]
-        return any(marker in message for marker in ready_markers)
+        return IntentDetector.detect(agent_message).assistant_ready
 
     @staticmethod
     def _extract_session_id_from_prompt(prompt: Optional[str]) -> Optional[int]:
@@ -298,41 +195,105 @@ class AgentService:
         user_message: str,
         history_context: str,
         reference_images: Optional[List[str]] = None,
+        bypass_prompt_cache: bool = False,
+        variants: int = 1,
+        on_image: Optional[Callable[[str], Awaitable[None]]] = None,
     ) -> List[str]:
+        """
+        Genera una o varias opciones de la personalización
+
+        Las opciones salen de una sola llamada a Gemini y se generan en paralelo
+        (hasta DESIGN_VARIANTS_MAX_CONCURRENCY predicciones a la vez). Si alguna
+        falla se devuelven las demás; solo se lanza el error si fallan todas.
+
+        Args:
+            variants: Opciones pedidas (se limita a DESIGN_VARIANTS_MAX)
+            on_image: Corrutina llamada con cada imagen en cuanto está lista
+
+        Returns:
+            URLs generadas en orden de finalización
+        """
         if not product_image_url:
             raise ValueError(
                 "Puedo generar la personalizacion, pero necesito la imagen base de la prenda seleccionada. "
                 "Vuelve a abrir la personalizacion desde el catalogo e intenta de nuevo."
             )
 
+        variants = max(1, min(variants, settings.DESIGN_VARIANTS_MAX))
         garment_type = AgentService._detect_garment_type(
             " ".join(filter(None, [product_name, product_description, user_message]))
         )
-        design_prompt_response = await orchestrator.generate_design_prompt(
-            user_request=AgentService._build_generation_brief(
-                product_id=product_id,
-                product_name=product_name,
-                user_message=user_message,
-                history_context=history_context,
-                reference_images=reference_images,
-            ),
-            garment_type=garment_type,
+
+        async def write_design_prompts() -> List[str]:
+            with stage("design_prompt"):
+                # Un brief idéntico (p. ej. reintento tras un fallo de Replicate) reutiliza los prompts ya escritos
+                return await orchestrator.design_prompt_variants(
+                    user_request=AgentService._build_generation_brief(
+                        product_id=product_id,
+                        product_name=product_name,
+                        user_message=user_message,
+                        history_context=history_context,
+                        reference_images=reference_images,
+                    ),
+                    garment_type=garment_type,
+                    variants=variants,
+                    bypass_cache=bypass_prompt_cache,
+                )
+
+        async def prepare_references() -> Tuple[str, List[str]]:
+            with stage("references"):
+                return await ReferenceImageService.prepare(product_image_url, reference_images)
+
+        # Los prompts (Gemini) y las imágenes (Cloudinary/HEAD) no dependen entre sí;
+        # las predicciones necesitan ambos
+        design_prompts, (base_image_url, prepared_references) = await gather_stages(
+            write_design_prompts(),
+            prepare_references(),
         )
-        design_prompt = orchestrator._extract_text(design_prompt_response)
         negative_prompt = (
             DesignGenerationService.build_negative_prompt(history_context)
             + ", different garment, extra garments, hoodie, jacket, pants, dress, skirt, "
             "person, model, mannequin, change of camera angle, change of background, text overlay, "
             "poster, flyer, sticker sheet, floating graphic, standalone illustration"
         )
-        generated_image_url = await DesignGenerationService.generate_design_image(
-            prompt=design_prompt,
-            negative_prompt=negative_prompt,
-            image_input=product_image_url,
-            extra_image_inputs=reference_images,
-            creativity=0.2 if reference_images else 0.35,
-        )
-        return [generated_image_url]
+        semaphore = asyncio.Semaphore(settings.DESIGN_VARIANTS_MAX_CONCURRENCY)
+
+        async def generate_variant(design_prompt: str) -> str:
+            async with semaphore:
+                return await DesignGenerationService.generate_design_image(
+                    prompt=design_prompt,
+                    negative_prompt=negative_prompt,
+                    image_input=base_image_url,
+                    extra_image_inputs=prepared_references,
+                    creativity=0.2 if prepared_references else 0.35,
+                    # "Regenerar" pide una imagen nueva, no la misma URL cacheada
+                    bypass_cache=bypass_prompt_cache,
+                )
+
+        tasks = [asyncio.ensure_future(generate_variant(design_prompt)) for design_prompt in design_prompts]
+        generated: List[str] = []
+        errors: List[Exception] = []
+        try:
+            for finished in asyncio.as_completed(tasks):
+                try:
+                    image_url = await finished
+                except ClientDisconnectedError:
+                    raise
+                except Exception as exc:
+                    logger.warning("Fallo una de las %s opciones de diseño: %s", len(tasks), exc)
+                    errors.append(exc)
+                    continue
+                generated.append(image_url)
+                if on_image is not None:
+                    await on_image(image_url)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+        if not generated:
+            raise errors[0]
+        return generated
 
     @staticmethod
     async def create_session(db: Session, id_user: int) -> SesionIA:
@@ -420,6 +381,8 @@ class AgentService:
                     "last_message_at": last_message.timestamp if last_message else None,
                     "total_messages": len(ordered_messages),
                     "preview_image_url": session_saved_design.image_url,
+                    "preview_thumbnail_url": session_saved_design.thumbnail_url
+                    or storage.derivatives(session_saved_design.image_url)["thumbnail_url"],
                 }
             )
             if len(session_items) >= limit:
@@ -466,27 +429,18 @@ class AgentService:
         return mensaje
 
     @staticmethod
-    async def process_user_message(
+    async def _prepare_turn(
         db: Session,
         sesion_id: int,
         user_message: str,
-        imagenes: Optional[List[str]] = None,
-        product_id: Optional[int] = None,
-        product_name: Optional[str] = None,
-        product_description: Optional[str] = None,
-        product_image_url: Optional[str] = None,
+        imagenes: Optional[List[str]],
+        product_id: Optional[int],
     ) -> Dict[str, Any]:
         """
-        Procesa un mensaje del usuario y genera respuesta del agente
-
-        Args:
-            db: Sesión de base de datos
-            sesion_id: ID de la sesión
-            user_message: Mensaje del usuario
-            imagenes: URLs de imágenes adjuntas
+        Valida la sesión, guarda el mensaje del usuario y construye el contexto del turno
 
         Returns:
-            Dict con respuesta de texto y URLs de imágenes detectadas/generadas
+            Dict con id_user, context y has_previous_user_messages
         """
         if not product_id:
             raise ValueError(
@@ -496,7 +450,6 @@ class AgentService:
         sesion = await AgentService.get_session(db, sesion_id)
         if not sesion:
             raise ValueError("La sesion no existe o ya no esta disponible.")
-        id_user = sesion.id_user
 
         # Guardar mensaje del usuario
         metadata = {"imagenes": imagenes} if imagenes else None
@@ -508,89 +461,352 @@ class AgentService:
         historial = await AgentService.get_conversation_history(db, sesion_id, limit=5)
         historial.reverse()  # Ordenar cronológicamente
 
-        # Construir contexto
-        context = "\n".join([
-            f"{'Usuario' if msg.tipo == TipoMensaje.usuario else 'Asistente'}: {msg.contenido}"
-            for msg in historial[:-1]  # Excluir el mensaje actual
-        ]) if len(historial) > 1 else "Primera interacción"
-        previous_user_messages = [
-            msg for msg in historial[:-1] if msg.tipo == TipoMensaje.usuario
-        ]
+        # Construir contexto: el resumen del diseño reemplaza al historial literal cuando existe
+        previous_messages = historial[:-1]  # Excluir el mensaje actual
+        context = SessionSummaryService.build_context(sesion, previous_messages)
+        if context is None:
+            context = "\n".join([
+                f"{'Usuario' if msg.tipo == TipoMensaje.usuario else 'Asistente'}: {msg.contenido}"
+                for msg in previous_messages
+            ]) if previous_messages else "Primera interacción"
 
-        imagenes_generadas: List[str] = []
-        usage_status = UsageLimitService.get_usage_status(db, id_user)
-        should_generate_image = AgentService._is_generation_request(user_message) or (
-            bool(previous_user_messages) and AgentService._is_final_confirmation(user_message)
+        return {
+            "id_user": sesion.id_user,
+            "context": context,
+            "has_previous_user_messages": any(
+                msg.tipo == TipoMensaje.usuario for msg in previous_messages
+            ),
+        }
+
+    @staticmethod
+    def _scripted_reply(user_message: str) -> Optional[str]:
+        """Respuesta fija para pedidos fuera del alcance del flujo de catálogo."""
+        intents = IntentDetector.detect(user_message)
+        if intents.tryon:
+            return AgentService.TRYON_NOT_AVAILABLE_MESSAGE
+        if intents.scope_break:
+            return AgentService.SCOPE_BREAK_MESSAGE
+        return None
+
+    @staticmethod
+    async def _apply_catalog_customization(
+        db: Session,
+        id_user: int,
+        sesion_id: int,
+        product_id: int,
+        product_name: Optional[str],
+        product_description: Optional[str],
+        product_image_url: Optional[str],
+        user_message: str,
+        history_context: str,
+        reference_images: Optional[List[str]] = None,
+        bypass_prompt_cache: bool = False,
+        variants: int = 1,
+        on_image: Optional[Callable[[str], Awaitable[None]]] = None,
+    ) -> Tuple[List[str], Dict[str, Any]]:
+        """
+        Genera la personalización, la guarda y registra el uso
+
+        Todas las opciones del turno cuentan como un único uso, reservado antes de
+        generar y devuelto si no se obtiene ninguna imagen.
+
+        Raises:
+            UsageLimitExceededError: Si el usuario ya no tiene usos disponibles
+
+        Returns:
+            Tupla (imágenes generadas, estado de uso actualizado)
+        """
+        reservation = UsageLimitService.reserve_usage(db, id_user, TipoUsoAgente.PERSONALIZACION)
+        try:
+            imagenes_generadas = await AgentService._generate_catalog_customization(
+                product_id=product_id,
+                product_name=product_name,
+                product_description=product_description,
+                product_image_url=product_image_url,
+                user_message=user_message,
+                history_context=history_context,
+                reference_images=reference_images,
+                bypass_prompt_cache=bypass_prompt_cache,
+                variants=variants,
+                on_image=on_image,
+            )
+        except BaseException:
+            UsageLimitService.release_usage(db, reservation)
+            raise
+
+        AgentService._schedule_save_generated_images(
+            id_user=id_user,
+            image_urls=imagenes_generadas,
+            product_id=product_id,
+            garment_type=AgentService._detect_garment_type(product_name or user_message),
+            sesion_id=sesion_id,
+            user_message=user_message,
         )
+        return imagenes_generadas, UsageLimitService.get_usage_status(db, id_user)
 
+    @staticmethod
+    async def _stream_catalog_customization(**kwargs: Any) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Variante de _apply_catalog_customization que emite cada opción en cuanto está lista
+
+        Emite ("image", url) por cada imagen y al final ("result", (imágenes, estado de uso)).
+        Los errores de _apply_catalog_customization se propagan igual.
+        """
+        ready: asyncio.Queue = asyncio.Queue()
+        task = asyncio.ensure_future(
+            AgentService._apply_catalog_customization(**kwargs, on_image=ready.put)
+        )
         try:
-            if AgentService._is_tryon_request(user_message):
-                respuesta_texto = (
-                    "Puedo tomar tu foto como referencia visual para colores, logos o estampados "
-                    "y aplicarlos sobre la prenda del catálogo que seleccionaste. "
-                    "Lo que todavía no puedo hacer es try-on ni ponerte la prenda sobre tu foto desde el chat."
-                )
-            elif AgentService._is_catalog_scope_break_request(user_message):
-                respuesta_texto = (
-                    "En esta fase solo puedo ayudarte con la prenda del catálogo que seleccionaste. "
-                    "Ahora mismo personalizo esa misma prenda con cambios de color, logos y patrones simples. "
-                    "Todavía no puedo crear prendas nuevas, armar outfits completos ni hacer try-on desde el chat."
+            while not task.done() or not ready.empty():
+                next_image = asyncio.ensure_future(ready.get())
+                await asyncio.wait({task, next_image}, return_when=asyncio.FIRST_COMPLETED)
+                if next_image.done():
+                    yield "image", next_image.result()
+                else:
+                    next_image.cancel()
+            yield "result", task.result()
+        finally:
+            if not task.done():
+                task.cancel()
+
+    @staticmethod
+    def _customization_applied_message(imagenes_generadas: List[str]) -> str:
+        if len(imagenes_generadas) > 1:
+            return AgentService.VARIANTS_APPLIED_MESSAGE.format(count=len(imagenes_generadas))
+        return AgentService.CUSTOMIZATION_APPLIED_MESSAGE
+
+    @staticmethod
+    async def _complete_agent_reply(
+        db: Session,
+        id_user: int,
+        sesion_id: int,
+        product_id: int,
+        product_name: Optional[str],
+        product_description: Optional[str],
+        product_image_url: Optional[str],
+        user_message: str,
+        history_context: str,
+        reference_images: Optional[List[str]],
+        respuesta_texto: str,
+        usage_status: Dict[str, Any],
+        variants: int = 1,
+    ) -> Tuple[str, List[str], Dict[str, Any]]:
+        """
+        Post-procesa la respuesta del modelo: detecta URLs de imágenes y, si el
+        asistente declara lista la personalización, la genera de verdad.
+
+        Returns:
+            Tupla (texto final, imágenes generadas, estado de uso)
+        """
+        imagenes_generadas = [
+            match[0] if isinstance(match, tuple) else match
+            for match in AgentService.IMAGE_URL_PATTERN.findall(respuesta_texto)
+        ]
+
+        if not imagenes_generadas and AgentService._assistant_declares_ready(respuesta_texto):
+            try:
+                imagenes_generadas, usage_status = await AgentService._apply_catalog_customization(
+                    db=db,
+                    id_user=id_user,
+                    sesion_id=sesion_id,
+                    product_id=product_id,
+                    product_name=product_name,
+                    product_description=product_description,
+                    product_image_url=product_image_url,
+                    user_message=user_message,
+                    history_context=history_context,
+                    reference_images=reference_images,
+                    variants=variants,
                 )
-            elif should_generate_image:
-                try:
-                    UsageLimitService.ensure_usage_available(db, id_user)
-                    imagenes_generadas = await AgentService._generate_catalog_customization(
-                        product_id=product_id,
-                        product_name=product_name,
-                        product_description=product_description,
-                        product_image_url=product_image_url,
+                if "ya apliqué la personalización" not in respuesta_texto.lower():
+                    respuesta_texto = AgentService._customization_applied_message(imagenes_generadas)
+            except UsageLimitExceededError as e:
+                usage_status = e.status
+                respuesta_texto = AgentService._build_usage_limit_message(e.status)
+                imagenes_generadas = []
+
+        return respuesta_texto, imagenes_generadas, usage_status
+
+    @staticmethod
+    async def _finish_turn(
+        db: Session,
+        sesion_id: int,
+        user_message: str,
+        respuesta_texto: str,
+        imagenes_generadas: List[str],
+        usage_status: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        """Guarda la respuesta del agente, programa el resumen y arma el resultado del turno."""
+        ia_metadata = {"imagenes_generadas": imagenes_generadas} if imagenes_generadas else None
+        mensaje = await AgentService.save_message(
+            db, sesion_id, TipoMensaje.ia, respuesta_texto, ia_metadata
+        )
+        SessionSummaryService.schedule_refresh(
+            sesion_id, user_message, respuesta_texto, covered_until=mensaje.timestamp
+        )
+
+        return {
+            "mensaje": respuesta_texto,
+            "imagenes_generadas": imagenes_generadas or None,
+            "usage_status": usage_status,
+        }
+
+    @staticmethod
+    async def process_user_message(
+        db: Session,
+        sesion_id: int,
+        user_message: str,
+        imagenes: Optional[List[str]] = None,
+        product_id: Optional[int] = None,
+        product_name: Optional[str] = None,
+        product_description: Optional[str] = None,
+        product_image_url: Optional[str] = None,
+        regenerar_prompt: bool = False,
+        variantes: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Procesa un mensaje del usuario y genera respuesta del agente
+
+        Args:
+            db: Sesión de base de datos
+            sesion_id: ID de la sesión
+            user_message: Mensaje del usuario
+            imagenes: URLs de imágenes adjuntas
+            regenerar_prompt: Fuerza un prompt de diseño nuevo en vez de reutilizar el memorizado
+            variantes: Opciones de diseño a generar (por defecto, las que pida el mensaje)
+
+        Returns:
+            Dict con respuesta de texto y URLs de imágenes detectadas/generadas
+        """
+        turn = await AgentService._prepare_turn(
+            db, sesion_id, user_message, imagenes, product_id
+        )
+        id_user = turn["id_user"]
+        context = turn["context"]
+
+        imagenes_generadas: List[str] = []
+        usage_status = UsageLimitService.get_usage_status(db, id_user)
+        intents = IntentDetector.detect(user_message)
+        should_generate_image = intents.generation or (
+            turn["has_previous_user_messages"] and intents.final_confirmation
+        )
+        variants = variantes or intents.variants
+
+        # Todas las llamadas a Gemini del turno comparten el mismo presupuesto de tiempo
+        with request_budget(settings.LLM_REQUEST_BUDGET_SECONDS):
+            try:
+                scripted_reply = AgentService._scripted_reply(user_message)
+                if scripted_reply:
+                    respuesta_texto = scripted_reply
+                elif should_generate_image:
+                    try:
+                        imagenes_generadas, usage_status = await AgentService._apply_catalog_customization(
+                            db=db,
+                            id_user=id_user,
+                            sesion_id=sesion_id,
+                            product_id=product_id,
+                            product_name=product_name,
+                            product_description=product_description,
+                            product_image_url=product_image_url,
+                            user_message=user_message,
+                            history_context=context,
+                            reference_images=imagenes,
+                            bypass_prompt_cache=regenerar_prompt,
+                            variants=variants,
+                        )
+                        respuesta_texto = AgentService._customization_applied_message(imagenes_generadas)
+                    except UsageLimitExceededError as e:
+                        usage_status = e.status
+                        respuesta_texto = AgentService._build_usage_limit_message(e.status)
+                else:
+                    response = await orchestrator.orchestrate(
                         user_message=user_message,
-                        history_context=context,
-                        reference_images=imagenes,
+                        context=AgentService._build_product_context(
+                            product_id=product_id,
+                            product_name=product_name,
+                            user_message=user_message,
+                            history_context=context,
+                            reference_images=imagenes,
+                        ),
+                        images=imagenes,
+                        intent="catalog_customization"
                     )
-                    AgentService._save_generated_images(
+                    respuesta_texto, imagenes_generadas, usage_status = await AgentService._complete_agent_reply(
                         db=db,
                         id_user=id_user,
-                        image_urls=imagenes_generadas,
-                        product_id=product_id,
-                        garment_type=AgentService._detect_garment_type(product_name or user_message),
                         sesion_id=sesion_id,
-                        user_message=user_message,
-                    )
-                    usage_status = UsageLimitService.register_usage(
-                        db, id_user, TipoUsoAgente.PERSONALIZACION
-                    )
-                    respuesta_texto = (
-                        "Listo, ya apliqué la personalización sobre la prenda seleccionada. "
-                        "Si quieres, ahora puedo hacer ajustes finos de color, tamaño, posición o patrón."
-                    )
-                except UsageLimitExceededError as e:
-                    usage_status = e.status
-                    respuesta_texto = AgentService._build_usage_limit_message(e.status)
-            else:
-                response = await orchestrator.orchestrate(
-                    user_message=user_message,
-                    context=AgentService._build_product_context(
                         product_id=product_id,
                         product_name=product_name,
+                        product_description=product_description,
+                        product_image_url=product_image_url,
                         user_message=user_message,
                         history_context=context,
                         reference_images=imagenes,
-                    ),
-                    images=imagenes,
-                    intent="catalog_customization"
-                )
-                respuesta_texto = response.content
-                detected_urls = [
-                    match[0] if isinstance(match, tuple) else match
-                    for match in AgentService.IMAGE_URL_PATTERN.findall(respuesta_texto)
-                ]
-                imagenes_generadas = detected_urls
-
-                if not imagenes_generadas and AgentService._assistant_declares_ready(respuesta_texto):
+                        respuesta_texto=response.content,
+                        usage_status=usage_status,
+                        variants=variants,
+                    )
+            except ClientDisconnectedError:
+                # Nadie va a leer la respuesta: el turno no se completa
+                raise
+            except Exception as e:
+                respuesta_texto = f"Lo siento, hubo un error al procesar tu mensaje: {str(e)}"
+                usage_status = UsageLimitService.get_usage_status(db, id_user)
+
+        return await AgentService._finish_turn(
+            db, sesion_id, user_message, respuesta_texto, imagenes_generadas, usage_status
+        )
+
+    @staticmethod
+    async def stream_user_message(
+        db: Session,
+        sesion_id: int,
+        user_message: str,
+        imagenes: Optional[List[str]] = None,
+        product_id: Optional[int] = None,
+        product_name: Optional[str] = None,
+        product_description: Optional[str] = None,
+        product_image_url: Optional[str] = None,
+        regenerar_prompt: bool = False,
+        variantes: Optional[int] = None,
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Variante en streaming de process_user_message
+
+        Emite eventos (nombre, datos):
+        - ("delta", {"texto": ...}): fragmento de la respuesta según llega de Gemini
+        - ("image", {"url": ...}): una opción de diseño generada, en cuanto está lista
+        - ("done", {...}): resultado final, igual al de process_user_message
+
+        El mensaje final de "done" es el que se guarda en BD; puede diferir del texto
+        transmitido si el turno terminó generando la personalización.
+        """
+        turn = await AgentService._prepare_turn(
+            db, sesion_id, user_message, imagenes, product_id
+        )
+        id_user = turn["id_user"]
+        context = turn["context"]
+
+        imagenes_generadas: List[str] = []
+        usage_status = UsageLimitService.get_usage_status(db, id_user)
+        intents = IntentDetector.detect(user_message)
+        should_generate_image = intents.generation or (
+            turn["has_previous_user_messages"] and intents.final_confirmation
+        )
+        variants = variantes or intents.variants
+
+        with request_budget(settings.LLM_REQUEST_BUDGET_SECONDS):
+            try:
+                scripted_reply = AgentService._scripted_reply(user_message)
+                if scripted_reply:
+                    respuesta_texto = scripted_reply
+                    yield "delta", {"texto": respuesta_texto}
+                elif should_generate_image:
                     try:
-                        UsageLimitService.ensure_usage_available(db, id_user)
-                        imagenes_generadas = await AgentService._generate_catalog_customization(
+                        async for event, payload in AgentService._stream_catalog_customization(
+                            db=db,
+                            id_user=id_user,
+                            sesion_id=sesion_id,
                             product_id=product_id,
                             product_name=product_name,
                             product_description=product_description,
@@ -598,41 +814,55 @@ class AgentService:
                             user_message=user_message,
                             history_context=context,
                             reference_images=imagenes,
-                        )
-                        AgentService._save_generated_images(
-                            db=db,
-                            id_user=id_user,
-                            image_urls=imagenes_generadas,
-                            product_id=product_id,
-                            garment_type=AgentService._detect_garment_type(product_name or user_message),
-                            sesion_id=sesion_id,
-                            user_message=user_message,
-                        )
-                        usage_status = UsageLimitService.register_usage(
-                            db, id_user, TipoUsoAgente.PERSONALIZACION
-                        )
-                        if "ya apliqué la personalización" not in respuesta_texto.lower():
-                            respuesta_texto = (
-                                "Listo, ya apliqué la personalización sobre la prenda seleccionada. "
-                                "Si quieres, ahora puedo hacer ajustes finos de color, tamaño, posición o patrón."
-                            )
+                            bypass_prompt_cache=regenerar_prompt,
+                            variants=variants,
+                        ):
+                            if event == "image":
+                                # Cada opción se muestra en cuanto está lista, sin esperar a las demás
+                                yield "image", {"url": payload}
+                            else:
+                                imagenes_generadas, usage_status = payload
+                        respuesta_texto = AgentService._customization_applied_message(imagenes_generadas)
                     except UsageLimitExceededError as e:
                         usage_status = e.status
                         respuesta_texto = AgentService._build_usage_limit_message(e.status)
-                        imagenes_generadas = []
-        except Exception as e:
-            respuesta_texto = f"Lo siento, hubo un error al procesar tu mensaje: {str(e)}"
-            usage_status = UsageLimitService.get_usage_status(db, id_user)
-
-        # Guardar respuesta del agente
-        ia_metadata = {"imagenes_generadas": imagenes_generadas} if imagenes_generadas else None
-        await AgentService.save_message(
-            db, sesion_id, TipoMensaje.ia, respuesta_texto, ia_metadata
-        )
+                    yield "delta", {"texto": respuesta_texto}
+                else:
+                    chunks: List[str] = []
+                    async for delta in orchestrator.orchestrate_stream(
+                        user_message=user_message,
+                        context=AgentService._build_product_context(
+                            product_id=product_id,
+                            product_name=product_name,
+                            user_message=user_message,
+                            history_context=context,
+                            reference_images=imagenes,
+                        ),
+                        images=imagenes,
+                    ):
+                        chunks.append(delta)
+                        yield "delta", {"texto": delta}
 
-        return {
-            "mensaje": respuesta_texto,
-            "imagenes_generadas": imagenes_generadas or None,
-            "usage_status": usage_status,
-        }
+                    respuesta_texto, imagenes_generadas, usage_status = await AgentService._complete_agent_reply(
+                        db=db,
+                        id_user=id_user,
+                        sesion_id=sesion_id,
+                        product_id=product_id,
+                        product_name=product_name,
+                        product_description=product_description,
+                        product_image_url=product_image_url,
+                        user_message=user_message,
+                        history_context=context,
+                        reference_images=imagenes,
+                        respuesta_texto="".join(chunks).strip()
+                        or "No se pudo generar una respuesta en este momento.",
+                        usage_status=usage_status,
+                        variants=variants,
+                    )
+            except Exception as e:
+                respuesta_texto = f"Lo siento, hubo un error al procesar tu mensaje: {str(e)}"
+                usage_status = UsageLimitService.get_usage_status(db, id_user)
 
+        yield "done", await AgentService._finish_turn(
+            db, sesion_id, user_message, respuesta_texto, imagenes_generadas, usage_status
+        )
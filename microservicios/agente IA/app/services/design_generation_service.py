@@ -1,13 +1,18 @@
 """
 Servicio para generar imagenes de disenos de prendas usando Replicate API.
 """
-import asyncio
 from typing import Any
 
 import httpx
 
 from app.config.settings import settings
-from app.config.storage import upload_remote_image
+from app.config.storage import storage
+from app.services.generation_cache import design_result_cache
+from app.services.intent_detector import IntentDetector
+from app.services.replicate_client import ReplicateCreateError, ReplicatePredictionClient, extract_output_url
+from app.services.replicate_predictions import ReplicateStatusError
+from app.utils.disconnect import ClientDisconnectedError
+from app.utils.stage_timings import stage
 
 
 class DesignGenerationService:
@@ -24,13 +29,7 @@ class DesignGenerationService:
         if not user_request:
             return prompt
 
-        message_lower = user_request.lower()
-        plain_markers = [
-            "liso", "sin estampado", "sin diseno", "sin diseño", "sin patrones", "sin patron",
-            "sin rayas", "plain", "solid", "no pattern", "no stripes", "minimalista"
-        ]
-
-        if any(marker in message_lower for marker in plain_markers):
+        if IntentDetector.detect(user_request).plain:
             prompt_lower = prompt.lower()
             if "no pattern" not in prompt_lower and "solid color" not in prompt_lower:
                 return f"{prompt}, solid color, no pattern, no stripes, no print"
@@ -43,13 +42,7 @@ class DesignGenerationService:
         if not user_request:
             return ", ".join(negative_parts)
 
-        message_lower = user_request.lower()
-        plain_markers = [
-            "liso", "sin estampado", "sin diseno", "sin diseño", "sin patrones", "sin patron",
-            "sin rayas", "plain", "solid", "no pattern", "no stripes", "minimalista"
-        ]
-
-        if any(marker in message_lower for marker in plain_markers):
+        if IntentDetector.detect(user_request).plain:
             negative_parts.append("pattern, stripes, striped, print, texture, graphic, logo, text")
 
         return ", ".join(negative_parts)
@@ -147,24 +140,49 @@ class DesignGenerationService:
         return " ".join(part for part in prompt_parts if part)
 
     @staticmethod
-    def _extract_generated_url(output: Any) -> str | None:
-        if isinstance(output, str) and output.strip():
-            return output.strip()
+    async def _run_prediction(
+        owner: str,
+        model_name: str,
+        input_payload: dict[str, Any],
+        replicate_token: str,
+    ) -> str:
+        """Crea la prediccion, espera su resultado y lo estabiliza en Cloudinary."""
+        client = ReplicatePredictionClient(replicate_token)
+        try:
+            with stage("replicate"):
+                result = await client.run(
+                    f"models/{owner}/{model_name}/predictions",
+                    {"input": input_payload},
+                    max_wait_seconds=settings.REPLICATE_DESIGN_MAX_WAIT_SECONDS,
+                )
+        except ReplicateCreateError as exc:
+            raise Exception(f"Error al crear prediccion en Replicate: {exc.detail}")
+        except ReplicateStatusError as exc:
+            raise Exception(f"Error al verificar estado: {exc.detail}")
 
-        if isinstance(output, list):
-            for item in output:
-                extracted = DesignGenerationService._extract_generated_url(item)
-                if extracted:
-                    return extracted
+        if result.get("status") == "failed":
+            error = result.get("error", "Unknown error")
+            raise Exception(f"La generacion fallo: {error}")
 
-        if isinstance(output, dict):
-            for key in ("url", "uri", "image", "image_url", "output"):
-                value = output.get(key)
-                extracted = DesignGenerationService._extract_generated_url(value)
-                if extracted:
-                    return extracted
+        if result.get("status") == "canceled":
+            raise Exception("La generacion fue cancelada por Replicate")
 
-        return None
+        if result.get("status") != "succeeded":
+            raise Exception("Timeout: La generacion tardo demasiado")
+
+        generated_url = extract_output_url(result.get("output"))
+        if not generated_url:
+            raise Exception("No se pudo obtener la URL de la imagen generada")
+
+        with stage("upload"):
+            uploaded_result = await storage.put_remote(
+                generated_url,
+                folder="generated/designs"
+            )
+        if uploaded_result.get("url"):
+            return uploaded_result["url"]
+
+        raise Exception("No se pudo estabilizar la imagen generada")
 
     @staticmethod
     async def generate_design_image(
@@ -174,11 +192,15 @@ class DesignGenerationService:
         height: int = 1024,
         image_input: str | None = None,
         extra_image_inputs: list[str] | None = None,
-        creativity: float | None = None
+        creativity: float | None = None,
+        bypass_cache: bool = False,
     ) -> str:
         """
         Genera una imagen de un diseno de prenda usando Nano Banana en Replicate.
 
+        Entradas identicas (prompt final, referencias, formato y modelo) reutilizan la
+        imagen ya estabilizada, y las peticiones simultaneas comparten una sola prediccion.
+
         Args:
             prompt: Descripcion del diseno a generar
             negative_prompt: Cosas a evitar en la imagen
@@ -186,6 +208,7 @@ class DesignGenerationService:
             height: Alto solicitado
             image_input: Imagen base opcional en URL o data URI
             creativity: Nivel de creatividad opcional
+            bypass_cache: Fuerza una prediccion nueva aunque haya un resultado cacheado
 
         Returns:
             URL de la imagen generada y estabilizada en Cloudinary
@@ -224,66 +247,25 @@ class DesignGenerationService:
             if reference_images:
                 input_payload["image_input"] = reference_images
 
-            async with httpx.AsyncClient(timeout=120.0) as client:
-                response = await client.post(
-                    f"https://api.replicate.com/v1/models/{owner}/{model_name}/predictions",
-                    headers={
-                        "Authorization": f"Token {replicate_token}",
-                        "Content-Type": "application/json",
-                        "Prefer": "wait=60",
-                    },
-                    json={"input": input_payload},
+            def run_prediction():
+                return DesignGenerationService._run_prediction(
+                    owner, model_name, input_payload, replicate_token
                 )
 
-                if response.status_code not in (200, 201):
-                    raise Exception(f"Error al crear prediccion en Replicate: {response.text}")
-
-                prediction = response.json()
-                prediction_id = prediction.get("id")
-                result = prediction
+            if not settings.DESIGN_RESULT_CACHE_ENABLED:
+                return await run_prediction()
 
-                if result.get("status") not in {"succeeded", "failed", "canceled"}:
-                    if not prediction_id:
-                        raise Exception("Replicate no devolvio un id de prediccion valido")
-
-                    for _ in range(60):
-                        await asyncio.sleep(2)
-
-                        status_response = await client.get(
-                            f"https://api.replicate.com/v1/predictions/{prediction_id}",
-                            headers={"Authorization": f"Token {replicate_token}"},
-                        )
-
-                        if status_response.status_code != 200:
-                            raise Exception(f"Error al verificar estado: {status_response.text}")
-
-                        result = status_response.json()
-                        if result.get("status") in {"succeeded", "failed", "canceled"}:
-                            break
-
-                if result.get("status") == "failed":
-                    error = result.get("error", "Unknown error")
-                    raise Exception(f"La generacion fallo: {error}")
-
-                if result.get("status") == "canceled":
-                    raise Exception("La generacion fue cancelada por Replicate")
-
-                if result.get("status") != "succeeded":
-                    raise Exception("Timeout: La generacion tardo demasiado")
-
-                generated_url = DesignGenerationService._extract_generated_url(result.get("output"))
-                if not generated_url:
-                    raise Exception("No se pudo obtener la URL de la imagen generada")
-
-                uploaded_result = await upload_remote_image(
-                    generated_url,
-                    folder="generated/designs"
-                )
-                if uploaded_result.get("url"):
-                    return uploaded_result["url"]
-
-                raise Exception("No se pudo estabilizar la imagen generada")
+            model = f"{owner}/{model_name}"
+            cache_key = await design_result_cache.key_for(final_prompt, reference_images, aspect_ratio, model)
+            return await design_result_cache.get_or_generate(
+                cache_key,
+                model,
+                run_prediction,
+                bypass_cache=bypass_cache,
+            )
 
+        except ClientDisconnectedError:
+            raise
         except httpx.TimeoutException:
             raise Exception("Timeout al conectar con Replicate API")
         except Exception as e:
@@ -300,11 +282,4 @@ class DesignGenerationService:
         Returns:
             True si se debe generar una imagen
         """
-        keywords = [
-            "muestrame", "muéstrame", "ver", "visualizar", "imagen",
-            "como se veria", "como se vería", "quiero ver", "ensename",
-            "enséñame", "genera", "crea imagen", "mostrar", "crea", "disena",
-            "diseña", "camisa", "camiseta", "blusa", "pantalon", "pantalones", "ropa"
-        ]
-        message_lower = user_message.lower()
-        return any(keyword in message_lower for keyword in keywords)
+        return IntentDetector.detect(user_message).show_image
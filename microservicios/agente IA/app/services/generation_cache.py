@@ -0,0 +1,214 @@
+"""
+Cache de resultados de generación de diseño
+
+Un "genérala" repetido o un doble clic produce exactamente las mismas entradas
+para Replicate. En lugar de pagar otra predicción y otra subida a Cloudinary,
+se reutiliza la URL ya estabilizada:
+
+1. Tier en memoria (LRU con TTL) dentro del proceso
+2. Tier persistente en MySQL (tabla cache_generaciones_diseno)
+3. Peticiones idénticas simultáneas comparten una sola predicción en curso;
+   se cancela solo cuando ya no queda nadie esperándola
+"""
+import asyncio
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.config.database import SessionLocal
+from app.config.settings import settings
+from app.models import GeneracionDisenoCache
+from app.utils.cache import TTLCache
+from app.utils.disconnect import (
+    ClientDisconnectedError,
+    await_unless_disconnected,
+    never_disconnected,
+    watch_disconnect,
+)
+from app.utils.metrics import metrics
+from app.utils.content_hashes import resolve_image_identity
+
+logger = logging.getLogger(__name__)
+
+DESIGN_RESULT_CACHE_EVENTS = metrics.counter(
+    "agent_design_result_cache_events_total",
+    "Búsquedas en el cache de generaciones (memory_hit, persistent_hit, coalesced, miss, bypass)",
+    ("event",),
+)
+
+
+class DesignResultCache:
+    """Cache de dos niveles de URLs generadas, con coalescencia de generaciones en curso."""
+
+    def __init__(
+        self,
+        max_entries: int = settings.DESIGN_RESULT_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = settings.DESIGN_RESULT_CACHE_TTL_SECONDS,
+        persistent: bool = settings.DESIGN_RESULT_CACHE_PERSISTENT,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.persistent = persistent
+        self._memory: TTLCache[str, str] = TTLCache(max_entries, ttl_seconds)
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[str, int] = {}
+
+    @staticmethod
+    async def key_for(final_prompt: str, reference_images: List[str], aspect_ratio: str, model: str) -> str:
+        """SHA-256 de las entradas que determinan la imagen generada (referencias por hash de contenido si se conoce)."""
+        references = await asyncio.gather(*(resolve_image_identity(image) for image in reference_images))
+        payload = json.dumps(
+            {
+                "prompt": final_prompt.strip(),
+                "references": list(references),
+                "aspect_ratio": aspect_ratio,
+                "model": model,
+            },
+            ensure_ascii=False,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _load_persistent(self, key: str) -> Optional[str]:
+        db = SessionLocal()
+        try:
+            row = (
+                db.query(GeneracionDisenoCache)
+                .filter(
+                    GeneracionDisenoCache.clave == key,
+                    GeneracionDisenoCache.expira_en > datetime.utcnow(),
+                )
+                .first()
+            )
+            return row.image_url if row else None
+        finally:
+            db.close()
+
+    def _store_persistent(self, key: str, image_url: str, model: str) -> None:
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            db.merge(
+                GeneracionDisenoCache(
+                    clave=key,
+                    image_url=image_url,
+                    modelo=model,
+                    created_at=now,
+                    expira_en=now + timedelta(seconds=self.ttl_seconds),
+                )
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    async def get(self, key: str) -> Optional[str]:
+        """Busca una URL en memoria y, si está habilitado, en MySQL."""
+        image_url = self._memory.get(key)
+        if image_url is not None:
+            DESIGN_RESULT_CACHE_EVENTS.inc(event="memory_hit")
+            return image_url
+        if not self.persistent:
+            return None
+
+        try:
+            image_url = await asyncio.to_thread(self._load_persistent, key)
+        except Exception as exc:
+            logger.warning("No se pudo leer el cache persistente de generaciones: %s", exc)
+            return None
+
+        if image_url is not None:
+            DESIGN_RESULT_CACHE_EVENTS.inc(event="persistent_hit")
+            self._memory.set(key, image_url)
+        return image_url
+
+    async def set(self, key: str, image_url: str, model: str) -> None:
+        """Guarda una URL en memoria y, si está habilitado, en MySQL."""
+        self._memory.set(key, image_url)
+        if not self.persistent:
+            return
+
+        try:
+            await asyncio.to_thread(self._store_persistent, key, image_url, model)
+        except Exception as exc:
+            logger.warning("No se pudo escribir el cache persistente de generaciones: %s", exc)
+
+    async def get_or_generate(
+        self,
+        key: str,
+        model: str,
+        generate: Callable[[], Awaitable[str]],
+        bypass_cache: bool = False,
+    ) -> str:
+        """
+        URL cacheada para `key`, o la genera una sola vez aunque lleguen varias peticiones
+
+        Args:
+            key: Clave de key_for
+            model: Modelo de Replicate (se guarda con la entrada)
+            generate: Corrutina que crea la predicción y devuelve la URL estabilizada
+            bypass_cache: No reutiliza resultados guardados (sí se une a una generación en curso
+                y guarda el resultado nuevo)
+        """
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            DESIGN_RESULT_CACHE_EVENTS.inc(event="coalesced")
+            return await self._wait_shared(key, in_flight)
+
+        if bypass_cache:
+            DESIGN_RESULT_CACHE_EVENTS.inc(event="bypass")
+        else:
+            cached = await self.get(key)
+            if cached is not None:
+                return cached
+            # Otra petición pudo empezar la misma generación mientras se leía MySQL
+            in_flight = self._in_flight.get(key)
+            if in_flight is not None:
+                DESIGN_RESULT_CACHE_EVENTS.inc(event="coalesced")
+                return await self._wait_shared(key, in_flight)
+            DESIGN_RESULT_CACHE_EVENTS.inc(event="miss")
+
+        task = asyncio.create_task(self._generate_and_store(key, model, generate))
+        self._in_flight[key] = task
+        task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await self._wait_shared(key, task)
+
+    async def _wait_shared(self, key: str, task: asyncio.Task) -> str:
+        """
+        Espera una generación compartida
+
+        shield: si esta petición se cancela o su cliente se desconecta, las que se
+        unieron siguen esperando; la generación se cancela con la última que se va.
+        """
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await await_unless_disconnected(asyncio.shield(task))
+        except (ClientDisconnectedError, asyncio.CancelledError):
+            if self._waiters[key] == 1 and not task.done():
+                task.cancel()
+            raise
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+
+    async def _generate_and_store(self, key: str, model: str, generate: Callable[[], Awaitable[str]]) -> str:
+        # La generación compartida no sigue la conexión de quien la inició (ver _wait_shared)
+        with watch_disconnect(never_disconnected):
+            image_url = await generate()
+        await self.set(key, image_url, model)
+        return image_url
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores del tier en memoria y generaciones en curso."""
+        memory_stats = self._memory.stats()
+        return {
+            "memory_hits": memory_stats["hits"],
+            "memory_misses": memory_stats["misses"],
+            "memory_size": memory_stats["size"],
+            "in_flight": len(self._in_flight),
+        }
+
+
+# Instancia global del cache de generaciones
+design_result_cache = DesignResultCache()
@@ -1,11 +1,16 @@
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 from app.models import Imagen, FotoUsuario, PruebaVirtual, TipoImagen, EstadoImagen
-from app.config.storage import upload_image, upload_remote_image, delete_image
+from app.config.storage import storage
+from app.services.upload_registry import UploadRegistry
+from app.utils.image_normalization import normalize_image, normalized_filename
+from app.utils.stage_timings import stage
+from app.utils.uploads import UploadRejectedError, hash_upload, validate_image_upload
+from app.config.settings import settings
 from fastapi import UploadFile
-from typing import Optional
-import os
-import uuid
+from typing import List, Optional
+import asyncio
+import io
 import re
 
 
@@ -43,31 +48,82 @@ class ImageService:
         return ImageService.SESSION_MARKER_PATTERN.sub("", normalized_prompt).strip() or None
 
     @staticmethod
-    async def _persist_remote_image_if_needed(image_url: str, folder: str) -> str:
+    async def _persist_remote_image_if_needed(image_url: str, folder: str) -> dict:
         normalized_url = (image_url or "").strip()
         if not normalized_url:
             raise ValueError("La URL de la imagen es obligatoria")
 
         is_remote_url = normalized_url.startswith("http://") or normalized_url.startswith("https://")
-        already_stable = "res.cloudinary.com" in normalized_url
+        already_stable = storage.owns(normalized_url)
 
         if not is_remote_url or already_stable:
-            return normalized_url
+            return {"url": normalized_url, **storage.derivatives(normalized_url)}
 
-        uploaded_result = await upload_remote_image(normalized_url, folder=folder)
-        stable_url = uploaded_result.get("url")
-
-        if not stable_url:
+        uploaded_result = await storage.put_remote(normalized_url, folder=folder)
+        if not uploaded_result.get("url"):
             raise Exception("No se pudo almacenar la imagen remota en Cloudinary")
 
-        return stable_url
+        return uploaded_result
+
+    @staticmethod
+    async def _upload_file(
+        file: UploadFile,
+        folder: str,
+        normalize: bool = False,
+        id_user: Optional[int] = None,
+    ) -> dict:
+        """
+        Valida la imagen subida y la envía al almacenamiento por trozos
+
+        Con normalize (fotos de persona y referencias) se orienta, reduce y recodifica
+        antes de subirla; si no se puede decodificar se sube el original.
+
+        Con id_user se deduplica por el SHA-256 del contenido original: si el usuario
+        ya subió esa imagen, se devuelve la URL existente ("reused": True) sin subirla.
+
+        Raises:
+            UploadRejectedError: Si la imagen está vacía, es demasiado grande o no es un formato admitido
+        """
+        normalize = normalize and settings.IMAGE_NORMALIZE_ENABLED
+        await validate_image_upload(file, max_bytes=settings.IMAGE_NORMALIZE_MAX_INPUT_BYTES if normalize else None)
+
+        if id_user is None or not settings.UPLOAD_DEDUP_ENABLED:
+            return await ImageService._store_file(file, folder, normalize)
+
+        with stage("dedup"):
+            content_hash = await hash_upload(file)
+            existing = await UploadRegistry.find(id_user, content_hash)
+        if existing:
+            return {**existing, **storage.derivatives(existing["url"]), "content_hash": content_hash, "reused": True}
+
+        result = await ImageService._store_file(file, folder, normalize)
+        if result.get("url"):
+            await UploadRegistry.register(id_user, content_hash, result["url"], result.get("public_id"))
+        return {**result, "content_hash": content_hash, "reused": False}
+
+    @staticmethod
+    async def _store_file(file: UploadFile, folder: str, normalize: bool) -> dict:
+        if not normalize:
+            return await storage.put(file.file, folder=folder, filename=file.filename)
+
+        with stage("normalize"):
+            # Decodificar exige la imagen completa; el tamaño ya está acotado por la validación
+            normalized = await normalize_image(await file.read())
+        if normalized is None:
+            await file.seek(0)
+            return await storage.put(file.file, folder=folder, filename=file.filename)
+        return await storage.put(io.BytesIO(normalized), folder=folder, filename=normalized_filename(file.filename))
 
     @staticmethod
     def _serialize_image_row(row):
+        # Las filas anteriores a las derivadas no las tienen guardadas: se calculan de la URL
+        derivatives = storage.derivatives(row.image_url)
         return {
             "id": row.id,
             "id_user": row.id_user,
             "image_url": row.image_url,
+            "thumbnail_url": getattr(row, "thumbnail_url", None) or derivatives["thumbnail_url"],
+            "medium_url": getattr(row, "medium_url", None) or derivatives["medium_url"],
             "session_id": ImageService._extract_session_id(getattr(row, "prompt", None)),
             "variant_id": getattr(row, "variant_id", None),
             "tipo": "usuario_diseño",
@@ -87,21 +143,41 @@ class ImageService:
         """
         Sube una imagen de referencia temporal para el agente sin guardarla en BD.
         """
-        temp_path = f"uploads/{uuid.uuid4()}_{file.filename}"
-        os.makedirs("uploads", exist_ok=True)
+        result = await ImageService._upload_file(
+            file, folder=f"users/{id_user}/references", normalize=True, id_user=id_user
+        )
+        if not result.get("url"):
+            raise Exception("No se pudo subir la referencia a Cloudinary")
+        return result["url"]
 
-        with open(temp_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+    @staticmethod
+    async def upload_reference_images(files: List[UploadFile], id_user: int) -> List[dict]:
+        """
+        Sube varias referencias a la vez (como mucho REFERENCE_BATCH_MAX_CONCURRENCY en vuelo)
 
-        try:
-            result = await upload_image(temp_path, folder=f"users/{id_user}/references")
-            if not result.get("url"):
-                raise Exception("No se pudo subir la referencia a Cloudinary")
-            return result["url"]
-        finally:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+        Un archivo que falla no afecta a los demás: cada resultado lleva su URL o su error.
+
+        Returns:
+            Un dict por archivo (filename, url, error, status_code) en el orden recibido
+        """
+        semaphore = asyncio.Semaphore(settings.REFERENCE_BATCH_MAX_CONCURRENCY)
+
+        async def upload_one(file: UploadFile) -> dict:
+            async with semaphore:
+                try:
+                    url = await ImageService.upload_reference_image(file, id_user)
+                except UploadRejectedError as e:
+                    return {"filename": file.filename, "url": None, "error": e.detail, "status_code": e.status_code}
+                except Exception as e:
+                    return {
+                        "filename": file.filename,
+                        "url": None,
+                        "error": f"Error al subir referencia: {str(e)}",
+                        "status_code": 500,
+                    }
+            return {"filename": file.filename, "url": url, "error": None, "status_code": 200}
+
+        return list(await asyncio.gather(*(upload_one(file) for file in files)))
     
     @staticmethod
     async def save_user_design_image(
@@ -122,34 +198,23 @@ class ImageService:
         Returns:
             Imagen guardada
         """
-        # Guardar temporalmente
-        temp_path = f"uploads/{uuid.uuid4()}_{file.filename}"
-        os.makedirs("uploads", exist_ok=True)
-        
-        with open(temp_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
-        
-        try:
-            # Subir a Cloudinary
-            result = await upload_image(temp_path, folder=f"users/{id_user}/designs")
-            
-            # Guardar en BD
-            imagen = Imagen(
-                id_user=id_user,
-                image_url=result["url"],
-                variant_id=variant_id,
-                tipo=TipoImagen.USUARIO_DISEÑO
-            )
-            db.add(imagen)
-            db.commit()
-            db.refresh(imagen)
-            
-            return imagen
-        finally:
-            # Eliminar archivo temporal
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+        # Subir a Cloudinary
+        result = await ImageService._upload_file(file, folder=f"users/{id_user}/designs")
+
+        # Guardar en BD
+        imagen = Imagen(
+            id_user=id_user,
+            image_url=result["url"],
+            thumbnail_url=result.get("thumbnail_url"),
+            medium_url=result.get("medium_url"),
+            variant_id=variant_id,
+            tipo=TipoImagen.USUARIO_DISEÑO
+        )
+        db.add(imagen)
+        db.commit()
+        db.refresh(imagen)
+
+        return imagen
     
     @staticmethod
     async def save_user_photo(
@@ -168,41 +233,41 @@ class ImageService:
             es_principal: Si es la foto principal
             
         Returns:
-            FotoUsuario guardada
+            FotoUsuario guardada (la ya existente si el usuario subió la misma foto)
         """
+        # Subir a Cloudinary (o reutilizar la misma foto ya subida)
+        result = await ImageService._upload_file(
+            file, folder=f"users/{id_user}/photos", normalize=True, id_user=id_user
+        )
+
         # Si es principal, quitar la marca de otras fotos
         if es_principal:
             db.query(FotoUsuario).filter(
                 FotoUsuario.id_user == id_user
             ).update({"es_principal": False})
-        
-        # Guardar temporalmente
-        temp_path = f"uploads/{uuid.uuid4()}_{file.filename}"
-        os.makedirs("uploads", exist_ok=True)
-        
-        with open(temp_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
-        
-        try:
-            # Subir a Cloudinary
-            result = await upload_image(temp_path, folder=f"users/{id_user}/photos")
-            
-            # Guardar en BD
-            foto = FotoUsuario(
-                id_user=id_user,
-                foto_url=result["url"],
-                es_principal=es_principal
-            )
-            db.add(foto)
-            db.commit()
-            db.refresh(foto)
-            
-            return foto
-        finally:
-            # Eliminar archivo temporal
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+
+        if result.get("reused"):
+            foto = db.query(FotoUsuario).filter(
+                FotoUsuario.id_user == id_user,
+                FotoUsuario.foto_url == result["url"]
+            ).first()
+            if foto:
+                foto.es_principal = es_principal or foto.es_principal
+                db.commit()
+                db.refresh(foto)
+                return foto
+
+        # Guardar en BD
+        foto = FotoUsuario(
+            id_user=id_user,
+            foto_url=result["url"],
+            es_principal=es_principal
+        )
+        db.add(foto)
+        db.commit()
+        db.refresh(foto)
+
+        return foto
     
     @staticmethod
     async def get_user_photos(db: Session, id_user: int):
@@ -282,14 +347,16 @@ class ImageService:
         garment_type: Optional[str] = None
     ) -> Imagen:
         """Guarda una URL de imagen generada (sin subir archivo)."""
-        stable_image_url = await ImageService._persist_remote_image_if_needed(
+        stable_image = await ImageService._persist_remote_image_if_needed(
             image_url,
             folder=f"users/{id_user}/generated"
         )
 
         imagen = Imagen(
             id_user=id_user,
-            image_url=stable_image_url,
+            image_url=stable_image["url"],
+            thumbnail_url=stable_image.get("thumbnail_url"),
+            medium_url=stable_image.get("medium_url"),
             variant_id=variant_id,
             tipo=getattr(tipo, "value", tipo) or "usuario_diseño",
             prompt=ImageService._with_session_marker(prompt, session_id),
@@ -308,6 +375,8 @@ class ImageService:
             Imagen.id,
             Imagen.id_user,
             Imagen.image_url,
+            Imagen.thumbnail_url,
+            Imagen.medium_url,
             Imagen.variant_id,
             Imagen.prompt,
             Imagen.garment_type,
@@ -341,6 +410,8 @@ class ImageService:
             Imagen.id,
             Imagen.id_user,
             Imagen.image_url,
+            Imagen.thumbnail_url,
+            Imagen.medium_url,
             Imagen.prompt,
             Imagen.garment_type,
             Imagen.estado,
@@ -369,6 +440,8 @@ class ImageService:
             Imagen.id,
             Imagen.id_user,
             Imagen.image_url,
+            Imagen.thumbnail_url,
+            Imagen.medium_url,
             Imagen.variant_id,
             Imagen.prompt,
             Imagen.garment_type,
@@ -395,6 +468,8 @@ class ImageService:
             Imagen.id,
             Imagen.id_user,
             Imagen.image_url,
+            Imagen.thumbnail_url,
+            Imagen.medium_url,
             Imagen.variant_id,
             Imagen.prompt,
             Imagen.garment_type,
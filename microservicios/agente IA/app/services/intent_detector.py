@@ -0,0 +1,148 @@
+"""
+Detector de intenciones del chat de personalización
+
+Todas las listas de palabras clave del flujo (try-on, fuera de alcance,
+generación, confirmación, prenda, "liso", opciones, ...) se compilan en un único
+autómata: cada mensaje se normaliza (minúsculas, sin tildes) y se recorre una
+sola vez para obtener todas las intenciones y el tipo de prenda a la vez.
+"""
+from dataclasses import dataclass
+from functools import lru_cache
+
+from app.utils.text_matcher import KeywordMatcher, fold_text
+
+# Las palabras se escriben sin tildes: el texto y las palabras se normalizan igual
+TRYON_KEYWORDS = (
+    "try on", "try-on", "probarme", "pruebamela", "ponmela", "ponermela", "visteme",
+    "sobre mi foto", "sobre mi cuerpo", "en mi cuerpo", "usando mi foto",
+    "como me veria", "como me quedaria",
+)
+SCOPE_BREAK_KEYWORDS = (
+    "outfit", "combina", "conjunto", "prenda nueva", "crea una prenda", "generar prenda",
+    "desde cero", "nuevo modelo", "nueva sudadera", "nueva camisa", "nueva camiseta",
+)
+GENERATION_KEYWORDS = (
+    "genera", "muestrame", "muestrala", "muestralo", "mostrar",
+    "como se veria", "como quedaria", "hazla", "hazlo", "renderiza",
+    "visualizala", "visualizar", "aplicalo", "aplicala",
+)
+FINAL_CONFIRMATION_KEYWORDS = (
+    "asi esta bien", "asi esta perfecto", "dejalo asi", "solo asi", "listo",
+    "quedo bien", "esta bien asi", "perfecto asi",
+)
+ASSISTANT_READY_KEYWORDS = (
+    "listo, ya aplique la personalizacion",
+    "tu personalizacion ha sido aplicada",
+    "ya realice la personalizacion",
+    "ya quedo la personalizacion",
+    "quedo lista la personalizacion",
+    "tu camiseta personalizada tendra",
+    "tu prenda personalizada tendra",
+    "entonces, tu camiseta",
+    "entonces, tu prenda",
+)
+# Pedidos que justifican mostrar una imagen (DesignGenerationService.should_generate_image)
+SHOW_IMAGE_KEYWORDS = (
+    "muestrame", "ver", "visualizar", "imagen", "como se veria", "quiero ver", "ensename",
+    "genera", "crea imagen", "mostrar", "crea", "disena",
+    "camisa", "camiseta", "blusa", "pantalon", "pantalones", "ropa",
+)
+# Pedidos de prenda lisa (sin estampado)
+PLAIN_KEYWORDS = (
+    "liso", "sin estampado", "sin diseno", "sin patrones", "sin patron",
+    "sin rayas", "plain", "solid", "no pattern", "no stripes", "minimalista",
+)
+# Pedidos de varias opciones en un mismo turno; si aparecen varios gana el mayor
+VARIANT_KEYWORDS = {
+    3: (
+        "tres opciones", "3 opciones", "tres variantes", "3 variantes", "tres versiones",
+        "3 versiones", "varias opciones", "varias versiones", "algunas opciones",
+    ),
+    2: (
+        "dos opciones", "2 opciones", "dos variantes", "2 variantes", "dos versiones",
+        "2 versiones", "un par de opciones", "otra opcion ademas",
+    ),
+}
+# Tipos de prenda en orden de prioridad: si aparecen varios gana el primero
+GARMENT_KEYWORDS = {
+    "pantalon": (
+        "pantalon", "jean", "denim", "jogger", "sudadera", "leggings", "short",
+        "bermuda", "falda", "falta",
+    ),
+    "chaqueta": ("chaqueta", "abrigo", "buzo", "saco", "hoodie", "sueter", "sweater", "blazer"),
+    "camiseta": ("camisa", "camiseta", "blusa", "polo", "top"),
+}
+DEFAULT_GARMENT_TYPE = "camiseta"
+
+_MATCHER = KeywordMatcher({
+    "tryon": TRYON_KEYWORDS,
+    "scope_break": SCOPE_BREAK_KEYWORDS,
+    "generation": GENERATION_KEYWORDS,
+    "final_confirmation": FINAL_CONFIRMATION_KEYWORDS,
+    "assistant_ready": ASSISTANT_READY_KEYWORDS,
+    "show_image": SHOW_IMAGE_KEYWORDS,
+    "plain": PLAIN_KEYWORDS,
+    **{f"garment:{garment}": keywords for garment, keywords in GARMENT_KEYWORDS.items()},
+    **{f"variants:{count}": keywords for count, keywords in VARIANT_KEYWORDS.items()},
+})
+
+
+@dataclass(frozen=True)
+class MessageIntents:
+    """Intenciones detectadas en un texto"""
+    tryon: bool = False
+    scope_break: bool = False
+    generation: bool = False
+    final_confirmation: bool = False
+    assistant_ready: bool = False
+    show_image: bool = False
+    plain: bool = False
+    garment_type: str = DEFAULT_GARMENT_TYPE
+    variants: int = 1  # Opciones pedidas ("dos o tres opciones" -> 3)
+
+    @property
+    def out_of_scope(self) -> bool:
+        return self.tryon or self.scope_break
+
+
+@lru_cache(maxsize=2048)
+def _detect(text: str) -> MessageIntents:
+    labels = _MATCHER.find(fold_text(text), folded=True)
+    garment_type = next(
+        (garment for garment in GARMENT_KEYWORDS if f"garment:{garment}" in labels),
+        DEFAULT_GARMENT_TYPE,
+    )
+    variants = max(
+        (count for count in VARIANT_KEYWORDS if f"variants:{count}" in labels),
+        default=1,
+    )
+    return MessageIntents(
+        tryon="tryon" in labels,
+        scope_break="scope_break" in labels,
+        generation="generation" in labels,
+        final_confirmation="final_confirmation" in labels,
+        assistant_ready="assistant_ready" in labels,
+        show_image="show_image" in labels,
+        plain="plain" in labels,
+        garment_type=garment_type,
+        variants=variants,
+    )
+
+
+class IntentDetector:
+    """Detección de intenciones en una sola pasada sobre el texto normalizado"""
+
+    @staticmethod
+    def detect(text: str) -> MessageIntents:
+        """
+        Detecta todas las intenciones y el tipo de prenda de un texto
+
+        El resultado se memoriza: en un mismo turno el mensaje se consulta varias veces.
+
+        Args:
+            text: Mensaje del usuario (o del asistente para assistant_ready)
+
+        Returns:
+            MessageIntents con todas las banderas
+        """
+        return _detect(text or "")
@@ -0,0 +1,458 @@
+"""
+Trabajos de generación asíncronos
+
+Las generaciones con Replicate tardan de 30 s a 3 min. Con la cabecera
+"Prefer: respond-async" los endpoints de generación guardan un trabajo, responden
+202 con su id y un pool acotado de workers lo ejecuta; el cliente consulta
+GET /jobs/{id} o se suscribe a GET /jobs/{id}/events (SSE).
+
+1. JobService.submit: valida capacidad, guarda el trabajo (pendiente) y lo encola
+2. GenerationJobRunner: JOB_WORKERS tareas que reclaman y ejecutan trabajos
+3. Al arrancar se vuelven a encolar los trabajos pendientes y los de diseño que
+   quedaron en proceso por una caída (más antiguos que JOB_TIMEOUT_SECONDS). Los
+   turnos de chat y try-on interrumpidos se marcan como fallidos: repetirlos
+   guardaría dos veces el mensaje, reservaría otro uso o pagaría otra predicción
+
+El reclamo es un UPDATE condicionado al estado "pendiente": si varias réplicas
+del servicio encolan el mismo trabajo solo una lo ejecuta.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.config.database import SessionLocal
+from app.config.settings import settings
+from app.models import EstadoTrabajo, TipoTrabajo, TrabajoGeneracion
+from app.schemas import ChatResponse, TryOnResponse
+from app.services.agent_service import AgentService
+from app.services.design_generation_service import DesignGenerationService
+from app.services.tryon_service import TryOnService
+from app.services.usage_limit_service import UsageLimitExceededError, UsageLimitService
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_JOB_STATES = frozenset({EstadoTrabajo.COMPLETADO, EstadoTrabajo.FALLIDO})
+# Tipos que se pueden repetir desde el principio si se interrumpen (sin efectos previos que dupliquen)
+RERUNNABLE_JOB_TYPES = frozenset({TipoTrabajo.DISENO})
+INTERRUPTED_JOB_MESSAGE = "La generación se interrumpió por un reinicio del servicio. Vuelve a enviarla."
+
+JOBS = metrics.counter(
+    "agent_jobs_total",
+    "Trabajos de generación por tipo y resultado (aceptado, rechazado, completado, fallido)",
+    ("tipo", "estado"),
+)
+JOB_DURATION = metrics.histogram(
+    "agent_job_duration_seconds",
+    "Duración de la ejecución de un trabajo de generación",
+    ("tipo", "estado"),
+    buckets=(1.0, 5.0, 10.0, 20.0, 30.0, 60.0, 90.0, 120.0, 180.0, 300.0),
+)
+JOB_QUEUE_WAIT = metrics.histogram(
+    "agent_job_queue_wait_seconds",
+    "Espera de un trabajo en la cola hasta que un worker lo toma",
+    ("tipo",),
+)
+JOBS_QUEUED = metrics.gauge("agent_jobs_queued", "Trabajos en la cola del proceso", ())
+JOBS_RUNNING = metrics.gauge("agent_jobs_running", "Trabajos ejecutándose en el proceso", ())
+
+
+class JobQueueFullError(Exception):
+    """La cola de trabajos del proceso está llena"""
+
+
+JobHandler = Callable[[Session, Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+async def _run_design(db: Session, params: Dict[str, Any]) -> Dict[str, Any]:
+    image_url = await DesignGenerationService.generate_design_image(**params)
+    return {"url": image_url}
+
+
+async def _run_chat(db: Session, params: Dict[str, Any]) -> Dict[str, Any]:
+    sesion_id = params["sesion_id"]
+    respuesta = await AgentService.process_user_message(
+        db,
+        sesion_id,
+        params["mensaje"],
+        params.get("imagenes"),
+        params.get("product_id"),
+        params.get("product_name"),
+        params.get("product_description"),
+        params.get("product_image_url"),
+        params.get("regenerar_prompt", False),
+        params.get("variantes"),
+    )
+    usage_status = respuesta["usage_status"]
+    return ChatResponse(
+        sesion_id=sesion_id,
+        mensaje=respuesta["mensaje"],
+        imagenes_generadas=respuesta.get("imagenes_generadas"),
+        limite_24h=usage_status["limit"],
+        usos_restantes=usage_status["remaining"],
+        reset_at=usage_status["reset_at"],
+    ).model_dump(mode="json")
+
+
+async def _run_tryon(db: Session, params: Dict[str, Any]) -> Dict[str, Any]:
+    # El límite se validó al aceptar el trabajo, pero pudo agotarse mientras esperaba en la cola
+    UsageLimitService.ensure_usage_available(db, params["id_user"])
+    result_url = await TryOnService._call_replicate_tryon(
+        person_image=params["person_image"],
+        garment_image=params["garment_image"],
+        garment_description=params.get("garment_description"),
+        garment_category=params.get("garment_category"),
+    )
+    prueba = TryOnService.save_tryon(
+        db,
+        params["id_user"],
+        params["foto_usuario_id"],
+        params.get("personalizacion_id"),
+        params.get("variant_id"),
+        result_url,
+    )
+    return TryOnResponse.model_validate(prueba).model_dump(mode="json")
+
+
+JOB_HANDLERS: Dict[TipoTrabajo, JobHandler] = {
+    TipoTrabajo.DISENO: _run_design,
+    TipoTrabajo.CHAT: _run_chat,
+    TipoTrabajo.TRYON: _run_tryon,
+}
+
+
+def _error_code(exc: BaseException) -> int:
+    """Código HTTP que habría devuelto el endpoint síncrono para este error."""
+    if isinstance(exc, UsageLimitExceededError):
+        return 429
+    if isinstance(exc, ValueError):
+        return 400
+    if isinstance(exc, TimeoutError):
+        return 504
+    if isinstance(exc, RuntimeError):
+        return 503
+    return 500
+
+
+class GenerationJobRunner:
+    """Cola y pool de workers de trabajos de generación del proceso"""
+
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._listeners: Dict[str, Set[asyncio.Event]] = {}
+        self.running = 0
+
+    @property
+    def started(self) -> bool:
+        return bool(self._workers)
+
+    async def start(self) -> None:
+        """Arranca los workers y recupera los trabajos pendientes (lifespan de la aplicación)."""
+        if self._workers:
+            return
+        self._queue = asyncio.Queue()
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"job-worker-{index}")
+            for index in range(max(1, settings.JOB_WORKERS))
+        ]
+        recovered = self.recover()
+        if recovered:
+            logger.info("Trabajos de generación recuperados: %s", recovered)
+
+    async def stop(self) -> None:
+        """Detiene los workers; los trabajos en curso vuelven a quedar pendientes."""
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        self._queue = None
+        JOBS_QUEUED.set(0)
+
+    def queued(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def ensure_capacity(self) -> None:
+        if self.queued() >= settings.JOB_QUEUE_MAX_SIZE:
+            raise JobQueueFullError(
+                "Hay demasiadas generaciones en espera. Intenta de nuevo en unos segundos."
+            )
+
+    def enqueue(self, job_id: str) -> None:
+        self._queue.put_nowait(job_id)
+        JOBS_QUEUED.set(self.queued())
+
+    def recover(self) -> int:
+        """
+        Vuelve a encolar los trabajos pendientes y los de diseño interrumpidos por una caída
+
+        Los turnos de chat y try-on interrumpidos se marcan como fallidos (503).
+        """
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            stale_before = now - timedelta(seconds=settings.JOB_TIMEOUT_SECONDS + 60)
+            interrupted = db.query(TrabajoGeneracion).filter(
+                TrabajoGeneracion.estado == EstadoTrabajo.EN_PROCESO,
+                TrabajoGeneracion.started_at < stale_before,
+            )
+            interrupted.filter(TrabajoGeneracion.tipo.in_(RERUNNABLE_JOB_TYPES)).update(
+                {TrabajoGeneracion.estado: EstadoTrabajo.PENDIENTE}, synchronize_session=False
+            )
+            failed = interrupted.filter(TrabajoGeneracion.tipo.notin_(RERUNNABLE_JOB_TYPES)).update(
+                {
+                    TrabajoGeneracion.estado: EstadoTrabajo.FALLIDO,
+                    TrabajoGeneracion.error: INTERRUPTED_JOB_MESSAGE,
+                    TrabajoGeneracion.codigo_error: 503,
+                    TrabajoGeneracion.finished_at: now,
+                },
+                synchronize_session=False,
+            )
+            db.commit()
+            if failed:
+                logger.warning("Trabajos de chat/try-on interrumpidos marcados como fallidos: %s", failed)
+            job_ids = [
+                row.id
+                for row in db.query(TrabajoGeneracion.id)
+                .filter(TrabajoGeneracion.estado == EstadoTrabajo.PENDIENTE)
+                .order_by(TrabajoGeneracion.created_at)
+            ]
+        except SQLAlchemyError as exc:
+            # Sin base de datos al arrancar no hay nada que recuperar; el servicio sigue arrancando
+            db.rollback()
+            logger.warning("No se pudieron recuperar los trabajos pendientes: %s", exc)
+            return 0
+        finally:
+            db.close()
+
+        for job_id in job_ids:
+            self.enqueue(job_id)
+        return len(job_ids)
+
+    # ==================== SUSCRIPCIONES (SSE) ====================
+    def subscribe(self, job_id: str) -> asyncio.Event:
+        event = asyncio.Event()
+        self._listeners.setdefault(job_id, set()).add(event)
+        return event
+
+    def unsubscribe(self, job_id: str, event: asyncio.Event) -> None:
+        listeners = self._listeners.get(job_id)
+        if listeners is None:
+            return
+        listeners.discard(event)
+        if not listeners:
+            del self._listeners[job_id]
+
+    def notify(self, job_id: str) -> None:
+        for event in self._listeners.get(job_id, ()):
+            event.set()
+
+    # ==================== EJECUCIÓN ====================
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            JOBS_QUEUED.set(self.queued())
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Error inesperado ejecutando el trabajo %s", job_id)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str) -> None:
+        db = SessionLocal()
+        try:
+            job = self._claim(db, job_id)
+            if job is None:
+                return
+            self.notify(job_id)
+
+            tipo = job.tipo.value
+            JOB_QUEUE_WAIT.observe((job.started_at - job.created_at).total_seconds(), tipo=tipo)
+            handler = JOB_HANDLERS[job.tipo]
+            started = time.monotonic()
+            self.running += 1
+            JOBS_RUNNING.set(self.running)
+            try:
+                result = await asyncio.wait_for(
+                    handler(db, dict(job.parametros)), timeout=settings.JOB_TIMEOUT_SECONDS
+                )
+            except asyncio.CancelledError:
+                db.rollback()
+                if job.tipo in RERUNNABLE_JOB_TYPES:
+                    self._release(db, job_id)
+                else:
+                    # Un turno de chat o try-on cortado a medias no se puede repetir sin duplicar efectos
+                    self._finish(db, job_id, error=RuntimeError(INTERRUPTED_JOB_MESSAGE))
+                    self.notify(job_id)
+                raise
+            except Exception as exc:
+                db.rollback()
+                self._finish(db, job_id, error=exc)
+            else:
+                self._finish(db, job_id, result=result)
+            finally:
+                self.running -= 1
+                JOBS_RUNNING.set(self.running)
+
+            job = db.get(TrabajoGeneracion, job_id)
+            JOB_DURATION.observe(time.monotonic() - started, tipo=tipo, estado=job.estado.value)
+            self.notify(job_id)
+        finally:
+            db.close()
+
+    def _claim(self, db: Session, job_id: str) -> Optional[TrabajoGeneracion]:
+        """Pasa el trabajo de pendiente a en proceso; None si otro worker ya lo tomó."""
+        claimed = (
+            db.query(TrabajoGeneracion)
+            .filter(TrabajoGeneracion.id == job_id, TrabajoGeneracion.estado == EstadoTrabajo.PENDIENTE)
+            .update(
+                {
+                    TrabajoGeneracion.estado: EstadoTrabajo.EN_PROCESO,
+                    TrabajoGeneracion.started_at: datetime.utcnow(),
+                    TrabajoGeneracion.intentos: TrabajoGeneracion.intentos + 1,
+                },
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+        if not claimed:
+            return None
+
+        job = db.get(TrabajoGeneracion, job_id)
+        if job.intentos > settings.JOB_MAX_ATTEMPTS:
+            self._finish(
+                db, job_id, error=RuntimeError("La generación se interrumpió demasiadas veces.")
+            )
+            self.notify(job_id)
+            return None
+        return job
+
+    def _release(self, db: Session, job_id: str) -> None:
+        """Devuelve a pendiente un trabajo de diseño cortado por un apagado ordenado (no cuenta como intento)."""
+        db.query(TrabajoGeneracion).filter(
+            TrabajoGeneracion.id == job_id, TrabajoGeneracion.estado == EstadoTrabajo.EN_PROCESO
+        ).update(
+            {
+                TrabajoGeneracion.estado: EstadoTrabajo.PENDIENTE,
+                TrabajoGeneracion.started_at: None,
+                TrabajoGeneracion.intentos: TrabajoGeneracion.intentos - 1,
+            },
+            synchronize_session=False,
+        )
+        db.commit()
+
+    def _finish(
+        self,
+        db: Session,
+        job_id: str,
+        result: Optional[Dict[str, Any]] = None,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        job = db.get(TrabajoGeneracion, job_id)
+        job.estado = EstadoTrabajo.FALLIDO if error is not None else EstadoTrabajo.COMPLETADO
+        job.resultado = jsonable_encoder(result) if result is not None else None
+        job.error = (str(error) or error.__class__.__name__) if error is not None else None
+        job.codigo_error = _error_code(error) if error is not None else None
+        job.finished_at = datetime.utcnow()
+        db.commit()
+        JOBS.inc(tipo=job.tipo.value, estado=job.estado.value)
+
+
+# Pool del proceso (se arranca en el lifespan de la aplicación)
+job_runner = GenerationJobRunner()
+
+
+class JobService:
+    """Alta y consulta de trabajos de generación"""
+
+    @staticmethod
+    async def submit(
+        db: Session,
+        tipo: TipoTrabajo,
+        parametros: Dict[str, Any],
+        id_user: Optional[int] = None,
+    ) -> TrabajoGeneracion:
+        """
+        Guarda un trabajo pendiente y lo encola
+
+        Raises:
+            JobQueueFullError: Si la cola del proceso está llena
+        """
+        await job_runner.start()
+        try:
+            job_runner.ensure_capacity()
+        except JobQueueFullError:
+            JOBS.inc(tipo=tipo.value, estado="rechazado")
+            raise
+
+        job = TrabajoGeneracion(
+            id=str(uuid.uuid4()),
+            tipo=tipo,
+            estado=EstadoTrabajo.PENDIENTE,
+            id_user=id_user,
+            parametros=jsonable_encoder(parametros),
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+
+        job_runner.enqueue(job.id)
+        JOBS.inc(tipo=tipo.value, estado="aceptado")
+        return job
+
+    @staticmethod
+    def get_job(db: Session, job_id: str) -> Optional[TrabajoGeneracion]:
+        return db.query(TrabajoGeneracion).filter(TrabajoGeneracion.id == job_id).first()
+
+    @staticmethod
+    def _load(job_id: str) -> Optional[TrabajoGeneracion]:
+        db = SessionLocal()
+        try:
+            return db.get(TrabajoGeneracion, job_id)
+        finally:
+            db.close()
+
+    @staticmethod
+    async def watch_job(job_id: str) -> AsyncIterator[Optional[TrabajoGeneracion]]:
+        """
+        Emite el trabajo cada vez que cambia de estado, hasta que termina
+
+        Los cambios hechos en este proceso llegan al instante; si el trabajo corre
+        en otra réplica se relee cada JOB_EVENTS_POLL_SECONDS. Emite None cada
+        JOB_EVENTS_KEEPALIVE_SECONDS sin cambios (para mantener viva la conexión).
+        """
+        changed = job_runner.subscribe(job_id)
+        last_seen = None
+        idle_seconds = 0.0
+        try:
+            while True:
+                changed.clear()
+                job = JobService._load(job_id)
+                if job is None:
+                    return
+                if (job.estado, job.intentos) != last_seen:
+                    last_seen = (job.estado, job.intentos)
+                    idle_seconds = 0.0
+                    yield job
+                    if job.estado in TERMINAL_JOB_STATES:
+                        return
+
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=settings.JOB_EVENTS_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    idle_seconds += settings.JOB_EVENTS_POLL_SECONDS
+                    if idle_seconds >= settings.JOB_EVENTS_KEEPALIVE_SECONDS:
+                        idle_seconds = 0.0
+                        yield None
+        finally:
+            job_runner.unsubscribe(job_id, changed)
@@ -0,0 +1,96 @@
+"""
+Preparación de imágenes de referencia antes de una generación
+
+Corre mientras Gemini escribe el prompt de diseño, así que no suma latencia:
+- Las imágenes en data URI se estabilizan en Cloudinary (Replicate recibe una URL
+  corta en lugar de megas de base64 en el cuerpo de la predicción)
+- Las URLs se comprueban con un HEAD: una referencia caída haría fallar la
+  predicción después de pagarla. Solo un 404/410 prueba que la imagen ya no
+  existe; cualquier otra respuesta o error es inconcluso y la URL se conserva
+"""
+import asyncio
+import logging
+from typing import List, Optional, Tuple
+
+import httpx
+
+from app.config.http_client import get_http_client, operation_timeout
+from app.config.storage import storage
+
+logger = logging.getLogger(__name__)
+
+
+class ReferenceImageService:
+    """Estabiliza y comprueba la imagen base y las referencias de una generación."""
+
+    REFERENCES_FOLDER = "generated/references"
+    # Únicos códigos que prueban que la imagen ya no existe
+    GONE_STATUS_CODES = (404, 410)
+
+    @staticmethod
+    async def _is_reachable(image_url: str) -> bool:
+        """False solo si el origen confirma que la imagen no existe (404/410)."""
+        try:
+            response = await get_http_client().head(
+                image_url,
+                follow_redirects=True,
+                timeout=operation_timeout("reference_prefetch"),
+            )
+        except httpx.HTTPError as exc:
+            # Timeout o error de red: inconcluso, Replicate puede descargarla igualmente
+            logger.warning("No se pudo comprobar la referencia %s: %s", image_url[:120], exc)
+            return True
+        if response.status_code in ReferenceImageService.GONE_STATUS_CODES:
+            logger.warning("Referencia inaccesible %s: HTTP %s", image_url[:120], response.status_code)
+            return False
+        # 403/405/5xx...: muchos orígenes rechazan HEAD o fallan puntualmente; eso no dice nada de la imagen
+        if response.status_code >= 400:
+            logger.info("Comprobación inconclusa de %s: HTTP %s", image_url[:120], response.status_code)
+        return True
+
+    @staticmethod
+    async def _prepare_one(image: str) -> Optional[str]:
+        """URL estable de la imagen, o None si no se puede usar."""
+        if image.startswith("data:"):
+            try:
+                uploaded = await storage.put_remote(image, folder=ReferenceImageService.REFERENCES_FOLDER)
+            except Exception as exc:
+                # Replicate acepta data URIs: mejor enviarla tal cual que perderla
+                logger.warning("No se pudo estabilizar una referencia en data URI: %s", exc)
+                return image
+            return uploaded.get("url") or image
+
+        if image.startswith(("http://", "https://")):
+            return image if await ReferenceImageService._is_reachable(image) else None
+
+        return None
+
+    @staticmethod
+    async def prepare(
+        base_image_url: str,
+        reference_images: Optional[List[str]] = None,
+    ) -> Tuple[str, List[str]]:
+        """
+        Prepara en paralelo la imagen base y las referencias del usuario
+
+        Las referencias que ya no existen se omiten; la imagen base es obligatoria.
+        Una comprobación inconclusa nunca descarta una imagen.
+
+        Raises:
+            ValueError: Si la imagen base de la prenda no existe (404/410) o no es una URL
+
+        Returns:
+            Tupla (imagen base, referencias utilizables en el mismo orden)
+        """
+        candidates = [base_image_url, *[image for image in reference_images or [] if image]]
+        prepared = await asyncio.gather(
+            *(ReferenceImageService._prepare_one(image.strip()) for image in candidates)
+        )
+
+        base_image, *references = prepared
+        if not base_image:
+            raise ValueError(
+                "No pude acceder a la imagen base de la prenda seleccionada. "
+                "Vuelve a abrir la personalizacion desde el catalogo e intenta de nuevo."
+            )
+        return base_image, [image for image in references if image]
@@ -0,0 +1,199 @@
+"""
+Cliente de predicciones de Replicate
+
+Un único camino para crear una predicción, seguir sus cambios de estado y
+extraer la URL del resultado, compartido por el diseño y el try-on. Si la
+petición que la espera se cancela (el navegador se fue, timeout del trabajo),
+la predicción se cancela también en Replicate para dejar de pagar GPU.
+"""
+import asyncio
+import logging
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from app.config.http_client import get_http_client, operation_timeout
+from app.config.settings import settings
+from app.services.replicate_predictions import (
+    TERMINAL_STATUSES,
+    prediction_url,
+    watch_prediction,
+    webhook_fields,
+)
+from app.utils.disconnect import ClientDisconnectedError, await_unless_disconnected, disconnect_watched
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+PREDICTION_CANCELLATIONS = metrics.counter(
+    "agent_replicate_prediction_cancellations_total",
+    "Predicciones canceladas en Replicate por motivo (disconnect, cancelled)",
+    ("reason",),
+)
+
+StatusCallback = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class ReplicateCreateError(RuntimeError):
+    """Replicate no aceptó la creación de una predicción"""
+
+    def __init__(self, detail: str):
+        super().__init__(detail)
+        self.detail = detail
+
+
+def extract_output_url(output: Any) -> Optional[str]:
+    """Primera URL del output de una predicción (str, lista o dict con url/uri/image...)."""
+    if isinstance(output, str) and output.strip():
+        return output.strip()
+
+    if isinstance(output, list):
+        for item in output:
+            extracted = extract_output_url(item)
+            if extracted:
+                return extracted
+
+    if isinstance(output, dict):
+        for key in ("url", "uri", "image", "image_url", "output"):
+            extracted = extract_output_url(output.get(key))
+            if extracted:
+                return extracted
+
+    return None
+
+
+class ReplicatePredictionClient:
+    """
+    Crea y sigue predicciones de Replicate
+
+    Uso:
+        client = ReplicatePredictionClient(token)
+        result = await client.run("models/google/nano-banana-pro/predictions", {"input": {...}}, 120)
+    """
+
+    def __init__(self, token: str, http_client: Optional[httpx.AsyncClient] = None):
+        self.token = token
+        self.http_client = http_client or get_http_client()
+
+    def _headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Token {self.token}", "Content-Type": "application/json"}
+
+    async def create(self, path: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Crea una predicción en `path` (p. ej. "predictions" o "models/{owner}/{model}/predictions")
+
+        Con "Prefer: wait" Replicate responde hasta REPLICATE_SYNC_WAIT_SECONDS después
+        con la predicción ya terminada. Si la espera puede cancelarse (desconexión del
+        cliente o generación compartida) se crea sin esperar: hace falta el id cuanto
+        antes para poder cancelarla.
+
+        Raises:
+            ReplicateCreateError: Si Replicate rechaza la creación o no devuelve un id
+        """
+        headers = self._headers()
+        if settings.REPLICATE_SYNC_WAIT_SECONDS > 0 and not disconnect_watched():
+            headers["Prefer"] = f"wait={settings.REPLICATE_SYNC_WAIT_SECONDS}"
+
+        response = await self.http_client.post(
+            f"{settings.REPLICATE_API_BASE_URL.rstrip('/')}/{path.lstrip('/')}",
+            headers=headers,
+            timeout=operation_timeout("replicate_create"),
+            json={**body, **webhook_fields()},
+        )
+        if response.status_code not in (200, 201):
+            raise ReplicateCreateError(response.text)
+
+        prediction = response.json()
+        if prediction.get("status") not in TERMINAL_STATUSES and not prediction.get("id"):
+            raise ReplicateCreateError("Replicate no devolvio un id de prediccion valido")
+        return prediction
+
+    async def cancel(self, prediction_id: str) -> bool:
+        """Cancela una predicción en curso; True si Replicate aceptó la cancelación."""
+        try:
+            response = await self.http_client.post(
+                f"{prediction_url(prediction_id)}/cancel",
+                headers=self._headers(),
+                timeout=operation_timeout("replicate_cancel"),
+            )
+        except httpx.HTTPError as exc:
+            logger.warning("No se pudo cancelar la predicción %s: %s", prediction_id, exc)
+            return False
+
+        if response.status_code != 200:
+            logger.warning("Replicate no canceló la predicción %s: %s", prediction_id, response.text)
+            return False
+        return True
+
+    def watch(self, prediction: Dict[str, Any], max_wait_seconds: float) -> AsyncIterator[Dict[str, Any]]:
+        """Cambios de estado de la predicción hasta que termina (ver watch_prediction)."""
+        return watch_prediction(
+            prediction,
+            token=self.token,
+            max_wait_seconds=max_wait_seconds,
+            client=self.http_client,
+        )
+
+    async def _follow(
+        self,
+        prediction: Dict[str, Any],
+        max_wait_seconds: float,
+        on_status: Optional[StatusCallback],
+    ) -> Dict[str, Any]:
+        result = prediction
+        async with aclosing(self.watch(prediction, max_wait_seconds)) as transitions:
+            async for result in transitions:
+                logger.debug("Predicción %s: %s", result.get("id"), result.get("status"))
+                if on_status is not None:
+                    await on_status(result)
+        return result
+
+    async def run(
+        self,
+        path: str,
+        body: Dict[str, Any],
+        max_wait_seconds: float,
+        on_status: Optional[StatusCallback] = None,
+    ) -> Dict[str, Any]:
+        """
+        Crea la predicción y espera a que termine
+
+        Si el cliente HTTP de la petición se desconecta (ver app/utils/disconnect.py)
+        o la espera se cancela, la predicción se cancela en Replicate.
+
+        Args:
+            path: Ruta de creación relativa a REPLICATE_API_BASE_URL
+            body: Cuerpo de creación ("input" y, si aplica, "version")
+            max_wait_seconds: Espera máxima desde la creación
+            on_status: Corrutina llamada con cada cambio de estado
+
+        Returns:
+            Último estado conocido; si no terminó a tiempo su status no es terminal
+
+        Raises:
+            ReplicateCreateError: Si Replicate rechaza la creación
+            ReplicateStatusError: Si la consulta de estado responde con error
+            ClientDisconnectedError: Si el cliente se desconectó antes de terminar
+        """
+        # La creación no se interrumpe: sin "Prefer: wait" responde enseguida y
+        # cortarla a medias dejaría una predicción corriendo sin id para cancelarla
+        prediction = await self.create(path, body)
+        try:
+            return await await_unless_disconnected(self._follow(prediction, max_wait_seconds, on_status))
+        except ClientDisconnectedError:
+            await self._cancel_abandoned(prediction, reason="disconnect")
+            raise
+        except asyncio.CancelledError:
+            await self._cancel_abandoned(prediction, reason="cancelled")
+            raise
+
+    async def _cancel_abandoned(self, prediction: Dict[str, Any], reason: str) -> None:
+        prediction_id = prediction.get("id")
+        if not prediction_id or prediction.get("status") in TERMINAL_STATUSES:
+            return
+        # shield: la cancelación en Replicate debe completarse aunque esta tarea se esté cancelando
+        canceled = await asyncio.shield(self.cancel(prediction_id))
+        if canceled:
+            PREDICTION_CANCELLATIONS.inc(reason=reason)
+            logger.info("Predicción %s cancelada en Replicate (%s)", prediction_id, reason)
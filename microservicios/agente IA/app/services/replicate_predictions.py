@@ -0,0 +1,289 @@
+"""
+Espera de predicciones de Replicate
+
+Replicate avisa por webhook (POST /webhooks/replicate) cuando una predicción
+termina. Quien espera una predicción registra un future por su id y el webhook
+lo resuelve; la consulta de estado con backoff exponencial queda solo como
+respaldo (webhook perdido, llegó a otra réplica del servicio o no está configurado).
+
+1. prediction_registry: futures en espera por id de predicción (en memoria del proceso)
+2. verify_webhook_signature: firma de los webhooks (esquema "Standard Webhooks" de Replicate)
+3. watch_prediction / wait_for_prediction: espera el primero entre webhook y consulta de estado
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Mapping, Optional, Set
+
+import httpx
+
+from app.config.http_client import get_http_client, operation_timeout
+from app.config.settings import settings
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = frozenset({"succeeded", "failed", "canceled"})
+
+PREDICTION_COMPLETIONS = metrics.counter(
+    "agent_replicate_prediction_completions_total",
+    "Predicciones de Replicate por vía de finalización (sync, webhook, poll, timeout)",
+    ("via",),
+)
+PREDICTION_STATUS_POLLS = metrics.counter(
+    "agent_replicate_status_polls_total",
+    "Consultas GET del estado de una predicción de Replicate",
+    (),
+)
+WEBHOOKS_RECEIVED = metrics.counter(
+    "agent_replicate_webhooks_total",
+    "Webhooks de Replicate recibidos por resultado (matched, unmatched, rejected)",
+    ("result",),
+)
+
+
+class ReplicateStatusError(RuntimeError):
+    """Replicate respondió con error al consultar el estado de una predicción"""
+
+    def __init__(self, detail: str):
+        super().__init__(detail)
+        self.detail = detail
+
+
+class PredictionRegistry:
+    """
+    Futures en espera por id de predicción
+
+    El webhook puede llegar antes de que quien creó la predicción empiece a
+    esperarla (respuesta de creación lenta): esos resultados se guardan un
+    tiempo y se entregan al registrarse.
+    """
+
+    def __init__(self, early_ttl_seconds: float = 600.0, early_max_entries: int = 256):
+        self._waiters: Dict[str, Set[asyncio.Future]] = {}
+        self._early: "OrderedDict[str, tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.early_ttl_seconds = early_ttl_seconds
+        self.early_max_entries = early_max_entries
+
+    def register(self, prediction_id: str) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(prediction_id, set()).add(future)
+
+        early = self._early.pop(prediction_id, None)
+        if early and time.monotonic() - early[0] <= self.early_ttl_seconds:
+            future.set_result(early[1])
+        return future
+
+    def discard(self, prediction_id: str, future: asyncio.Future) -> None:
+        waiters = self._waiters.get(prediction_id)
+        if waiters is None:
+            return
+        waiters.discard(future)
+        if not waiters:
+            del self._waiters[prediction_id]
+
+    def resolve(self, prediction_id: str, prediction: Dict[str, Any]) -> bool:
+        """
+        Entrega el resultado a quienes esperan la predicción
+
+        Returns:
+            True si había alguien esperando en este proceso
+        """
+        waiters = [future for future in self._waiters.get(prediction_id, ()) if not future.done()]
+        for future in waiters:
+            future.set_result(prediction)
+        if waiters:
+            return True
+
+        self._early[prediction_id] = (time.monotonic(), prediction)
+        self._early.move_to_end(prediction_id)
+        while len(self._early) > self.early_max_entries:
+            self._early.popitem(last=False)
+        return False
+
+    def waiting(self) -> int:
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+
+# Registro del proceso (el webhook y las esperas corren en el mismo event loop)
+prediction_registry = PredictionRegistry()
+
+
+def _signature(secret: str, webhook_id: str, timestamp: str, body: bytes) -> str:
+    key = base64.b64decode(secret.split("_", 1)[1] if secret.startswith("whsec_") else secret)
+    signed_content = f"{webhook_id}.{timestamp}.".encode("utf-8") + body
+    return base64.b64encode(hmac.new(key, signed_content, hashlib.sha256).digest()).decode("ascii")
+
+
+def verify_webhook_signature(
+    headers: Mapping[str, str],
+    body: bytes,
+    secret: str,
+    tolerance_seconds: Optional[int] = None,
+    now: Optional[float] = None,
+) -> bool:
+    """
+    Verifica la firma de un webhook de Replicate
+
+    Firma = base64(HMAC-SHA256(secreto, "{webhook-id}.{webhook-timestamp}.{cuerpo}")),
+    con el secreto "whsec_<base64>" decodificado. La cabecera webhook-signature
+    puede traer varias firmas "v1,<firma>" separadas por espacios.
+    """
+    webhook_id = headers.get("webhook-id")
+    timestamp = headers.get("webhook-timestamp")
+    signatures = headers.get("webhook-signature")
+    if not webhook_id or not timestamp or not signatures:
+        return False
+
+    try:
+        sent_at = int(timestamp)
+    except ValueError:
+        return False
+    tolerance = settings.REPLICATE_WEBHOOK_TOLERANCE_SECONDS if tolerance_seconds is None else tolerance_seconds
+    if abs((time.time() if now is None else now) - sent_at) > tolerance:
+        return False
+
+    try:
+        expected = _signature(secret, webhook_id, timestamp, body)
+    except ValueError:
+        logger.error("REPLICATE_WEBHOOK_SECRET no es un secreto base64 válido")
+        return False
+
+    for signature in signatures.split():
+        version, _, value = signature.partition(",")
+        if version == "v1" and hmac.compare_digest(value, expected):
+            return True
+    return False
+
+
+def sign_webhook(body: bytes, secret: str, webhook_id: str, timestamp: Optional[int] = None) -> Dict[str, str]:
+    """Cabeceras de firma de un webhook (las usa el Replicate falso de benchmarks/)."""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    signature = _signature(secret, webhook_id, str(timestamp), body)
+    return {
+        "webhook-id": webhook_id,
+        "webhook-timestamp": str(timestamp),
+        "webhook-signature": f"v1,{signature}",
+    }
+
+
+def webhook_fields() -> Dict[str, Any]:
+    """Campos del cuerpo de creación que piden a Replicate avisar al terminar."""
+    if not settings.replicate_webhooks_enabled:
+        return {}
+    return {"webhook": settings.REPLICATE_WEBHOOK_URL, "webhook_events_filter": ["completed"]}
+
+
+def prediction_url(prediction_id: str) -> str:
+    return f"{settings.REPLICATE_API_BASE_URL.rstrip('/')}/predictions/{prediction_id}"
+
+
+async def _fetch_prediction(client: httpx.AsyncClient, prediction_id: str, token: str) -> Dict[str, Any]:
+    PREDICTION_STATUS_POLLS.inc()
+    response = await client.get(
+        prediction_url(prediction_id),
+        headers={"Authorization": f"Token {token}"},
+        timeout=operation_timeout("replicate_poll"),
+    )
+    if response.status_code != 200:
+        raise ReplicateStatusError(response.text)
+    return response.json()
+
+
+async def watch_prediction(
+    prediction: Dict[str, Any],
+    token: str,
+    max_wait_seconds: float,
+    webhook_requested: Optional[bool] = None,
+    client: Optional[httpx.AsyncClient] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Emite la predicción cada vez que cambia de status hasta que termina
+
+    El primer valor es la respuesta de creación; el último es el estado final
+    (o el último conocido si no terminó a tiempo). Con webhook los estados
+    intermedios solo se ven si hace falta consultar el estado.
+
+    Args:
+        prediction: Respuesta de creación (con id y status)
+        token: Token de la API de Replicate
+        max_wait_seconds: Espera máxima desde la creación
+        webhook_requested: Si la predicción se creó con webhook (por defecto según settings)
+        client: Cliente HTTP (por defecto el compartido)
+
+    Raises:
+        ReplicateStatusError: Si la consulta de estado responde con error
+    """
+    yield prediction
+    if prediction.get("status") in TERMINAL_STATUSES:
+        PREDICTION_COMPLETIONS.inc(via="sync")
+        return
+
+    prediction_id = prediction["id"]
+    if webhook_requested is None:
+        webhook_requested = settings.replicate_webhooks_enabled
+    client = client or get_http_client()
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + max_wait_seconds
+    # Con webhook la consulta es solo un respaldo: empieza más tarde
+    interval = (
+        settings.REPLICATE_WEBHOOK_POLL_INITIAL_SECONDS if webhook_requested else settings.REPLICATE_POLL_INITIAL_SECONDS
+    )
+    last_status = prediction.get("status")
+    future = prediction_registry.register(prediction_id)
+    try:
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                PREDICTION_COMPLETIONS.inc(via="timeout")
+                return
+
+            try:
+                # shield: el timeout de esta vuelta no debe cancelar el future registrado
+                delivered = await asyncio.wait_for(asyncio.shield(future), timeout=min(interval, remaining))
+            except asyncio.TimeoutError:
+                pass
+            else:
+                PREDICTION_COMPLETIONS.inc(via="webhook")
+                yield delivered
+                return
+
+            result = await _fetch_prediction(client, prediction_id, token)
+            if result.get("status") in TERMINAL_STATUSES:
+                PREDICTION_COMPLETIONS.inc(via="poll")
+                yield result
+                return
+            if result.get("status") != last_status:
+                last_status = result.get("status")
+                yield result
+            interval = min(interval * settings.REPLICATE_POLL_BACKOFF, settings.REPLICATE_POLL_MAX_SECONDS)
+    finally:
+        prediction_registry.discard(prediction_id, future)
+
+
+async def wait_for_prediction(
+    prediction: Dict[str, Any],
+    token: str,
+    max_wait_seconds: float,
+    webhook_requested: Optional[bool] = None,
+    client: Optional[httpx.AsyncClient] = None,
+) -> Dict[str, Any]:
+    """
+    Espera a que una predicción termine (ver watch_prediction)
+
+    Returns:
+        Último estado conocido de la predicción; si no terminó a tiempo su
+        status no es terminal y quien llama decide el error.
+
+    Raises:
+        ReplicateStatusError: Si la consulta de estado responde con error
+    """
+    result = prediction
+    async for result in watch_prediction(prediction, token, max_wait_seconds, webhook_requested, client):
+        pass
+    return result
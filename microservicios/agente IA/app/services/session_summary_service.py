@@ -0,0 +1,155 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import List, Optional, Set
+
+from app.agents.orchestrator import orchestrator
+from app.config.database import SessionLocal
+from app.config.settings import settings
+from app.models import MensajeIA, SesionIA, TipoMensaje
+
+logger = logging.getLogger(__name__)
+
+
+class SessionSummaryService:
+    """
+    Resumen incremental del estado del diseño de cada sesión
+
+    Después de cada turno se actualiza en segundo plano (sin bloquear la respuesta)
+    y en los turnos siguientes reemplaza al historial completo como contexto. Los
+    mensajes que el resumen todavía no incorpora se agregan literalmente.
+    """
+
+    SUMMARY_LABELS = {
+        "color": "Color base",
+        "logo": "Logo",
+        "ubicacion": "Ubicacion del logo",
+        "patron": "Patron",
+        "notas": "Notas",
+    }
+    LAST_REPLY_MAX_CHARS = 400
+    LOCK_STRIPES = 64
+
+    _pending_tasks: Set[asyncio.Task] = set()
+    # Locks repartidos por sesion_id: serializan las actualizaciones de una misma sesión
+    _session_locks: List[asyncio.Lock] = [asyncio.Lock() for _ in range(LOCK_STRIPES)]
+
+    @staticmethod
+    def _format_message(mensaje: MensajeIA, max_chars: Optional[int] = None) -> str:
+        speaker = "Usuario" if mensaje.tipo == TipoMensaje.usuario else "Asistente"
+        content = mensaje.contenido.strip()
+        if max_chars and len(content) > max_chars:
+            content = content[:max_chars].rstrip() + "..."
+        return f"{speaker}: {content}"
+
+    @staticmethod
+    def build_context(sesion: SesionIA, previous_messages: List[MensajeIA]) -> Optional[str]:
+        """
+        Arma el contexto del agente a partir del resumen guardado
+
+        Los mensajes posteriores a resumen_actualizado_en (el resumen se actualiza en
+        segundo plano y puede no incluir el turno anterior) se agregan literalmente;
+        si no hay ninguno se agrega el último intercambio usuario/asistente.
+
+        Args:
+            previous_messages: Mensajes recientes en orden cronológico, sin el actual
+
+        Returns:
+            Texto de contexto, o None si la sesión no tiene resumen o es anterior a
+            todos los mensajes recientes (se usa el historial literal)
+        """
+        summary = sesion.resumen_diseno if settings.SESSION_SUMMARY_ENABLED else None
+        if not summary:
+            return None
+
+        covered_until = sesion.resumen_actualizado_en
+        pending = [
+            mensaje for mensaje in previous_messages
+            if covered_until is None or mensaje.timestamp is None or mensaje.timestamp > covered_until
+        ]
+        if previous_messages and len(pending) == len(previous_messages):
+            # Puede haber mensajes sin resumir fuera de la ventana: el historial es más fiable
+            return None
+
+        lines = ["Estado actual del diseno:"]
+        for key, label in SessionSummaryService.SUMMARY_LABELS.items():
+            lines.append(f"- {label}: {summary.get(key) or 'sin definir'}")
+
+        if pending:
+            lines.append("Mensajes posteriores al resumen:")
+            lines.extend(SessionSummaryService._format_message(mensaje) for mensaje in pending)
+        else:
+            last_user = next(
+                (mensaje for mensaje in reversed(previous_messages) if mensaje.tipo == TipoMensaje.usuario),
+                None,
+            )
+            last_reply = next(
+                (mensaje for mensaje in reversed(previous_messages) if mensaje.tipo == TipoMensaje.ia),
+                None,
+            )
+            if last_user or last_reply:
+                lines.append("Ultimo intercambio:")
+            if last_user:
+                lines.append(SessionSummaryService._format_message(last_user))
+            if last_reply:
+                lines.append(SessionSummaryService._format_message(
+                    last_reply, SessionSummaryService.LAST_REPLY_MAX_CHARS
+                ))
+
+        return "\n".join(lines)
+
+    @staticmethod
+    async def refresh(
+        sesion_id: int,
+        user_message: str,
+        assistant_message: str,
+        covered_until: Optional[datetime] = None,
+    ) -> None:
+        """
+        Actualiza el resumen de la sesión con el último intercambio
+
+        Args:
+            covered_until: Fecha del mensaje del asistente que se incorpora al resumen
+        """
+        lock = SessionSummaryService._session_locks[sesion_id % SessionSummaryService.LOCK_STRIPES]
+        async with lock:
+            db = SessionLocal()
+            try:
+                sesion = db.query(SesionIA).filter(SesionIA.id == sesion_id).first()
+                if not sesion:
+                    return
+
+                sesion.resumen_diseno = await orchestrator.update_design_summary(
+                    previous_summary=sesion.resumen_diseno,
+                    user_message=user_message,
+                    assistant_message=assistant_message,
+                )
+                # Fecha del último mensaje resumido, no la de esta escritura: un turno
+                # guardado mientras se generaba el resumen sigue contando como pendiente
+                covered_until = covered_until or datetime.utcnow()
+                if sesion.resumen_actualizado_en is None or covered_until > sesion.resumen_actualizado_en:
+                    sesion.resumen_actualizado_en = covered_until
+                db.commit()
+            except Exception as exc:
+                db.rollback()
+                logger.warning("No se pudo actualizar el resumen de la sesion %s: %s", sesion_id, exc)
+            finally:
+                db.close()
+
+    @staticmethod
+    def schedule_refresh(
+        sesion_id: int,
+        user_message: str,
+        assistant_message: str,
+        covered_until: Optional[datetime] = None,
+    ) -> None:
+        """Programa la actualización del resumen fuera del camino de la petición."""
+        if not settings.SESSION_SUMMARY_ENABLED:
+            return
+
+        task = asyncio.create_task(
+            SessionSummaryService.refresh(sesion_id, user_message, assistant_message, covered_until)
+        )
+        # Mantener una referencia para que la tarea no sea recolectada antes de terminar
+        SessionSummaryService._pending_tasks.add(task)
+        task.add_done_callback(SessionSummaryService._pending_tasks.discard)
@@ -1,13 +1,15 @@
-import asyncio
 from typing import Any, Optional
 
 import httpx
 from sqlalchemy.orm import Session
 
 from app.config.settings import settings
-from app.config.storage import upload_remote_image
+from app.config.storage import storage
 from app.models import FotoUsuario, Personalizacion, PruebaVirtual, TipoUsoAgente
 from app.services.usage_limit_service import UsageLimitService
+from app.services.replicate_client import ReplicateCreateError, ReplicatePredictionClient, extract_output_url
+from app.services.replicate_predictions import ReplicateStatusError
+from app.utils.stage_timings import stage
 
 
 class TryOnService:
@@ -39,6 +41,45 @@ class TryOnService:
         Returns:
             PruebaVirtual con la imagen generada
         """
+        inputs = TryOnService.prepare_tryon(
+            db,
+            id_user,
+            foto_usuario_id,
+            personalizacion_id,
+            garment_image_url,
+            garment_description,
+        )
+
+        result_url = await TryOnService._call_replicate_tryon(
+            person_image=inputs["person_image"],
+            garment_image=inputs["garment_image"],
+            garment_description=inputs["garment_description"],
+            garment_category=garment_category,
+        )
+
+        return TryOnService.save_tryon(
+            db, id_user, foto_usuario_id, personalizacion_id, variant_id, result_url
+        )
+
+    @staticmethod
+    def prepare_tryon(
+        db: Session,
+        id_user: int,
+        foto_usuario_id: int,
+        personalizacion_id: Optional[int] = None,
+        garment_image_url: Optional[str] = None,
+        garment_description: Optional[str] = None,
+    ) -> dict[str, Optional[str]]:
+        """
+        Valida el try-on y resuelve sus imagenes antes de llamar a Replicate.
+
+        Raises:
+            UsageLimitExceededError: Si el usuario ya no tiene usos disponibles
+            ValueError: Si falta la foto del usuario o la imagen de la prenda
+
+        Returns:
+            Dict con person_image, garment_image y garment_description
+        """
         UsageLimitService.ensure_usage_available(db, id_user)
 
         foto_usuario = (
@@ -78,13 +119,22 @@ class TryOnService:
                 "No se encontro una imagen valida de la prenda para generar el try-on."
             )
 
-        result_url = await TryOnService._call_replicate_tryon(
-            person_image=foto_usuario.foto_url,
-            garment_image=resolved_garment_image_url,
-            garment_description=resolved_garment_description,
-            garment_category=garment_category,
-        )
+        return {
+            "person_image": foto_usuario.foto_url,
+            "garment_image": resolved_garment_image_url,
+            "garment_description": resolved_garment_description,
+        }
 
+    @staticmethod
+    def save_tryon(
+        db: Session,
+        id_user: int,
+        foto_usuario_id: int,
+        personalizacion_id: Optional[int],
+        variant_id: Optional[int],
+        result_url: str,
+    ) -> PruebaVirtual:
+        """Guarda el resultado del try-on y registra el uso."""
         prueba = PruebaVirtual(
             id_user=id_user,
             foto_usuario_id=foto_usuario_id,
@@ -123,26 +173,6 @@ class TryOnService:
         }
         return fallback_by_category.get(category, "Garment")
 
-    @staticmethod
-    def _extract_generated_url(output: Any) -> Optional[str]:
-        if isinstance(output, str) and output.strip():
-            return output.strip()
-
-        if isinstance(output, list):
-            for item in output:
-                extracted = TryOnService._extract_generated_url(item)
-                if extracted:
-                    return extracted
-
-        if isinstance(output, dict):
-            for key in ("url", "uri", "image", "image_url", "output"):
-                value = output.get(key)
-                extracted = TryOnService._extract_generated_url(value)
-                if extracted:
-                    return extracted
-
-        return None
-
     @staticmethod
     async def _call_replicate_tryon(
         person_image: str,
@@ -189,80 +219,53 @@ class TryOnService:
         }
 
         try:
-            async with httpx.AsyncClient(timeout=180.0) as client:
-                response = await client.post(
-                    "https://api.replicate.com/v1/predictions",
-                    headers={
-                        "Authorization": f"Token {replicate_token}",
-                        "Content-Type": "application/json",
-                        "Prefer": "wait=60",
-                    },
-                    json=payload,
+            with stage("replicate"):
+                result = await ReplicatePredictionClient(replicate_token).run(
+                    "predictions",
+                    payload,
+                    max_wait_seconds=settings.REPLICATE_TRYON_MAX_WAIT_SECONDS,
                 )
+        except ReplicateCreateError as exc:
+            raise RuntimeError(
+                f"Replicate no acepto la solicitud de try-on: {exc.detail}"
+            ) from exc
+        except ReplicateStatusError as exc:
+            raise RuntimeError(
+                "No se pudo consultar el estado del try-on en Replicate: "
+                f"{exc.detail}"
+            ) from exc
+        except httpx.TimeoutException as exc:
+            raise RuntimeError("Timeout al conectar con Replicate para generar el try-on.") from exc
 
-                if response.status_code not in (200, 201):
-                    raise RuntimeError(
-                        f"Replicate no acepto la solicitud de try-on: {response.text}"
-                    )
-
-                prediction = response.json()
-                prediction_id = prediction.get("id")
-                result = prediction
-
-                if result.get("status") not in {"succeeded", "failed", "canceled"}:
-                    if not prediction_id:
-                        raise RuntimeError(
-                            "Replicate no devolvio un id de prediccion valido para el try-on."
-                        )
-
-                    for _ in range(90):
-                        await asyncio.sleep(2)
-                        status_response = await client.get(
-                            f"https://api.replicate.com/v1/predictions/{prediction_id}",
-                            headers={"Authorization": f"Token {replicate_token}"},
-                        )
-
-                        if status_response.status_code != 200:
-                            raise RuntimeError(
-                                "No se pudo consultar el estado del try-on en Replicate: "
-                                f"{status_response.text}"
-                            )
-
-                        result = status_response.json()
-                        if result.get("status") in {"succeeded", "failed", "canceled"}:
-                            break
-
-                status = result.get("status")
-                if status == "failed":
-                    error = result.get("error") or "Fallo desconocido"
-                    raise RuntimeError(f"Replicate no pudo generar el try-on: {error}")
-
-                if status == "canceled":
-                    raise RuntimeError("Replicate cancelo la generacion del try-on.")
-
-                if status != "succeeded":
-                    raise RuntimeError(
-                        "El try-on tardó demasiado y Replicate no devolvio un resultado a tiempo."
-                    )
-
-                generated_url = TryOnService._extract_generated_url(result.get("output"))
-                if not generated_url:
-                    raise RuntimeError(
-                        "Replicate no devolvio una URL valida para el resultado del try-on."
-                    )
-
-                uploaded_result = await upload_remote_image(
-                    generated_url,
-                    folder="generated/tryon"
-                )
-                stable_url = uploaded_result.get("url")
-                if not stable_url:
-                    raise RuntimeError("No se pudo estabilizar la imagen de try-on generada.")
+        status = result.get("status")
+        if status == "failed":
+            error = result.get("error") or "Fallo desconocido"
+            raise RuntimeError(f"Replicate no pudo generar el try-on: {error}")
 
-                return stable_url
+        if status == "canceled":
+            raise RuntimeError("Replicate cancelo la generacion del try-on.")
 
-        except httpx.TimeoutException as exc:
-            raise RuntimeError("Timeout al conectar con Replicate para generar el try-on.") from exc
+        if status != "succeeded":
+            raise RuntimeError(
+                "El try-on tardó demasiado y Replicate no devolvio un resultado a tiempo."
+            )
+
+        generated_url = extract_output_url(result.get("output"))
+        if not generated_url:
+            raise RuntimeError(
+                "Replicate no devolvio una URL valida para el resultado del try-on."
+            )
+
+        with stage("upload"):
+            uploaded_result = await storage.put_remote(
+                generated_url,
+                folder="generated/tryon"
+            )
+        stable_url = uploaded_result.get("url")
+        if not stable_url:
+            raise RuntimeError("No se pudo estabilizar la imagen de try-on generada.")
+
+        return stable_url
 
     @staticmethod
     async def get_user_tryons(db: Session, id_user: int):
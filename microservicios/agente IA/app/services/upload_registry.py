@@ -0,0 +1,93 @@
+"""
+Registro de subidas por hash de contenido
+
+El mismo logo o la misma selfie se suben una y otra vez por /images/reference y
+/images/photo. Antes de enviar una imagen al almacenamiento se calcula el SHA-256
+de su contenido original y se busca en la tabla subidas_usuario por
+(id_user, content_hash): si ya existe, se devuelve la URL estable sin volver a
+normalizarla ni subirla.
+
+La tabla también resuelve URL -> hash (app/utils/content_hashes.py), para que los
+caches de análisis y de generación usen el contenido como clave.
+"""
+import asyncio
+import logging
+from typing import Optional
+
+from sqlalchemy.exc import IntegrityError
+
+from app.config.database import SessionLocal
+from app.models import SubidaUsuario
+from app.utils.content_hashes import remember_content_hash
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DEDUP_EVENTS = metrics.counter(
+    "agent_upload_dedup_total",
+    "Subidas de fotos y referencias por resultado de la deduplicación (hit, miss, error)",
+    ("outcome",),
+)
+
+
+class UploadRegistry:
+    """Índice (id_user, content_hash) -> URL de las imágenes ya subidas."""
+
+    @staticmethod
+    def _load(id_user: int, content_hash: str) -> Optional[dict]:
+        db = SessionLocal()
+        try:
+            row = (
+                db.query(SubidaUsuario.image_url, SubidaUsuario.public_id)
+                .filter(
+                    SubidaUsuario.id_user == id_user,
+                    SubidaUsuario.content_hash == content_hash,
+                )
+                .first()
+            )
+            return {"url": row.image_url, "public_id": row.public_id} if row else None
+        finally:
+            db.close()
+
+    @staticmethod
+    def _store(id_user: int, content_hash: str, image_url: str, public_id: Optional[str]) -> None:
+        db = SessionLocal()
+        try:
+            db.add(
+                SubidaUsuario(
+                    id_user=id_user,
+                    content_hash=content_hash,
+                    image_url=image_url,
+                    public_id=public_id,
+                )
+            )
+            db.commit()
+        except IntegrityError:
+            # Otra subida simultánea de la misma imagen se registró antes: vale cualquiera
+            db.rollback()
+        finally:
+            db.close()
+
+    @staticmethod
+    async def find(id_user: int, content_hash: str) -> Optional[dict]:
+        """URL y public_id de una imagen ya subida por el usuario, o None."""
+        try:
+            existing = await asyncio.to_thread(UploadRegistry._load, id_user, content_hash)
+        except Exception as exc:
+            logger.warning("No se pudo consultar el registro de subidas: %s", exc)
+            UPLOAD_DEDUP_EVENTS.inc(outcome="error")
+            return None
+
+        UPLOAD_DEDUP_EVENTS.inc(outcome="hit" if existing else "miss")
+        if existing:
+            remember_content_hash(existing["url"], content_hash)
+        return existing
+
+    @staticmethod
+    async def register(id_user: int, content_hash: str, image_url: str, public_id: Optional[str] = None) -> None:
+        """Registra una imagen recién subida (un fallo no afecta a la subida)."""
+        remember_content_hash(image_url, content_hash)
+        try:
+            await asyncio.to_thread(UploadRegistry._store, id_user, content_hash, image_url, public_id)
+        except Exception as exc:
+            logger.warning("No se pudo registrar la subida: %s", exc)
@@ -71,3 +71,34 @@ class UsageLimitService:
         db.commit()
         db.refresh(usage)
         return UsageLimitService.get_usage_status(db, id_user)
+
+    @staticmethod
+    def reserve_usage(db: Session, id_user: int, tipo_uso: TipoUsoAgente) -> UsoAgenteIA:
+        """
+        Reserva un uso antes de generar (varias variantes cuentan como una sola reserva)
+
+        Se inserta primero y se vuelve a contar después del commit: si en la ventana
+        hay más usos que el límite, la reserva se deshace. Dos turnos simultáneos con
+        un solo uso disponible nunca pasan los dos (en el peor caso se rechazan ambos).
+        Si la generación falla se devuelve con release_usage.
+
+        Raises:
+            UsageLimitExceededError: Si el usuario ya no tiene usos disponibles
+        """
+        UsageLimitService.ensure_usage_available(db, id_user)
+        usage = UsoAgenteIA(id_user=id_user, tipo_uso=tipo_uso)
+        db.add(usage)
+        db.commit()
+        db.refresh(usage)
+
+        used = UsageLimitService._recent_uses_query(db, id_user, datetime.utcnow()).count()
+        if used > UsageLimitService.LIMIT:
+            UsageLimitService.release_usage(db, usage)
+            raise UsageLimitExceededError(UsageLimitService.get_usage_status(db, id_user))
+        return usage
+
+    @staticmethod
+    def release_usage(db: Session, usage: UsoAgenteIA) -> None:
+        """Devuelve un uso reservado cuya generación no produjo ningún resultado."""
+        db.delete(usage)
+        db.commit()
@@ -0,0 +1,68 @@
+"""
+Hash de contenido de las imágenes subidas, como identidad en las claves de cache
+
+Si una URL corresponde a una imagen subida por un usuario (tabla subidas_usuario),
+su identidad en los caches de análisis y de generación es el SHA-256 del contenido:
+la misma imagen con dos URLs distintas (p. ej. subida por dos usuarios) comparte
+resultados. La resolución es la misma en cualquier proceso o réplica: la memoria es
+solo un atajo delante de la tabla, así que los tiers en MySQL no se parten.
+"""
+import asyncio
+import logging
+from typing import Optional
+
+from app.config.database import SessionLocal
+from app.config.settings import settings
+from app.models import SubidaUsuario
+from app.utils.cache import TTLCache
+from app.utils.urls import normalize_image_url
+
+logger = logging.getLogger(__name__)
+
+# URL -> hash ("" si la URL no es una subida); el contenido de una URL estable no cambia
+_known_hashes: TTLCache[str, str] = TTLCache(settings.UPLOAD_HASH_MEMORY_ENTRIES, ttl_seconds=7 * 86400)
+
+
+def remember_content_hash(image_url: str, content_hash: str) -> None:
+    """Registra en memoria el hash de una URL recién subida o deduplicada."""
+    _known_hashes.set(image_url.strip(), content_hash)
+
+
+def _load_content_hash(image_url: str) -> Optional[str]:
+    db = SessionLocal()
+    try:
+        row = (
+            db.query(SubidaUsuario.content_hash)
+            .filter(SubidaUsuario.image_url == image_url)
+            .first()
+        )
+        return row.content_hash if row else None
+    finally:
+        db.close()
+
+
+async def resolve_content_hash(image_url: str) -> Optional[str]:
+    """Hash de contenido de una URL subida, o None si no es una subida (o no se pudo consultar)."""
+    image_url = (image_url or "").strip()
+    if not image_url.startswith(("http://", "https://")):
+        return None
+
+    known = _known_hashes.get(image_url)
+    if known is not None:
+        return known or None
+
+    try:
+        content_hash = await asyncio.to_thread(_load_content_hash, image_url)
+    except Exception as exc:
+        # Sin caché del fallo: la próxima búsqueda vuelve a consultar la tabla
+        logger.warning("No se pudo resolver el hash de %s: %s", image_url[:120], exc)
+        return None
+
+    _known_hashes.set(image_url, content_hash or "")
+    return content_hash
+
+
+async def resolve_image_identity(image_url: str) -> str:
+    """Identidad de una imagen en las claves de cache: "sha256:<hash>" si es una subida, si no la URL normalizada."""
+    content_hash = await resolve_content_hash(image_url)
+    return f"sha256:{content_hash}" if content_hash else normalize_image_url(image_url)
@@ -0,0 +1,50 @@
+"""
+Presupuesto de tiempo por petición
+
+Una petición fija un presupuesto total (p. ej. 45 s) y cada llamada externa
+toma como plazo el mínimo entre su propio timeout y lo que queda del presupuesto.
+El presupuesto vive en un ContextVar, así que cada petición/tarea tiene el suyo.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+_request_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+@contextmanager
+def request_budget(seconds: float) -> Iterator[None]:
+    """Fija el presupuesto de la petición actual mientras dure el bloque."""
+    token = _request_deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        try:
+            _request_deadline.reset(token)
+        except ValueError:
+            # El bloque se cerró desde otro contexto (p. ej. un generador finalizado por el GC)
+            pass
+
+
+def remaining_budget() -> Optional[float]:
+    """Segundos que quedan del presupuesto actual, o None si no hay presupuesto."""
+    deadline = _request_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def call_timeout(timeout_seconds: float) -> float:
+    """
+    Plazo efectivo de una llamada: su timeout acotado por el presupuesto restante
+
+    Raises:
+        TimeoutError: Si el presupuesto de la petición ya se agotó
+    """
+    remaining = remaining_budget()
+    if remaining is None:
+        return timeout_seconds
+    if remaining <= 0:
+        raise TimeoutError("Se agoto el tiempo disponible para responder esta solicitud")
+    return min(timeout_seconds, remaining)
@@ -0,0 +1,89 @@
+"""
+Cancelación cuando el cliente HTTP se desconecta
+
+La ruta fija con watch_disconnect(request.is_disconnected) cómo saber si el
+navegador sigue ahí; las esperas largas (predicciones de Replicate) usan
+await_unless_disconnected para dejar de esperar, y cancelar lo que corresponda,
+cuando el cliente se fue. La comprobación vive en un ContextVar, así que cada
+petición/tarea tiene la suya, igual que el presupuesto de app/utils/deadline.py.
+"""
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Iterator, Optional, TypeVar
+
+DisconnectCheck = Callable[[], Awaitable[bool]]
+
+T = TypeVar("T")
+
+_disconnect_check: ContextVar[Optional[DisconnectCheck]] = ContextVar("disconnect_check", default=None)
+
+# Cada cuánto se pregunta si el cliente sigue conectado
+DISCONNECT_POLL_SECONDS = 1.0
+
+# Código de estado para peticiones abandonadas por el cliente (convención de nginx)
+CLIENT_CLOSED_REQUEST = 499
+
+
+class ClientDisconnectedError(Exception):
+    """El cliente cerró la conexión antes de recibir la respuesta"""
+
+
+@contextmanager
+def watch_disconnect(is_disconnected: Optional[DisconnectCheck]) -> Iterator[None]:
+    """Fija la comprobación de desconexión de la petición actual mientras dure el bloque (None la desactiva)."""
+    token = _disconnect_check.set(is_disconnected)
+    try:
+        yield
+    finally:
+        try:
+            _disconnect_check.reset(token)
+        except ValueError:
+            # El bloque se cerró desde otro contexto (p. ej. un generador finalizado por el GC)
+            pass
+
+
+async def never_disconnected() -> bool:
+    """
+    Comprobación para trabajo compartido por varias peticiones
+
+    Nunca se desconecta por sí mismo, pero marca la espera como cancelable: el
+    trabajo se cancela desde fuera cuando se va la última petición que lo espera.
+    """
+    return False
+
+
+def disconnect_watched() -> bool:
+    """True si la espera actual puede cancelarse (cliente que puede irse o trabajo compartido)."""
+    return _disconnect_check.get() is not None
+
+
+async def await_unless_disconnected(awaitable: Awaitable[T]) -> T:
+    """
+    Espera `awaitable` mientras el cliente siga conectado
+
+    Si se desconecta, cancela la espera (la tarea interna recibe CancelledError)
+    y lanza ClientDisconnectedError. Sin comprobación fijada es un await normal.
+    """
+    is_disconnected = _disconnect_check.get()
+    if is_disconnected is None:
+        return await awaitable
+
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await is_disconnected():
+                break
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    raise ClientDisconnectedError("El cliente cerró la conexión")
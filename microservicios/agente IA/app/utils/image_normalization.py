@@ -0,0 +1,149 @@
+"""
+Normalización de fotos subidas antes de almacenarlas
+
+Las fotos de móvil (5-12 MB, EXIF con orientación y ubicación) se reducen antes de
+subirlas: Replicate las descarga después como human_img / image_input y una foto
+más ligera acorta la descarga y la predicción. En un proceso aparte:
+
+1. Orienta según EXIF (exif_transpose) y descarta el EXIF
+2. Reduce al lado máximo IMAGE_NORMALIZE_MAX_EDGE (sin ampliar)
+3. Recodifica a JPEG o WebP con IMAGE_NORMALIZE_QUALITY
+
+Decodificar es CPU pura: corre en un ProcessPoolExecutor para no bloquear el event
+loop ni competir por el GIL con las peticiones.
+"""
+import asyncio
+import io
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from PIL import Image, ImageOps
+
+from app.config.settings import settings
+from app.utils.metrics import metrics
+from app.utils.uploads import UploadRejectedError
+
+logger = logging.getLogger(__name__)
+
+BYTE_BUCKETS = (
+    64 * 1024, 256 * 1024, 512 * 1024, 1024 * 1024, 2 * 1024 * 1024,
+    4 * 1024 * 1024, 8 * 1024 * 1024, 12 * 1024 * 1024, 20 * 1024 * 1024,
+)
+
+IMAGE_NORMALIZE_BYTES = metrics.histogram(
+    "agent_image_normalize_bytes",
+    "Tamaño de las fotos subidas antes (original) y después (normalized) de normalizarlas",
+    ("stage",),
+    buckets=BYTE_BUCKETS,
+)
+IMAGE_NORMALIZE_SECONDS = metrics.histogram(
+    "agent_image_normalize_seconds",
+    "Duración de la normalización (incluye la espera por un proceso libre)",
+)
+IMAGE_NORMALIZE_EVENTS = metrics.counter(
+    "agent_image_normalize_total",
+    "Normalizaciones por resultado (normalized, undecodable, failed)",
+    ("outcome",),
+)
+
+# Formato de Pillow y opciones del codificador (method=2: WebP ~2x más rápido por ~3 % más de bytes)
+FORMATS = {"jpeg": ("JPEG", {"optimize": True}), "webp": ("WEBP", {"method": 2})}
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def normalize_image_bytes(data: bytes, max_edge: int, image_format: str, quality: int) -> bytes:
+    """
+    Orienta, reduce y recodifica una imagen (corre en el proceso de trabajo)
+
+    Raises:
+        PIL.UnidentifiedImageError: Si Pillow no reconoce el formato (p. ej. HEIC sin plugin)
+        PIL.Image.DecompressionBombError: Si la imagen declara demasiados píxeles
+    """
+    pil_format, save_options = FORMATS[image_format]
+    with Image.open(io.BytesIO(data)) as image:
+        # JPEG: decodifica directamente a una escala reducida (mucho menos CPU y memoria)
+        image.draft("RGB", (max_edge, max_edge))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+
+        has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+        if pil_format == "JPEG" and has_alpha:
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image.convert("RGBA"), mask=image.convert("RGBA").getchannel("A"))
+            image = background
+        elif image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if has_alpha else "RGB")
+
+        output = io.BytesIO()
+        # Sin exif= ni icc_profile=: los metadatos del original no se copian
+        image.save(output, format=pil_format, quality=quality, **save_options)
+        return output.getvalue()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: hacer fork de un proceso con hilos (uvicorn, pools de E/S) puede bloquear al hijo
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.IMAGE_NORMALIZE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def shutdown_normalization_pool() -> None:
+    """Detiene los procesos de trabajo (apagado de la aplicación)."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def normalized_filename(filename: Optional[str]) -> str:
+    stem = (filename or "upload").rsplit(".", 1)[0] or "upload"
+    return f"{stem}.{settings.IMAGE_NORMALIZE_FORMAT}"
+
+
+async def normalize_image(data: bytes) -> Optional[bytes]:
+    """
+    Versión normalizada de una foto, o None si no se pudo normalizar (se sube el original)
+
+    Raises:
+        UploadRejectedError: 413 si la imagen declara demasiados píxeles
+    """
+    global _pool
+    started_at = time.perf_counter()
+    IMAGE_NORMALIZE_BYTES.observe(len(data), stage="original")
+    try:
+        normalized = await asyncio.get_running_loop().run_in_executor(
+            _get_pool(),
+            normalize_image_bytes,
+            data,
+            settings.IMAGE_NORMALIZE_MAX_EDGE,
+            settings.IMAGE_NORMALIZE_FORMAT,
+            settings.IMAGE_NORMALIZE_QUALITY,
+        )
+    except Image.DecompressionBombError as exc:
+        IMAGE_NORMALIZE_EVENTS.inc(outcome="failed")
+        raise UploadRejectedError("La imagen tiene demasiados píxeles", status_code=413) from exc
+    except BrokenProcessPool:
+        # Un proceso murió (p. ej. por memoria): el pool no se recupera solo
+        logger.error("El pool de normalización se rompió; se recrea")
+        _pool = None
+        IMAGE_NORMALIZE_EVENTS.inc(outcome="failed")
+        return None
+    except Exception as exc:
+        logger.warning("No se pudo normalizar la imagen; se sube el original: %s", exc)
+        IMAGE_NORMALIZE_EVENTS.inc(outcome="undecodable")
+        return None
+    finally:
+        IMAGE_NORMALIZE_SECONDS.observe(time.perf_counter() - started_at)
+
+    IMAGE_NORMALIZE_EVENTS.inc(outcome="normalized")
+    IMAGE_NORMALIZE_BYTES.observe(len(normalized), stage="normalized")
+    return normalized
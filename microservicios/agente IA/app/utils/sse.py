@@ -0,0 +1,16 @@
+"""Formato Server-Sent Events compartido por las rutas con streaming"""
+import json
+from typing import Any, Dict
+
+from fastapi.encoders import jsonable_encoder
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Serializa un evento en formato Server-Sent Events."""
+    payload = json.dumps(jsonable_encoder(data), ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+def format_sse_comment(text: str = "keepalive") -> str:
+    """Comentario SSE (los clientes lo ignoran; mantiene viva la conexión)."""
+    return f": {text}\n\n"
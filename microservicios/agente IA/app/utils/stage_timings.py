@@ -0,0 +1,104 @@
+"""
+Tiempos por etapa de una petición
+
+Cada etapa de un pipeline (prompt de diseño, referencias, predicción, subida...)
+se mide con `with stage("nombre"):`. La duración de cada ejecución va siempre al
+histograma agent_pipeline_stage_seconds y, si la ruta abrió collect_stage_timings(),
+el colector de la petición guarda el intervalo de la etapa, que la ruta devuelve en
+la cabecera Server-Timing. Una etapa que corre varias veces en paralelo (p. ej. una
+predicción por variante) cuenta en la cabecera como su intervalo total, del primer
+inicio al último fin, y no como la suma de sus ejecuciones.
+El colector vive en un ContextVar: las tareas hijas (asyncio.gather) lo comparten.
+"""
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Dict, Iterator, List, Optional, Tuple
+
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+STAGE_DURATION = metrics.histogram(
+    "agent_pipeline_stage_seconds",
+    "Duración de cada etapa de los pipelines de generación",
+    ("stage",),
+)
+
+
+class StageTimings:
+    """Intervalos (inicio y fin en perf_counter) de las etapas de una petición, en orden de finalización."""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.spans: Dict[str, Tuple[float, float]] = {}
+
+    def record(self, name: str, started_at: float, ended_at: float) -> None:
+        # Una etapa repetida (p. ej. varias variantes en paralelo) abarca del primer inicio al último fin
+        first_start, last_end = self.spans.get(name, (started_at, ended_at))
+        self.spans[name] = (min(first_start, started_at), max(last_end, ended_at))
+
+    @property
+    def stages(self) -> Dict[str, float]:
+        """Duración de pared (segundos) de cada etapa."""
+        return {name: ended_at - started_at for name, (started_at, ended_at) in self.spans.items()}
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def server_timing(self) -> str:
+        """Valor de la cabecera Server-Timing ("etapa;dur=ms, ..., total;dur=ms")."""
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+        entries.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_current_timings: ContextVar[Optional[StageTimings]] = ContextVar("stage_timings", default=None)
+
+
+@contextmanager
+def collect_stage_timings() -> Iterator[StageTimings]:
+    """Recoge las etapas de la petición actual mientras dure el bloque."""
+    timings = StageTimings()
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        try:
+            _current_timings.reset(token)
+        except ValueError:
+            # El bloque se cerró desde otro contexto (p. ej. un generador finalizado por el GC)
+            pass
+        if timings.spans:
+            logger.debug("Etapas: %s", timings.server_timing())
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Mide una etapa (también si falla)."""
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        ended_at = time.perf_counter()
+        STAGE_DURATION.observe(ended_at - started_at, stage=name)
+        timings = _current_timings.get()
+        if timings is not None:
+            timings.record(name, started_at, ended_at)
+
+
+async def gather_stages(*stages: Awaitable[Any]) -> List[Any]:
+    """
+    Ejecuta etapas independientes a la vez y devuelve sus resultados en orden
+
+    Si una falla, las demás se cancelan (su trabajo ya no sirve) y se propaga el error.
+    """
+    tasks = [asyncio.ensure_future(awaitable) for awaitable in stages]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
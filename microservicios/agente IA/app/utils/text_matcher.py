@@ -0,0 +1,86 @@
+"""
+Búsqueda de muchas palabras clave en una sola pasada (Aho-Corasick)
+
+Las palabras clave se agrupan por etiqueta; `KeywordMatcher.find` recorre el
+texto una vez y devuelve todas las etiquetas cuyas palabras aparecen como
+subcadena, igual que `any(k in texto for k in palabras)` por cada grupo.
+"""
+import unicodedata
+from collections import deque
+from typing import Dict, FrozenSet, Iterable, List
+
+
+def fold_text(text: str) -> str:
+    """
+    Normaliza texto para comparar palabras clave
+
+    - Minúsculas
+    - Sin tildes ni diéresis (la ñ pasa a n)
+    - Espacios repetidos colapsados
+    """
+    decomposed = unicodedata.normalize("NFKD", (text or "").lower())
+    without_marks = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(without_marks.split())
+
+
+class KeywordMatcher:
+    """Autómata Aho-Corasick compilado a una tabla de transiciones completa"""
+
+    def __init__(self, keywords_by_label: Dict[str, Iterable[str]]):
+        goto: List[Dict[str, int]] = [{}]
+        outputs: List[FrozenSet[str]] = [frozenset()]
+
+        for label, keywords in keywords_by_label.items():
+            for keyword in keywords:
+                folded = fold_text(keyword)
+                if not folded:
+                    continue
+                state = 0
+                for char in folded:
+                    next_state = goto[state].get(char)
+                    if next_state is None:
+                        goto.append({})
+                        outputs.append(frozenset())
+                        next_state = len(goto) - 1
+                        goto[state][char] = next_state
+                    state = next_state
+                outputs[state] = outputs[state] | {label}
+
+        # Enlaces de fallo en orden BFS; cada estado hereda las salidas y
+        # transiciones de su enlace, así la búsqueda nunca retrocede
+        fail = [0] * len(goto)
+        transitions: List[Dict[str, int]] = [dict(goto[0])] + [{} for _ in goto[1:]]
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            fallback = fail[state]
+            outputs[state] = outputs[state] | outputs[fallback]
+            transitions[state] = {**transitions[fallback], **goto[state]}
+            for char, next_state in goto[state].items():
+                fail[next_state] = transitions[fallback].get(char, 0)
+                queue.append(next_state)
+
+        self._transitions = transitions
+        self._outputs = outputs
+        self.labels = frozenset(keywords_by_label)
+
+    def find(self, text: str, folded: bool = False) -> FrozenSet[str]:
+        """
+        Etiquetas cuyas palabras clave aparecen en el texto
+
+        Args:
+            text: Texto a analizar
+            folded: True si el texto ya pasó por fold_text
+
+        Returns:
+            Conjunto de etiquetas encontradas
+        """
+        transitions = self._transitions
+        outputs = self._outputs
+        state = 0
+        found: FrozenSet[str] = frozenset()
+        for char in text if folded else fold_text(text):
+            state = transitions[state].get(char, 0)
+            if outputs[state]:
+                found = found | outputs[state]
+        return found
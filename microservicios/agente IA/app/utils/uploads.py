@@ -0,0 +1,108 @@
+"""
+Validación de imágenes subidas por el usuario
+
+Se revisa el tamaño declarado por la petición multipart y los primeros bytes del
+archivo (no el Content-Type que envía el cliente) antes de pasar el stream al
+almacenamiento, sin leer el archivo completo en memoria.
+"""
+import asyncio
+import hashlib
+from typing import BinaryIO, Optional
+
+from fastapi import UploadFile
+
+from app.config.settings import settings
+
+# Bytes necesarios para reconocer todos los formatos admitidos
+SNIFF_BYTES = 32
+# Lectura por trozos al calcular el hash de contenido
+HASH_CHUNK_BYTES = 1024 * 1024
+
+# Marcas ISO-BMFF ("ftyp") de HEIC/AVIF
+_HEIF_BRANDS = {b"heic": "image/heic", b"heix": "image/heic", b"mif1": "image/heif", b"avif": "image/avif"}
+
+
+class UploadRejectedError(ValueError):
+    """La imagen subida no se acepta (vacía, demasiado grande o formato no admitido)"""
+
+    def __init__(self, detail: str, status_code: int):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """MIME real de una imagen a partir de sus primeros bytes, o None si no es un formato admitido."""
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:8] == b"ftyp":
+        return _HEIF_BRANDS.get(head[8:12])
+    return None
+
+
+async def validate_image_upload(file: UploadFile, max_bytes: Optional[int] = None) -> str:
+    """
+    Comprueba tamaño y formato de una imagen subida y deja el stream al inicio
+
+    Args:
+        file: Imagen subida
+        max_bytes: Tamaño máximo admitido (por defecto UPLOAD_MAX_BYTES)
+
+    Raises:
+        UploadRejectedError: 400 si está vacía, 413 si supera el tamaño máximo,
+            415 si su contenido no es una imagen admitida
+
+    Returns:
+        MIME detectado
+    """
+    size = file.size
+    if size is None:
+        # Sin tamaño declarado: se mide moviendo el cursor, sin leer el contenido
+        await file.seek(0)
+        file.file.seek(0, 2)
+        size = file.file.tell()
+        await file.seek(0)
+
+    max_bytes = max_bytes or settings.UPLOAD_MAX_BYTES
+    if size == 0:
+        raise UploadRejectedError("El archivo está vacío", status_code=400)
+    if size > max_bytes:
+        raise UploadRejectedError(
+            f"La imagen supera el tamaño máximo de {max_bytes // (1024 * 1024)} MB",
+            status_code=413,
+        )
+
+    head = await file.read(SNIFF_BYTES)
+    await file.seek(0)
+    mime_type = sniff_image_type(head)
+    if mime_type is None:
+        raise UploadRejectedError(
+            "El archivo no es una imagen admitida (PNG, JPEG, GIF, WebP, HEIC o AVIF)",
+            status_code=415,
+        )
+    return mime_type
+
+
+def _sha256_stream(stream: BinaryIO) -> str:
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(HASH_CHUNK_BYTES), b""):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+async def hash_upload(file: UploadFile) -> str:
+    """
+    SHA-256 (hex) del contenido subido, leído por trozos fuera del event loop
+
+    Se calcula sobre la copia que ya recibió el servidor, antes de enviarla al
+    almacenamiento; deja el stream al inicio.
+    """
+    return await asyncio.to_thread(_sha256_stream, file.file)
@@ -0,0 +1,21 @@
+"""
+Normalización de URLs de imágenes para claves de cache
+"""
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+
+def normalize_image_url(image_url: str) -> str:
+    """
+    Normaliza una URL para que variantes equivalentes compartan la misma clave.
+
+    - Esquema y host en minúsculas
+    - Sin fragmento (#...)
+    - Parámetros de query ordenados
+    """
+    normalized = (image_url or "").strip()
+    if not normalized.lower().startswith(("http://", "https://")):
+        return normalized
+
+    parts = urlsplit(normalized)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, query, ""))
@@ -0,0 +1,462 @@
+"""
+Benchmark de extremo a extremo de las rutas del agente
+
+Uso (desde la carpeta del microservicio):
+    python benchmarks/e2e_bench.py [--scenarios chat tryon generate images_design]
+        [--requests 20] [--concurrency 5] [--replicate-queue 0.5] [--replicate-predict 4]
+        [--cloudinary-latency 0.3] [--gemini-scale 1] [--json resultados.json]
+        [--compare base.json]
+
+Arranca, cada uno en su hilo y en un puerto local:
+- El agente (app.main) con una base SQLite desechable en un directorio temporal
+- El Replicate falso (benchmarks/fakes/fake_replicate.py) con tiempos de cola y
+  de predicción configurables
+- El Cloudinary falso (benchmarks/fakes/fake_cloudinary.py); el SDK se apunta a él
+  con upload_prefix. Con --storage local el agente guarda en disco (STORAGE_BACKEND=local)
+  y el falso solo sirve las imágenes de catálogo
+Gemini lo sustituye el proveedor local del orquestador (LLM_PROVIDER=local), con
+sus latencias simuladas por tipo de llamada (LLM_LOCAL_LATENCY_MS, escaladas con
+--gemini-scale).
+
+Escenarios:
+- chat: POST /chat/session/{id}/message pidiendo generar la personalización
+- tryon: POST /tryon/generate
+- generate: POST /generate (ruta legacy)
+- images_design, images_reference, images_photo: POST /images/{design,reference,photo}
+- images_reference_batch: POST /images/references/batch con --batch-files archivos
+
+Cada petición usa un usuario distinto (el límite de usos por 24 h no interviene)
+y los caches de resultados se desactivan salvo con --result-cache: se mide el
+camino completo. Por escenario se informa latencia p50/p95/p99, rendimiento,
+desglose por etapa (cabecera Server-Timing) y llamadas a los falsos.
+
+Con --json se guardan los resultados (con el commit actual) y con --compare se
+comparan contra otro archivo; la salida es 1 si algún p95 empeora más que --threshold.
+"""
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from fakes.server import BackgroundServer, free_port  # noqa: E402
+
+SCENARIOS = ("chat", "tryon", "generate", "images_design", "images_reference", "images_photo", "images_reference_batch")
+CLOUD_NAME = "bench"
+PRODUCT_ID = 1
+
+
+def configure_environment(args: argparse.Namespace, workdir: Path, ports: Dict[str, int]) -> None:
+    """Variables del agente; deben fijarse antes de importar app (settings se lee al importar)."""
+    os.environ.update(
+        {
+            "LLM_PROVIDER": "local",
+            "DATABASE_URL": f"sqlite:///{workdir / 'agente.db'}",
+            "REPLICATE_API_TOKEN": "benchmark-token",
+            "REPLICATE_API_BASE_URL": f"http://127.0.0.1:{ports['replicate']}/v1",
+            "CLOUDINARY_CLOUD_NAME": CLOUD_NAME,
+            "CLOUDINARY_API_KEY": "benchmark-key",
+            "CLOUDINARY_API_SECRET": "benchmark-secret",
+            "DESIGN_RESULT_CACHE_ENABLED": str(args.result_cache).lower(),
+            "LLM_LOCAL_SEED": str(args.seed),
+            "STORAGE_BACKEND": args.storage,
+            "STORAGE_LOCAL_ROOT": str(workdir / "media"),
+            "STORAGE_LOCAL_PUBLIC_URL": f"http://127.0.0.1:{ports['agent']}/media",
+        }
+    )
+    # Sin webhooks: el falso no puede alcanzar una URL pública
+    os.environ.pop("REPLICATE_WEBHOOK_URL", None)
+    os.environ.pop("REPLICATE_WEBHOOK_SECRET", None)
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Percentil por rango más cercano de una lista ordenada."""
+    if not values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(values)))
+    return values[rank - 1]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    ordered = sorted(values)
+    if not ordered:
+        return {}
+    return {
+        "mean": round(statistics.fmean(ordered), 1),
+        "p50": round(percentile(ordered, 0.50), 1),
+        "p95": round(percentile(ordered, 0.95), 1),
+        "p99": round(percentile(ordered, 0.99), 1),
+        "max": round(ordered[-1], 1),
+    }
+
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    """{"etapa": ms} de una cabecera Server-Timing ("design_prompt;dur=812.3, total;dur=...")."""
+    stages: Dict[str, float] = {}
+    for entry in (header or "").split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if name and key == "dur":
+                stages[name] = float(value)
+    return stages
+
+
+def make_png(size_kb: int, seed: int) -> bytes:
+    """PNG real de ruido de unos `size_kb` KB (el ruido no se comprime)."""
+    from PIL import Image
+
+    side = max(1, int(math.sqrt(size_kb * 1024 / 3)))
+    noise = random.Random(seed).randbytes(side * side * 3)
+    buffer = io.BytesIO()
+    Image.frombytes("RGB", (side, side), noise).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class Bench:
+    """Estado compartido de una corrida: URLs de los servidores, falsos y datos preparados."""
+
+    def __init__(self, args: argparse.Namespace, agent_url: str, replicate, cloudinary):
+        self.args = args
+        self.agent_url = agent_url
+        self.replicate = replicate
+        self.cloudinary = cloudinary
+        self.product_image_url = f"{cloudinary.base_url}/{CLOUD_NAME}/image/upload/v1/catalogo/camiseta.png"
+        self.upload_png = make_png(args.upload_kb, args.seed)
+        # Datos preparados por petición (sesión de chat, foto para el try-on)
+        self.prepared: Dict[str, Dict[int, Any]] = defaultdict(dict)
+
+    @staticmethod
+    def user_for(scenario: str, index: int) -> int:
+        return (SCENARIOS.index(scenario) + 1) * 100_000 + index
+
+
+# ---------------------------------------------------------------- preparación
+
+async def prepare_chat(bench: Bench, client, index: int) -> None:
+    response = await client.post(
+        "/chat/session",
+        json={"id_user": bench.user_for("chat", index), "product_id": PRODUCT_ID, "terms_accepted": True},
+    )
+    response.raise_for_status()
+    bench.prepared["chat"][index] = response.json()["id"]
+
+
+async def prepare_tryon(bench: Bench, client, index: int) -> None:
+    from app.config.database import SessionLocal
+    from app.models import FotoUsuario
+
+    def insert_photo() -> int:
+        db = SessionLocal()
+        try:
+            foto = FotoUsuario(
+                id_user=bench.user_for("tryon", index),
+                foto_url=f"{bench.cloudinary.base_url}/{CLOUD_NAME}/image/upload/v1/fotos/{index}.png",
+                es_principal=True,
+            )
+            db.add(foto)
+            db.commit()
+            return foto.id
+        finally:
+            db.close()
+
+    bench.prepared["tryon"][index] = await asyncio.to_thread(insert_photo)
+
+
+# ---------------------------------------------------------------- peticiones
+
+async def send_chat(bench: Bench, client, index: int):
+    return await client.post(
+        f"/chat/session/{bench.prepared['chat'][index]}/message",
+        json={
+            "mensaje": f"Genera el diseño con un tigre azul en el pecho, versión {index}",
+            "product_id": PRODUCT_ID,
+            "product_name": "Camiseta básica",
+            "product_image_url": bench.product_image_url,
+            "terms_accepted": True,
+        },
+    )
+
+
+async def send_tryon(bench: Bench, client, index: int):
+    return await client.post(
+        "/tryon/generate",
+        json={
+            "id_user": bench.user_for("tryon", index),
+            "foto_usuario_id": bench.prepared["tryon"][index],
+            "garment_image_url": bench.product_image_url,
+            "garment_description": "Camiseta básica",
+            "garment_category": "upper_body",
+        },
+    )
+
+
+async def send_generate(bench: Bench, client, index: int):
+    return await client.post(
+        "/generate",
+        json={"prompt": f"Camiseta blanca con un tigre azul, versión {index}", "aspectRatio": "1:1"},
+    )
+
+
+def send_upload(kind: str) -> Callable:
+    async def send(bench: Bench, client, index: int):
+        return await client.post(
+            f"/images/{kind}",
+            data={"id_user": str(bench.user_for(f"images_{kind}", index))},
+            files={"file": (f"bench-{index}.png", bench.upload_png, "image/png")},
+        )
+
+    return send
+
+
+async def send_reference_batch(bench: Bench, client, index: int):
+    # Archivos distintos entre sí: iguales se deduplicarían por hash de contenido
+    files = [
+        ("files", (f"bench-{index}-{position}.png", bench.upload_png + bytes([position]), "image/png"))
+        for position in range(bench.args.batch_files)
+    ]
+    return await client.post(
+        "/images/references/batch",
+        data={"id_user": str(bench.user_for("images_reference_batch", index))},
+        files=files,
+    )
+
+
+PREPARE: Dict[str, Callable] = {"chat": prepare_chat, "tryon": prepare_tryon}
+SEND: Dict[str, Callable] = {
+    "chat": send_chat,
+    "tryon": send_tryon,
+    "generate": send_generate,
+    "images_design": send_upload("design"),
+    "images_reference": send_upload("reference"),
+    "images_photo": send_upload("photo"),
+    "images_reference_batch": send_reference_batch,
+}
+
+
+# ---------------------------------------------------------------- ejecución
+
+async def run_scenario(bench: Bench, client, scenario: str) -> Dict[str, Any]:
+    args = bench.args
+    total = args.warmup + args.requests
+    prepare = PREPARE.get(scenario)
+    if prepare is not None:
+        await asyncio.gather(*(prepare(bench, client, index) for index in range(total)))
+
+    send = SEND[scenario]
+    for index in range(args.warmup):
+        await send(bench, client, index)
+
+    bench.replicate.reset_counters()
+    bench.cloudinary.reset_counters()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    stages: Dict[str, List[float]] = defaultdict(list)
+
+    async def measured(index: int) -> None:
+        async with semaphore:
+            started_at = time.perf_counter()
+            try:
+                response = await send(bench, client, index)
+            except Exception as exc:
+                statuses[type(exc).__name__] += 1
+                return
+            latencies.append((time.perf_counter() - started_at) * 1000)
+            statuses[str(response.status_code)] += 1
+            for name, duration in parse_server_timing(response.headers.get("server-timing")).items():
+                if name != "total":
+                    stages[name].append(duration)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(measured(index) for index in range(args.warmup, total)))
+    wall_seconds = time.perf_counter() - started_at
+
+    errors = sum(count for status, count in statuses.items() if not status.startswith("2"))
+    return {
+        "requests": args.requests,
+        "errors": errors,
+        "status_codes": dict(statuses),
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_rps": round(args.requests / wall_seconds, 3) if wall_seconds else 0.0,
+        "latency_ms": summarize(latencies),
+        "stages_ms": {name: summarize(values) for name, values in stages.items()},
+        "replicate": {
+            "predictions": bench.replicate.created,
+            "polls": bench.replicate.polls,
+            "canceled": bench.replicate.canceled,
+        },
+        "cloudinary": {
+            "uploads": bench.cloudinary.uploads,
+            "chunks": bench.cloudinary.chunks,
+            "remote_uploads": bench.cloudinary.remote_uploads,
+            "bytes": bench.cloudinary.bytes_received,
+        },
+    }
+
+
+def current_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main_async(args: argparse.Namespace) -> Dict[str, Any]:
+    import httpx
+
+    with tempfile.TemporaryDirectory(prefix="agente-bench-") as workdir:
+        ports = {"replicate": free_port(), "cloudinary": free_port(), "agent": free_port()}
+        configure_environment(args, Path(workdir), ports)
+
+        # Importar app solo después de configurar el entorno
+        import cloudinary
+
+        from app.config.database import Base, engine
+        from app.config.settings import settings
+        from app.main import app as agent_app
+        from fakes.fake_cloudinary import FakeCloudinary
+        from fakes.fake_replicate import FakeReplicate
+
+        Base.metadata.create_all(engine)
+        for call_type in settings.LLM_LOCAL_LATENCY_MS:
+            settings.LLM_LOCAL_LATENCY_MS[call_type] *= args.gemini_scale
+
+        replicate = FakeReplicate(
+            latency_seconds=args.replicate_predict,
+            queue_seconds=args.replicate_queue,
+            jitter=args.jitter,
+            base_url=f"http://127.0.0.1:{ports['replicate']}",
+            seed=args.seed,
+        )
+        fake_cloudinary = FakeCloudinary(
+            latency_seconds=args.cloudinary_latency,
+            per_mb_seconds=args.cloudinary_per_mb,
+            jitter=args.jitter,
+            base_url=f"http://127.0.0.1:{ports['cloudinary']}",
+            seed=args.seed,
+        )
+        cloudinary.config(upload_prefix=fake_cloudinary.base_url)
+
+        with BackgroundServer(replicate.app, ports["replicate"]), \
+                BackgroundServer(fake_cloudinary.app, ports["cloudinary"]), \
+                BackgroundServer(agent_app, ports["agent"]) as agent:
+            bench = Bench(args, agent.url, replicate, fake_cloudinary)
+            limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency)
+            async with httpx.AsyncClient(base_url=agent.url, timeout=args.timeout, limits=limits) as client:
+                scenarios = {}
+                for scenario in args.scenarios:
+                    scenarios[scenario] = await run_scenario(bench, client, scenario)
+                    print(f"  {scenario}: {scenarios[scenario]['latency_ms']}", file=sys.stderr)
+
+    return {
+        "commit": current_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "params": {
+            key: value for key, value in vars(args).items() if key not in {"json_path", "compare_path"}
+        },
+        "scenarios": scenarios,
+    }
+
+
+# ---------------------------------------------------------------- informe
+
+def print_report(results: Dict[str, Any]) -> None:
+    print(
+        f"{'escenario':<17} {'ok/err':>8} {'req/s':>7} {'p50':>8} {'p95':>8} {'p99':>8} "
+        f"{'pred':>5} {'subidas':>7}"
+    )
+    for name, row in results["scenarios"].items():
+        latency = row["latency_ms"]
+        print(
+            f"{name:<17} {row['requests'] - row['errors']:>4}/{row['errors']:<3} {row['throughput_rps']:>7.2f} "
+            f"{latency.get('p50', 0):>6.0f}ms {latency.get('p95', 0):>6.0f}ms {latency.get('p99', 0):>6.0f}ms "
+            f"{row['replicate']['predictions']:>5} {row['cloudinary']['uploads']:>7}"
+        )
+        for stage_name, stage in row["stages_ms"].items():
+            print(f"    {stage_name:<22} p50 {stage['p50']:>7.0f}ms  p95 {stage['p95']:>7.0f}ms")
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> bool:
+    """Imprime la variación frente a `baseline`; True si algún p95 empeora más que `threshold`."""
+    print(f"\nComparación con {baseline.get('commit') or 'base'} (umbral p95 +{threshold:.0%})")
+    changed = sorted(
+        key
+        for key, value in results["params"].items()
+        if key not in {"scenarios", "threshold"} and baseline.get("params", {}).get(key) != value
+    )
+    if changed:
+        print(f"Aviso: parámetros distintos a la base ({', '.join(changed)}); la comparación no es directa")
+    regressed = False
+    for name, row in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base or not base["latency_ms"] or not row["latency_ms"]:
+            continue
+        deltas = {
+            metric: (row["latency_ms"][metric] - base["latency_ms"][metric]) / base["latency_ms"][metric]
+            for metric in ("p50", "p95", "p99")
+            if base["latency_ms"][metric]
+        }
+        is_regression = deltas.get("p95", 0.0) > threshold
+        regressed = regressed or is_regression
+        print(
+            f"{name:<17} "
+            + "  ".join(f"{metric} {delta:+.1%}" for metric, delta in deltas.items())
+            + f"  req/s {row['throughput_rps']:.2f} (antes {base['throughput_rps']:.2f})"
+            + ("  REGRESIÓN" if is_regression else "")
+        )
+    return regressed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=20, help="Peticiones medidas por escenario")
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1, help="Peticiones previas no medidas por escenario")
+    parser.add_argument("--replicate-queue", type=float, default=0.5, help="Espera media en cola de Replicate (s)")
+    parser.add_argument("--replicate-predict", type=float, default=4.0, help="Duración media de una predicción (s)")
+    parser.add_argument("--cloudinary-latency", type=float, default=0.3, help="Latencia media de una subida (s)")
+    parser.add_argument("--cloudinary-per-mb", type=float, default=0.2, help="Tiempo extra por MB subido (s)")
+    parser.add_argument("--storage", choices=("cloudinary", "local"), default="cloudinary", help="Backend de almacenamiento del agente")
+    parser.add_argument("--gemini-scale", type=float, default=1.0, help="Factor sobre LLM_LOCAL_LATENCY_MS")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--upload-kb", type=int, default=256, help="Tamaño del PNG de los escenarios images_*")
+    parser.add_argument("--batch-files", type=int, default=4, help="Archivos por petición de images_reference_batch")
+    parser.add_argument("--result-cache", action="store_true", help="Deja activo el cache de generaciones")
+    parser.add_argument("--timeout", type=float, default=180.0, help="Timeout por petición (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", default=None, help="Guarda los resultados en este archivo")
+    parser.add_argument("--compare", dest="compare_path", default=None, help="Resultados base para comparar")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Empeoramiento de p95 que cuenta como regresión")
+    args = parser.parse_args()
+
+    results = asyncio.run(main_async(args))
+    print_report(results)
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+    if args.compare_path:
+        baseline = json.loads(Path(args.compare_path).read_text(encoding="utf-8"))
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Dobles locales de servicios externos (Replicate, Cloudinary) y servidores para benchmarks."""
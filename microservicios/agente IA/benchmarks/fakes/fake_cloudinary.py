@@ -0,0 +1,167 @@
+"""
+Cloudinary falso para pruebas y benchmarks locales
+
+Implementa la parte de la Upload API que usa el SDK de Cloudinary:
+
+- POST /v1_1/{cloud}/image/upload  (archivo en multipart, URL remota o trozos con
+  Content-Range + X-Unique-Upload-Id como envía upload_large)
+- POST /v1_1/{cloud}/image/destroy
+- GET/HEAD /{cloud}/image/upload/{public_id} (entrega: PNG de 1x1)
+
+Cada subida tarda una latencia base (en el último trozo) más un tiempo por MB
+recibido. Las firmas no se verifican.
+
+El SDK de Cloudinary es síncrono (urllib3), así que el falso tiene que escuchar
+en un puerto real; se apunta el SDK con upload_prefix:
+
+    python benchmarks/fakes/fake_cloudinary.py --port 8020 --latency 0.3
+    # en el agente: cloudinary.config(upload_prefix="http://localhost:8020")
+"""
+import argparse
+import asyncio
+import random
+import sys
+import uuid
+from pathlib import Path
+from typing import Dict
+
+from fastapi import FastAPI, Request
+from fastapi.responses import Response
+
+BENCHMARKS = Path(__file__).resolve().parent.parent
+if str(BENCHMARKS) not in sys.path:
+    sys.path.insert(0, str(BENCHMARKS))
+
+from fakes.fake_replicate import PNG_1X1  # noqa: E402
+
+
+class FakeCloudinary:
+    """
+    Estado y aplicación ASGI del Cloudinary falso
+
+    Args:
+        latency_seconds: Latencia media de una subida
+        per_mb_seconds: Tiempo extra por MB recibido
+        jitter: Dispersión relativa uniforme de la latencia (0.2 = +/-20 %)
+        base_url: URL pública del falso (para las URLs de entrega)
+        seed: Semilla de latencias
+    """
+
+    def __init__(
+        self,
+        latency_seconds: float = 0.3,
+        per_mb_seconds: float = 0.2,
+        jitter: float = 0.2,
+        base_url: str = "http://fake-cloudinary",
+        seed: int = 0,
+    ):
+        self.latency_seconds = latency_seconds
+        self.per_mb_seconds = per_mb_seconds
+        self.jitter = jitter
+        self.base_url = base_url.rstrip("/")
+        self._random = random.Random(seed)
+
+        self.uploads = 0
+        self.chunks = 0
+        self.remote_uploads = 0
+        self.bytes_received = 0
+        self.destroyed = 0
+        self.deliveries = 0
+        # public_id de las subidas por trozos en curso (X-Unique-Upload-Id)
+        self._chunked: Dict[str, str] = {}
+        self.app = self._build_app()
+
+    def reset_counters(self) -> None:
+        self.uploads = self.chunks = self.remote_uploads = self.bytes_received = 0
+        self.destroyed = self.deliveries = 0
+
+    def _latency(self, size_bytes: int, last_chunk: bool = True) -> float:
+        spread = self.latency_seconds * self.jitter
+        base = max(0.0, self.latency_seconds + self._random.uniform(-spread, spread)) if last_chunk else 0.0
+        return base + self.per_mb_seconds * size_bytes / (1024 * 1024)
+
+    async def _upload(self, cloud: str, request: Request) -> dict:
+        form = await request.form()
+        upload = form.get("file")
+        if isinstance(upload, str):
+            # Subida desde URL: Cloudinary descarga la imagen por su cuenta
+            size = 0
+            self.remote_uploads += 1
+        else:
+            size = len(await upload.read()) if upload is not None else 0
+        self.bytes_received += size
+
+        # Trozo de una subida "large": "bytes inicio-fin/total"
+        upload_id = request.headers.get("x-unique-upload-id")
+        first_chunk = last_chunk = True
+        content_range = request.headers.get("content-range", "")
+        if upload_id and content_range.startswith("bytes "):
+            span, _, total = content_range[len("bytes "):].partition("/")
+            start, _, end = span.partition("-")
+            first_chunk = int(start) == 0
+            last_chunk = int(end) + 1 >= int(total)
+            self.chunks += 1
+        if first_chunk:
+            self.uploads += 1
+        await asyncio.sleep(self._latency(size, last_chunk))
+
+        folder = str(form.get("folder") or "").strip("/")
+        public_id = f"{folder}/{uuid.uuid4().hex[:20]}" if folder else uuid.uuid4().hex[:20]
+        if upload_id:
+            public_id = self._chunked.setdefault(upload_id, public_id)
+            if last_chunk:
+                del self._chunked[upload_id]
+        return {
+            "public_id": public_id,
+            "version": 1,
+            "format": "png",
+            "resource_type": "image",
+            "width": 1,
+            "height": 1,
+            "bytes": size,
+            "url": f"{self.base_url}/{cloud}/image/upload/v1/{public_id}.png",
+            "secure_url": f"{self.base_url}/{cloud}/image/upload/v1/{public_id}.png",
+        }
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI(title="Fake Cloudinary")
+
+        @app.post("/v1_1/{cloud}/image/upload")
+        async def upload(cloud: str, request: Request):
+            return await self._upload(cloud, request)
+
+        @app.post("/v1_1/{cloud}/image/destroy")
+        async def destroy(cloud: str, request: Request):
+            self.destroyed += 1
+            return {"result": "ok"}
+
+        @app.api_route("/{cloud}/image/upload/{path:path}", methods=["GET", "HEAD"])
+        async def deliver(cloud: str, path: str):
+            self.deliveries += 1
+            return Response(PNG_1X1, media_type="image/png")
+
+        return app
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Cloudinary falso local")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8020)
+    parser.add_argument("--latency", type=float, default=0.3, help="Latencia media de una subida (s)")
+    parser.add_argument("--per-mb", type=float, default=0.2, help="Tiempo extra por MB subido (s)")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    args = parser.parse_args()
+
+    fake = FakeCloudinary(
+        latency_seconds=args.latency,
+        per_mb_seconds=args.per_mb,
+        jitter=args.jitter,
+        base_url=f"http://{args.host}:{args.port}",
+    )
+    uvicorn.run(fake.app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""
+Replicate falso para pruebas y benchmarks locales
+
+Implementa la parte de la API que usa el microservicio:
+
+- POST /v1/models/{owner}/{model}/predictions y POST /v1/predictions (crear)
+- GET  /v1/predictions/{id} (estado; cuenta las consultas)
+- POST /v1/predictions/{id}/cancel
+- GET  /files/{id}.png (salida de la predicción: PNG de 1x1)
+
+Cada predicción espera en cola ("starting") y luego corre ("processing") con
+latencias simuladas; si se creó con "webhook",
+al terminar se envía un webhook firmado igual que Replicate. Se respeta la
+cabecera "Prefer: wait=N" (espera síncrona hasta N segundos).
+
+Uso como servidor:
+    python benchmarks/fakes/fake_replicate.py --port 8010 --queue 0.5 --latency 4 \\
+        --webhook-secret whsec_ZmFrZS1zZWNyZXQ=
+    # y en el .env del agente: REPLICATE_API_BASE_URL=http://localhost:8010/v1
+
+Uso en proceso (benchmarks): FakeReplicate(...).app con httpx.ASGITransport.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import httpx
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response
+
+ROOT = Path(__file__).resolve().parent.parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+# Importar app.services no debe exigir GEMINI_API_KEY
+os.environ.setdefault("LLM_PROVIDER", "local")
+
+from app.services.replicate_predictions import sign_webhook  # noqa: E402
+
+# PNG transparente de 1x1
+PNG_1X1 = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+)
+
+
+class FakeReplicate:
+    """
+    Estado y aplicación ASGI del Replicate falso
+
+    Args:
+        latency_seconds: Duración media de una predicción (estado "processing")
+        queue_seconds: Espera media en cola antes de empezar (estado "starting")
+        jitter: Dispersión relativa uniforme de la latencia (0.2 = +/-20 %)
+        webhook_secret: Secreto "whsec_..." con el que se firman los webhooks
+        webhook_delay_seconds: Retraso de entrega del webhook tras terminar
+        drop_webhooks: Fracción de webhooks que no se envían (simula pérdidas)
+        failure_rate: Fracción de predicciones que terminan en "failed"
+        base_url: URL pública del falso (para las URLs de salida)
+        webhook_transport: Transporte httpx para entregar webhooks (p. ej. ASGITransport del agente)
+        seed: Semilla de latencias, pérdidas y fallos
+    """
+
+    def __init__(
+        self,
+        latency_seconds: float = 4.0,
+        queue_seconds: float = 0.0,
+        jitter: float = 0.2,
+        webhook_secret: Optional[str] = None,
+        webhook_delay_seconds: float = 0.0,
+        drop_webhooks: float = 0.0,
+        failure_rate: float = 0.0,
+        base_url: str = "http://fake-replicate",
+        webhook_transport: Optional[httpx.AsyncBaseTransport] = None,
+        seed: int = 0,
+    ):
+        self.latency_seconds = latency_seconds
+        self.queue_seconds = queue_seconds
+        self.jitter = jitter
+        self.webhook_secret = webhook_secret
+        self.webhook_delay_seconds = webhook_delay_seconds
+        self.drop_webhooks = drop_webhooks
+        self.failure_rate = failure_rate
+        self.base_url = base_url.rstrip("/")
+        self.webhook_transport = webhook_transport
+        self._random = random.Random(seed)
+
+        self.predictions: Dict[str, Dict[str, Any]] = {}
+        # Momento (time.monotonic) en que terminó cada predicción
+        self.completed_at: Dict[str, float] = {}
+        self.created = 0
+        self.polls = 0
+        self.canceled = 0
+        self.webhooks_sent = 0
+        self.webhooks_failed = 0
+        self._done: Dict[str, asyncio.Event] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.app = self._build_app()
+
+    def reset_counters(self) -> None:
+        self.created = self.polls = self.canceled = self.webhooks_sent = self.webhooks_failed = 0
+
+    def _latency(self, mean_seconds: float) -> float:
+        spread = mean_seconds * self.jitter
+        return max(0.0, mean_seconds + self._random.uniform(-spread, spread))
+
+    async def _create(self, request: Request, model: str, body: Dict[str, Any]) -> Response:
+        if not request.headers.get("authorization", "").startswith("Token "):
+            raise HTTPException(status_code=401, detail="Falta el token")
+
+        prediction_id = uuid.uuid4().hex[:20]
+        prediction = {
+            "id": prediction_id,
+            "model": model,
+            "version": body.get("version"),
+            "input": body.get("input") or {},
+            "status": "starting",
+            "output": None,
+            "error": None,
+            "webhook": body.get("webhook"),
+            "urls": {
+                "get": f"{self.base_url}/v1/predictions/{prediction_id}",
+                "cancel": f"{self.base_url}/v1/predictions/{prediction_id}/cancel",
+            },
+        }
+        self.created += 1
+        self.predictions[prediction_id] = prediction
+        self._done[prediction_id] = asyncio.Event()
+        self._tasks[prediction_id] = asyncio.create_task(
+            self._run(prediction_id, self._latency(self.queue_seconds), self._latency(self.latency_seconds))
+        )
+
+        prefer = request.headers.get("prefer", "")
+        if prefer.startswith("wait"):
+            _, _, seconds = prefer.partition("=")
+            wait = min(float(seconds or 60), 60.0)
+            try:
+                await asyncio.wait_for(self._done[prediction_id].wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+        return Response(json.dumps(self.predictions[prediction_id]), status_code=201, media_type="application/json")
+
+    async def _run(self, prediction_id: str, queued: float, latency: float) -> None:
+        prediction = self.predictions[prediction_id]
+        if queued:
+            await asyncio.sleep(queued)
+        prediction["status"] = "processing"
+        await asyncio.sleep(latency)
+        if prediction["status"] == "canceled":
+            return
+        if self._random.random() < self.failure_rate:
+            prediction.update(status="failed", error="Fallo simulado")
+        else:
+            prediction.update(status="succeeded", output=[f"{self.base_url}/files/{prediction_id}.png"])
+        self._finish(prediction_id)
+
+    def _finish(self, prediction_id: str) -> None:
+        self.completed_at[prediction_id] = time.monotonic()
+        self._done[prediction_id].set()
+        prediction = self.predictions[prediction_id]
+        if prediction.get("webhook") and self._random.random() >= self.drop_webhooks:
+            asyncio.create_task(self._send_webhook(prediction))
+
+    async def _send_webhook(self, prediction: Dict[str, Any]) -> None:
+        if self.webhook_delay_seconds:
+            await asyncio.sleep(self.webhook_delay_seconds)
+        body = json.dumps(prediction).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if self.webhook_secret:
+            headers.update(sign_webhook(body, self.webhook_secret, f"msg_{uuid.uuid4().hex[:16]}"))
+        try:
+            async with httpx.AsyncClient(transport=self.webhook_transport, timeout=10.0) as client:
+                response = await client.post(prediction["webhook"], content=body, headers=headers)
+            response.raise_for_status()
+            self.webhooks_sent += 1
+        except httpx.HTTPError:
+            self.webhooks_failed += 1
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI(title="Fake Replicate")
+
+        @app.post("/v1/models/{owner}/{name}/predictions", status_code=201)
+        async def create_model_prediction(owner: str, name: str, request: Request):
+            return await self._create(request, f"{owner}/{name}", await request.json())
+
+        @app.post("/v1/predictions", status_code=201)
+        async def create_prediction(request: Request):
+            body = await request.json()
+            return await self._create(request, body.get("version") or "", body)
+
+        @app.get("/v1/predictions/{prediction_id}")
+        async def get_prediction(prediction_id: str):
+            self.polls += 1
+            prediction = self.predictions.get(prediction_id)
+            if prediction is None:
+                raise HTTPException(status_code=404, detail="Not found")
+            return prediction
+
+        @app.post("/v1/predictions/{prediction_id}/cancel")
+        async def cancel_prediction(prediction_id: str):
+            prediction = self.predictions.get(prediction_id)
+            if prediction is None:
+                raise HTTPException(status_code=404, detail="Not found")
+            if prediction["status"] not in {"succeeded", "failed", "canceled"}:
+                self.canceled += 1
+                prediction["status"] = "canceled"
+                task = self._tasks.get(prediction_id)
+                if task:
+                    task.cancel()
+                self._finish(prediction_id)
+            return prediction
+
+        @app.get("/files/{name}")
+        async def get_file(name: str):
+            return Response(PNG_1X1, media_type="image/png")
+
+        return app
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Replicate falso local")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--latency", type=float, default=4.0, help="Duración media de una predicción (s)")
+    parser.add_argument("--queue", type=float, default=0.0, help="Espera media en cola antes de empezar (s)")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--webhook-secret", default=None)
+    parser.add_argument("--drop-webhooks", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    fake = FakeReplicate(
+        latency_seconds=args.latency,
+        queue_seconds=args.queue,
+        jitter=args.jitter,
+        webhook_secret=args.webhook_secret,
+        drop_webhooks=args.drop_webhooks,
+        failure_rate=args.failure_rate,
+        base_url=f"http://{args.host}:{args.port}",
+    )
+    uvicorn.run(fake.app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Servidores ASGI en segundo plano para benchmarks
+
+Cada aplicación (agente, Replicate falso, Cloudinary falso) corre con uvicorn
+en su propio hilo y event loop, escuchando en un puerto real de 127.0.0.1: el
+SDK de Cloudinary es síncrono y el cliente HTTP compartido del agente no admite
+transportes en proceso.
+"""
+import socket
+import threading
+import time
+from typing import Any, Optional
+
+import uvicorn
+
+
+def free_port() -> int:
+    """Puerto TCP libre de 127.0.0.1 (se elige antes de arrancar para poder configurarlo)."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class BackgroundServer:
+    """
+    Aplicación ASGI servida por uvicorn en un hilo
+
+    Uso:
+        with BackgroundServer(app, port) as server:
+            httpx.get(f"{server.url}/health")
+    """
+
+    def __init__(self, app: Any, port: Optional[int] = None, startup_timeout: float = 30.0):
+        self.port = port or free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.startup_timeout = startup_timeout
+        self._server = uvicorn.Server(
+            uvicorn.Config(
+                app,
+                host="127.0.0.1",
+                port=self.port,
+                log_level="warning",
+                access_log=False,
+                # Sin límite práctico: el benchmark mide al servicio, no a uvicorn
+                limit_concurrency=None,
+                backlog=4096,
+            )
+        )
+        self._thread = threading.Thread(target=self._server.run, name=f"uvicorn-{self.port}", daemon=True)
+
+    def start(self) -> "BackgroundServer":
+        self._thread.start()
+        deadline = time.monotonic() + self.startup_timeout
+        while not self._server.started:
+            if not self._thread.is_alive():
+                raise RuntimeError(f"El servidor del puerto {self.port} no arrancó")
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"El servidor del puerto {self.port} no arrancó a tiempo")
+            time.sleep(0.02)
+        return self
+
+    def stop(self) -> None:
+        self._server.should_exit = True
+        self._thread.join(timeout=self.startup_timeout)
+
+    def __enter__(self) -> "BackgroundServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
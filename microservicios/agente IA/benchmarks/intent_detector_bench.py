@@ -0,0 +1,120 @@
+"""
+Precisión y microbenchmark del detector de intenciones
+
+Uso (desde la carpeta del microservicio):
+    python benchmarks/intent_detector_bench.py [--iterations 20000]
+
+1. Compara IntentDetector con el corpus etiquetado benchmarks/intent_corpus.jsonl
+   (sale con código 1 si algún caso no coincide)
+2. Mide el tiempo por mensaje frente al escaneo anterior (una lista por intención
+   recorrida con `in`) sobre las mismas palabras clave
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+# El detector no llama al LLM; el proveedor local evita exigir GEMINI_API_KEY al importar la app
+os.environ.setdefault("LLM_PROVIDER", "local")
+
+from app.services.intent_detector import (  # noqa: E402
+    ASSISTANT_READY_KEYWORDS,
+    DEFAULT_GARMENT_TYPE,
+    FINAL_CONFIRMATION_KEYWORDS,
+    GARMENT_KEYWORDS,
+    GENERATION_KEYWORDS,
+    PLAIN_KEYWORDS,
+    SCOPE_BREAK_KEYWORDS,
+    SHOW_IMAGE_KEYWORDS,
+    TRYON_KEYWORDS,
+    IntentDetector,
+    MessageIntents,
+    _detect,
+)
+from app.utils.text_matcher import fold_text  # noqa: E402
+
+CORPUS_PATH = Path(__file__).resolve().parent / "intent_corpus.jsonl"
+FLAGS = ("tryon", "scope_break", "generation", "final_confirmation", "assistant_ready", "show_image", "plain")
+SCAN_TABLES = {
+    "tryon": TRYON_KEYWORDS,
+    "scope_break": SCOPE_BREAK_KEYWORDS,
+    "generation": GENERATION_KEYWORDS,
+    "final_confirmation": FINAL_CONFIRMATION_KEYWORDS,
+    "assistant_ready": ASSISTANT_READY_KEYWORDS,
+    "show_image": SHOW_IMAGE_KEYWORDS,
+    "plain": PLAIN_KEYWORDS,
+}
+
+
+def load_corpus():
+    with open(CORPUS_PATH, encoding="utf-8") as corpus_file:
+        return [json.loads(line) for line in corpus_file if line.strip()]
+
+
+def scan_baseline(text: str) -> MessageIntents:
+    """Algoritmo anterior: una pasada por lista de palabras clave."""
+    message = fold_text(text)
+    flags = {name: any(keyword in message for keyword in keywords) for name, keywords in SCAN_TABLES.items()}
+    garment_type = next(
+        (garment for garment, keywords in GARMENT_KEYWORDS.items() if any(k in message for k in keywords)),
+        DEFAULT_GARMENT_TYPE,
+    )
+    return MessageIntents(garment_type=garment_type, **flags)
+
+
+def check_accuracy(corpus) -> int:
+    failures = 0
+    for case in corpus:
+        intents = IntentDetector.detect(case["text"])
+        detected = sorted(flag for flag in FLAGS if getattr(intents, flag))
+        expected = sorted(case["intents"])
+        if detected != expected or intents.garment_type != case["garment_type"]:
+            failures += 1
+            print(
+                f"  FALLO {case['text']!r}: intenciones {detected} (esperado {expected}), "
+                f"prenda {intents.garment_type} (esperado {case['garment_type']})"
+            )
+        if scan_baseline(case["text"]) != intents:
+            failures += 1
+            print(f"  FALLO {case['text']!r}: el autómata difiere del escaneo por listas")
+
+    print(f"Precision: {len(corpus) - failures}/{len(corpus)} casos correctos")
+    return failures
+
+
+def bench(corpus, iterations: int) -> None:
+    texts = [case["text"] for case in corpus]
+    uncached_detect = _detect.__wrapped__
+
+    def per_message_us(function) -> float:
+        seconds = min(timeit.repeat(lambda: [function(text) for text in texts], number=max(1, iterations // len(texts)), repeat=5))
+        return seconds / (max(1, iterations // len(texts)) * len(texts)) * 1e6
+
+    results = {
+        "escaneo por listas": per_message_us(scan_baseline),
+        "automata (sin memo)": per_message_us(uncached_detect),
+        "IntentDetector.detect (memo)": per_message_us(IntentDetector.detect),
+    }
+    baseline = results["escaneo por listas"]
+    print(f"Microbenchmark ({len(texts)} mensajes, ~{iterations} detecciones por variante)")
+    for name, micros in results.items():
+        print(f"  {name:<30} {micros:8.2f} us/mensaje  ({baseline / micros:5.2f}x)")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    failures = check_accuracy(corpus)
+    bench(corpus, args.iterations)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
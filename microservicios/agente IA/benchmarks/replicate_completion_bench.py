@@ -0,0 +1,150 @@
+"""
+Latencia de detección de predicciones de Replicate: webhook frente a consulta de estado
+
+Uso (desde la carpeta del microservicio):
+    python benchmarks/replicate_completion_bench.py [--predictions 20] [--latency 4]
+        [--drop-webhooks 0.2] [--json resultados.json]
+
+Todo corre en proceso contra el Replicate falso (benchmarks/fakes): el agente
+consulta el falso por httpx.ASGITransport y el falso entrega los webhooks
+firmados a la ruta real POST /webhooks/replicate de la app.
+
+Modos:
+1. legacy: consulta fija cada 2 s (comportamiento anterior)
+2. backoff: solo consulta de estado con backoff exponencial
+3. webhook: webhook con la consulta de estado como respaldo
+
+Para cada modo mide el retraso entre que la predicción termina en el falso y
+que el agente lo detecta, y las consultas GET por predicción.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+WEBHOOK_SECRET = "whsec_" + base64.b64encode(b"benchmark-webhook-secret").decode("ascii")
+os.environ.setdefault("LLM_PROVIDER", "local")
+os.environ["REPLICATE_API_BASE_URL"] = "http://fake-replicate/v1"
+os.environ["REPLICATE_WEBHOOK_URL"] = "http://agent/webhooks/replicate"
+os.environ["REPLICATE_WEBHOOK_SECRET"] = WEBHOOK_SECRET
+
+import httpx  # noqa: E402
+
+from app.main import app as agent_app  # noqa: E402
+from app.services.replicate_predictions import (  # noqa: E402
+    TERMINAL_STATUSES,
+    prediction_url,
+    wait_for_prediction,
+    webhook_fields,
+)
+from fakes.fake_replicate import FakeReplicate  # noqa: E402
+
+TOKEN = "benchmark-token"
+MODES = ("legacy", "backoff", "webhook")
+
+
+async def legacy_wait(client: httpx.AsyncClient, prediction: dict, max_polls: int = 90) -> dict:
+    """Bucle anterior: una consulta cada 2 segundos."""
+    result = prediction
+    for _ in range(max_polls):
+        await asyncio.sleep(2)
+        response = await client.get(prediction_url(prediction["id"]), headers={"Authorization": f"Token {TOKEN}"})
+        result = response.json()
+        if result.get("status") in TERMINAL_STATUSES:
+            break
+    return result
+
+
+async def run_one(client: httpx.AsyncClient, fake: FakeReplicate, mode: str) -> float:
+    body = {"input": {"prompt": "camiseta azul"}}
+    if mode == "webhook":
+        body.update(webhook_fields())
+    response = await client.post(
+        f"{os.environ['REPLICATE_API_BASE_URL']}/models/fake/model/predictions",
+        headers={"Authorization": f"Token {TOKEN}"},
+        json=body,
+    )
+    prediction = response.json()
+
+    if mode == "legacy":
+        result = await legacy_wait(client, prediction)
+    else:
+        result = await wait_for_prediction(
+            prediction, token=TOKEN, max_wait_seconds=120, webhook_requested=(mode == "webhook"), client=client
+        )
+    detected_at = time.monotonic()
+    if result.get("status") not in TERMINAL_STATUSES:
+        raise RuntimeError(f"La predicción {prediction['id']} no terminó")
+    return detected_at - fake.completed_at[prediction["id"]]
+
+
+async def run_mode(mode: str, args: argparse.Namespace) -> dict:
+    fake = FakeReplicate(
+        latency_seconds=args.latency,
+        jitter=args.jitter,
+        webhook_secret=WEBHOOK_SECRET,
+        drop_webhooks=args.drop_webhooks,
+        webhook_transport=httpx.ASGITransport(app=agent_app),
+        seed=args.seed,
+    )
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=fake.app), timeout=30.0) as client:
+        async def bounded() -> float:
+            async with semaphore:
+                return await run_one(client, fake, mode)
+
+        lags = await asyncio.gather(*(bounded() for _ in range(args.predictions)))
+
+    lags_ms = sorted(lag * 1000 for lag in lags)
+    return {
+        "mode": mode,
+        "predictions": args.predictions,
+        "lag_ms_mean": round(statistics.fmean(lags_ms), 1),
+        "lag_ms_p50": round(lags_ms[len(lags_ms) // 2], 1),
+        "lag_ms_p95": round(lags_ms[min(len(lags_ms) - 1, int(len(lags_ms) * 0.95))], 1),
+        "lag_ms_max": round(lags_ms[-1], 1),
+        "polls_per_prediction": round(fake.polls / args.predictions, 2),
+        "webhooks_delivered": fake.webhooks_sent,
+    }
+
+
+async def main_async(args: argparse.Namespace) -> list:
+    return [await run_mode(mode, args) for mode in args.modes]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--predictions", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=4.0, help="Duración media de una predicción (s)")
+    parser.add_argument("--jitter", type=float, default=0.5)
+    parser.add_argument("--drop-webhooks", type=float, default=0.0, help="Fracción de webhooks perdidos")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--json", dest="json_path", default=None, help="Guarda los resultados en este archivo")
+    args = parser.parse_args()
+
+    results = asyncio.run(main_async(args))
+    print(f"{'modo':<8} {'media':>9} {'p50':>9} {'p95':>9} {'max':>9} {'GET/pred':>9} {'webhooks':>9}")
+    for row in results:
+        print(
+            f"{row['mode']:<8} {row['lag_ms_mean']:>7.0f}ms {row['lag_ms_p50']:>7.0f}ms "
+            f"{row['lag_ms_p95']:>7.0f}ms {row['lag_ms_max']:>7.0f}ms "
+            f"{row['polls_per_prediction']:>9} {row['webhooks_delivered']:>9}"
+        )
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()